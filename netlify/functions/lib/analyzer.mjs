@@ -1,6 +1,6 @@
 import {
   compareMostCharacters,
-  getDakggStats,
+  getDakggTierStats,
   tierForMmr,
 } from "./dakgg-stats.mjs";
 
@@ -535,6 +535,8 @@ const VISION_THRESHOLDS = {
   mithril_plus: [1, 0.9, 0.82, 0.74],
 };
 function tierAverage(tier, field) {
+  const precomputed = tier.metrics?.[field]?.mean;
+  if (Number.isFinite(precomputed)) return precomputed;
   let weightedSum = 0;
   let gameSum = 0;
   for (const baseline of Object.values(tier.characters)) {
@@ -983,7 +985,7 @@ export async function evaluatePlayer(nickname) {
     return buildNoRecentRankResult(nickname, baseMetrics);
   }
 
-  const dakggStats = await getDakggStats();
+  const dakggStats = await getDakggTierStats(tierForMmr(stats.mmr, stats.rank));
   const [score, comment, scoreBreakdown, dodgeProtected] = calculateScore(
     stats,
     recent,
@@ -1,9 +1,10 @@
-import { gunzipSync } from "node:zlib";
+import * as zlib from "node:zlib";
+import { createHash } from "node:crypto";
 import { readFile } from "node:fs/promises";
 import { fileURLToPath } from "node:url";
 
 const DEFAULT_URL =
-  "https://github.com/dejava-daisky/er-dodge/releases/download/dakgg-data/dakgg_stats.json.gz";
+  "https://github.com/dejava-daisky/er-dodge/releases/download/dakgg-data/dakgg_stats.bin.gz";
 const CACHE_TTL_MS = 6 * 60 * 60 * 1000;
 const REQUEST_TIMEOUT_MS = 8000;
 const FALLBACK_PATH = fileURLToPath(
@@ -11,24 +12,271 @@ const FALLBACK_PATH = fileURLToPath(
 );
 
 let cache = null;
+let cacheVersion = null;
 let cacheExpiresAt = 0;
 let pendingLoad = null;
+let shardState = null;
+const dictionaries = new Map();
 
-function parseArtifact(buffer) {
-  const parsed = JSON.parse(gunzipSync(buffer).toString("utf8"));
+const COLUMNAR_MAGIC = "ERDS";
+const COLUMNAR_HEADER_SIZE = 16;
+const COLUMNAR_SECTION_SIZE = 16;
+const COLUMNAR_META_STRINGS = ["source", "collectedAt", "matchingMode", "teamMode"];
+const COLUMNAR_META_NUMBERS = [
+  "schemaVersion",
+  "periodDays",
+  "currentPatch",
+  "previousPatch",
+  "sourceUpdatedAtMin",
+  "sourceUpdatedAtMax",
+];
+const COLUMNAR_ARRAYS = {
+  I: Uint32Array,
+  S: Uint32Array,
+  f: Float32Array,
+  d: Float64Array,
+  B: Uint8Array,
+};
+const NO_STRING = 0xffffffff;
+const TIER_METRICS_FLAG = 1;
+
+function roundTo(value, digits) {
+  return digits < 0 || value === 0 ? value : Number(value.toFixed(digits));
+}
+
+function nest(table, keys, entry) {
+  let target = table;
+  for (const key of keys.slice(0, -1)) target = target[String(key)] ||= {};
+  target[String(keys.at(-1))] = entry;
+}
+
+// Reads a row table nested by `keys`: a uint32 column per key and a typed
+// column per field, NaN or NO_STRING where an entry lacks the field.
+function decodeRows(sections, string, prefix, keys) {
+  const table = {};
+  const keyColumns = keys.map((key) => sections.get(`${prefix}.${key}`).values);
+  const columns = [];
+  for (const [name, column] of sections) {
+    const field = name.slice(prefix.length + 1);
+    if (name.startsWith(`${prefix}.`) && !keys.includes(field)) {
+      columns.push([field, column]);
+    }
+  }
+  for (let index = 0; index < keyColumns[0].length; index += 1) {
+    const entry = {};
+    for (const [field, column] of columns) {
+      const value = column.values[index];
+      if (column.code === "S") {
+        if (value !== NO_STRING) entry[field] = string(value);
+      } else if (!Number.isNaN(value)) {
+        entry[field] = roundTo(value, column.digits);
+      }
+    }
+    nest(table, keyColumns.map((column) => column[index]), entry);
+  }
+  return table;
+}
+
+// Decodes a lookup table on first read, so a cold start only pays for the
+// tables it uses. Assigning the property replaces the table.
+function defineLazy(target, key, decode) {
+  const define = (value) =>
+    Object.defineProperty(target, key, {
+      value,
+      writable: true,
+      enumerable: true,
+      configurable: true,
+    });
+  Object.defineProperty(target, key, {
+    enumerable: true,
+    configurable: true,
+    get: () => define(decode())[key],
+    set: define,
+  });
+}
+
+// Decodes the schemaVersion 2 columnar artifact written by
+// scripts/collect_dakgg_stats.py into the same object as the JSON artifact.
+export function parseColumnarArtifact(raw) {
+  const buffer = raw.buffer.slice(raw.byteOffset, raw.byteOffset + raw.byteLength);
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== COLUMNAR_MAGIC || view.getUint16(4, true) !== 2) {
+    throw new Error("Unsupported DAK.GG statistics artifact");
+  }
+  const sectionCount = view.getUint16(6, true);
+  const tierCount = view.getUint32(8, true);
+  const characterCount = view.getUint32(12, true);
+
+  const entries = [];
+  for (let index = 0; index < sectionCount; index += 1) {
+    const base = COLUMNAR_HEADER_SIZE + index * COLUMNAR_SECTION_SIZE;
+    const code = String.fromCharCode(view.getUint8(base + 4));
+    const ArrayType = COLUMNAR_ARRAYS[code];
+    entries.push({
+      name: view.getUint32(base, true),
+      code,
+      digits: view.getInt8(base + 5),
+      values: new ArrayType(
+        buffer,
+        view.getUint32(base + 8, true),
+        view.getUint32(base + 12, true),
+      ),
+    });
+  }
+
+  const offsets = entries[0].values;
+  const bytes = entries[1].values;
+  const decoder = new TextDecoder();
+  const strings = [];
+  for (let index = 0; index + 1 < offsets.length; index += 1) {
+    strings.push(decoder.decode(bytes.subarray(offsets[index], offsets[index + 1])));
+  }
+  const string = (ref) => (ref === NO_STRING ? null : strings[ref]);
+  const sections = new Map(entries.map((entry) => [strings[entry.name], entry]));
+  const values = (name) => sections.get(name).values;
+
+  const artifact = {};
+  COLUMNAR_META_STRINGS.forEach((key, index) => {
+    artifact[key] = string(values("metaStrings")[index]);
+  });
+  COLUMNAR_META_NUMBERS.forEach((key, index) => {
+    const value = values("metaNumbers")[index];
+    artifact[key] = Number.isNaN(value) ? null : value;
+  });
+  artifact.characters = {};
+  values("characterMetaIds").forEach((characterId, index) => {
+    artifact.characters[String(characterId)] = {
+      key: string(values("characterMeta.key")[index]),
+      name: string(values("characterMeta.name")[index]),
+      imageUrl: string(values("characterMeta.imageUrl")[index]),
+    };
+  });
+
+  const extras = sections.has("extras")
+    ? JSON.parse(decoder.decode(values("extras")))
+    : {};
+  Object.assign(artifact, extras.top || {});
+  const characterIds = values("characterIds");
+  const columns = [...sections.entries()]
+    .filter(([name]) => name.startsWith("column."))
+    .map(([name, entry]) => [name.slice("column.".length), entry]);
+  const games = values("column.games");
+
+  const tierFlags = sections.has("tierTables") ? values("tierTables") : [];
+  // One per-tier section per metric and statistic (mean, stddev, p50, ...).
+  const metricSections = [...sections.entries()]
+    .filter(([name]) => name.startsWith("metrics."))
+    .map(([name, section]) => [...name.split(".").slice(1), section]);
+  const tierMetrics = (tierIndex) => {
+    const metrics = {};
+    for (const [name, key, { values: column, digits }] of metricSections) {
+      if (Number.isNaN(column[tierIndex])) continue;
+      (metrics[name] ||= {})[key] = roundTo(column[tierIndex], digits);
+    }
+    return metrics;
+  };
+  if (sections.has("allTiers.characters.characterId")) {
+    defineLazy(artifact.allTiers, "characters", () =>
+      decodeRows(sections, string, "allTiers.characters", ["characterId"]),
+    );
+  }
+
+  artifact.tiers = {};
+  for (let tierIndex = 0; tierIndex < tierCount; tierIndex += 1) {
+    const tierKey = string(values("tierKeys")[tierIndex]);
+    const characters = {};
+    const base = tierIndex * characterCount;
+    characterIds.forEach((characterId, characterIndex) => {
+      if (!games[base + characterIndex]) return;
+      const entry = {};
+      for (const [name, column] of columns) {
+        entry[name] = roundTo(column.values[base + characterIndex], column.digits);
+      }
+      Object.assign(entry, extras.characters?.[tierKey]?.[String(characterId)]);
+      characters[String(characterId)] = entry;
+    });
+    artifact.tiers[tierKey] = {
+      label: string(values("tierLabels")[tierIndex]),
+      games: values("tierGames")[tierIndex],
+      updatedAt: values("tierUpdatedAt")[tierIndex],
+      characters,
+      ...extras.tiers?.[tierKey],
+    };
+    const tier = artifact.tiers[tierKey];
+    if (tierFlags[tierIndex] & TIER_METRICS_FLAG) {
+      tier.metrics = tierMetrics(tierIndex);
+    }
+  }
+  return artifact;
+}
+
+// Release files record their codec in the manifest or shard index; files
+// without one, like the bundled fallback, are gzip.
+function decompress(buffer, codec) {
+  switch (codec?.name ?? "gzip") {
+    case "gzip":
+      return zlib.gunzipSync(buffer);
+    case "zlib":
+      return zlib.inflateSync(
+        buffer,
+        codec.dictionaryData ? { dictionary: codec.dictionaryData } : {},
+      );
+    case "brotli":
+      return zlib.brotliDecompressSync(buffer);
+    case "zstd":
+      if (zlib.zstdDecompressSync) return zlib.zstdDecompressSync(buffer);
+      throw new Error("zstd is not supported by this Node.js version");
+    default:
+      throw new Error(`Unsupported DAK.GG statistics codec ${codec.name}`);
+  }
+}
+
+// Resolves a codec entry, downloading its preset dictionary once per content
+// hash; the collector keeps the dictionary between refreshes.
+async function loadCodec(codec, baseUrl) {
+  const entry = codec?.dictionary;
+  if (!entry) return codec;
+  if (!dictionaries.has(entry.contentHash)) {
+    const dictionary = download(new URL(entry.file, baseUrl)).then((data) => {
+      if (sha256(data) !== entry.contentHash) {
+        throw new Error(`DAK.GG statistics dictionary ${entry.file} is corrupt`);
+      }
+      return data;
+    });
+    dictionary.catch(() => dictionaries.delete(entry.contentHash));
+    dictionaries.set(entry.contentHash, dictionary);
+  }
+  return { ...codec, dictionaryData: await dictionaries.get(entry.contentHash) };
+}
+
+function sha256(data) {
+  return createHash("sha256").update(data).digest("hex");
+}
+
+// Returns { stats, contentHash }, the hash being that of the decompressed
+// file, which the manifest records for every release file.
+function parseArtifact(buffer, codec) {
+  const raw = decompress(buffer, codec);
+  const parsed =
+    raw.subarray(0, 4).toString("latin1") === COLUMNAR_MAGIC
+      ? parseColumnarArtifact(raw)
+      : JSON.parse(raw.toString("utf8"));
   if (parsed?.schemaVersion !== 1 || !parsed?.tiers) {
     throw new Error("Unsupported DAK.GG statistics artifact");
   }
-  return parsed;
+  return { stats: parsed, contentHash: sha256(raw) };
 }
 
-async function fetchReleaseArtifact() {
-  const baseUrl = process.env.DAKGG_STATS_URL || DEFAULT_URL;
-  const url = new URL(baseUrl);
-  url.searchParams.set("refresh", String(Math.floor(Date.now() / CACHE_TTL_MS)));
-  const response = await fetch(url, {
+async function download(url) {
+  const target = new URL(url);
+  target.searchParams.set(
+    "refresh",
+    String(Math.floor(Date.now() / CACHE_TTL_MS)),
+  );
+  const response = await fetch(target, {
     headers: {
-      accept: "application/gzip, application/octet-stream",
+      accept: "application/gzip, application/json, application/octet-stream",
       "user-agent": "ER-Dodge-Check/1.0",
     },
     cache: "no-store",
@@ -37,21 +285,128 @@ async function fetchReleaseArtifact() {
   if (!response.ok) {
     throw new Error(`DAK.GG statistics download failed: ${response.status}`);
   }
-  return parseArtifact(Buffer.from(await response.arrayBuffer()));
+  return Buffer.from(await response.arrayBuffer());
+}
+
+function replaceFields(target, fields, removed) {
+  for (const key of removed) delete target[key];
+  Object.assign(target, fields);
+}
+
+// The tables a delta replaces one entry at a time, as in the collector.
+const TIER_DELTA_TABLES = ["characters", "metrics"];
+const ALL_TIERS_DELTA_TABLES = ["characters"];
+
+function applyTableDelta(target, delta, tables) {
+  replaceFields(target, delta.set, delta.remove);
+  for (const key of tables) {
+    if (!delta[key]) continue;
+    const removed = `remove${key[0].toUpperCase()}${key.slice(1)}`;
+    replaceFields(target[key], delta[key], delta[removed]);
+  }
+}
+
+// Applies a delta written by scripts/collect_dakgg_stats.py. The caller
+// checks the delta's base and target hashes against the manifest; the
+// collectedAt values also guard against applying it to a different base.
+export function applyArtifactDelta(base, delta) {
+  if (delta?.kind !== "dakgg-stats-delta" || delta.schemaVersion !== 2) {
+    throw new Error("Unsupported DAK.GG statistics delta");
+  }
+  if (base.collectedAt !== delta.baseCollectedAt) {
+    throw new Error("DAK.GG statistics delta does not apply to this version");
+  }
+  const target = structuredClone(base);
+  replaceFields(target, delta.set, delta.remove);
+  if (delta.allTiers) {
+    applyTableDelta(target.allTiers, delta.allTiers, ALL_TIERS_DELTA_TABLES);
+  }
+  for (const tierKey of delta.removeTiers) delete target.tiers[tierKey];
+  for (const [tierKey, tierDelta] of Object.entries(delta.tiers)) {
+    applyTableDelta((target.tiers[tierKey] ||= {}), tierDelta, TIER_DELTA_TABLES);
+  }
+  if (target.collectedAt !== delta.targetCollectedAt) {
+    throw new Error("DAK.GG statistics delta produced an unexpected version");
+  }
+  return target;
+}
+
+async function fetchManifest(statsUrl) {
+  const manifestUrl = new URL(
+    process.env.DAKGG_STATS_MANIFEST_URL || "dakgg_stats.manifest.json",
+    statsUrl,
+  );
+  try {
+    const manifest = JSON.parse((await download(manifestUrl)).toString("utf8"));
+    return manifest?.schemaVersion === 1 ? { manifest, manifestUrl } : null;
+  } catch {
+    return null;
+  }
+}
+
+// Downloads the delta described by the manifest and checks it against the
+// hashes recorded there, as apply_artifact_delta does in the collector.
+async function fetchDelta(manifest, manifestUrl) {
+  const entry = manifest.delta;
+  const codec = await loadCodec(entry.codec, manifestUrl);
+  const raw = decompress(await download(new URL(entry.file, manifestUrl)), codec);
+  if (sha256(raw) !== entry.contentHash) {
+    throw new Error("DAK.GG statistics delta is corrupt");
+  }
+  const delta = JSON.parse(raw.toString("utf8"));
+  if (delta.baseHash !== entry.base || delta.targetHash !== entry.target) {
+    throw new Error("DAK.GG statistics delta does not match the manifest");
+  }
+  return delta;
+}
+
+// Returns { stats, version }. The version is the manifest's only when the
+// downloaded file hashes to its manifest entry. With a manifest, an instance
+// that already holds the previous version downloads only the delta, and one
+// that holds the current version downloads nothing else; a delta that does
+// not match the manifest falls back to the full artifact.
+async function fetchReleaseArtifact(previous) {
+  const statsUrl = new URL(process.env.DAKGG_STATS_URL || DEFAULT_URL);
+  const { manifest, manifestUrl } = (await fetchManifest(statsUrl)) || {};
+  if (manifest && previous?.version) {
+    if (manifest.version === previous.version) return previous;
+    if (
+      manifest.delta?.base === previous.version &&
+      manifest.delta.target === manifest.version
+    ) {
+      try {
+        const delta = await fetchDelta(manifest, manifestUrl);
+        return {
+          stats: applyArtifactDelta(previous.stats, delta),
+          version: manifest.version,
+        };
+      } catch (error) {
+        console.warn("DAK.GG statistics delta failed:", error.message);
+      }
+    }
+  }
+  const name = statsUrl.pathname.split("/").pop();
+  const entry = [manifest?.full, manifest?.columnar].find(
+    (candidate) => candidate?.file === name,
+  );
+  const codec = await loadCodec(entry?.codec, manifestUrl);
+  const { stats, contentHash } = parseArtifact(await download(statsUrl), codec);
+  const version = entry && entry.contentHash === contentHash ? manifest.version : null;
+  return { stats, version };
 }
 
 async function readBundledArtifact() {
   return parseArtifact(
     await readFile(process.env.DAKGG_STATS_FILE || FALLBACK_PATH),
-  );
+  ).stats;
 }
 
-async function loadStats() {
+async function loadStats(previous) {
   try {
-    return await fetchReleaseArtifact();
+    return await fetchReleaseArtifact(previous);
   } catch (error) {
     console.warn("Using bundled DAK.GG statistics fallback:", error.message);
-    return readBundledArtifact();
+    return { stats: await readBundledArtifact(), version: null };
   }
 }
 
@@ -59,9 +414,11 @@ export async function getDakggStats() {
   const now = Date.now();
   if (cache && now < cacheExpiresAt) return cache;
   if (!pendingLoad) {
-    pendingLoad = loadStats()
-      .then((stats) => {
+    const previous = cache ? { stats: cache, version: cacheVersion } : null;
+    pendingLoad = loadStats(previous)
+      .then(({ stats, version }) => {
         cache = stats;
+        cacheVersion = version;
         cacheExpiresAt = Date.now() + CACHE_TTL_MS;
         return stats;
       })
@@ -74,8 +431,89 @@ export async function getDakggStats() {
 
 export function resetDakggStatsCache() {
   cache = null;
+  cacheVersion = null;
   cacheExpiresAt = 0;
   pendingLoad = null;
+  shardState = null;
+}
+
+async function fetchShard(entry, indexUrl) {
+  const codec = await loadCodec(entry.codec, indexUrl);
+  const raw = decompress(await download(new URL(entry.file, indexUrl)), codec);
+  if (sha256(raw) !== entry.contentHash) {
+    throw new Error(`DAK.GG statistics shard ${entry.file} is out of date`);
+  }
+  return JSON.parse(raw.toString("utf8"));
+}
+
+// The shard index and the character metadata shard are cached like the full
+// artifact; tier shards are fetched on first use. When the index reports a
+// new version, shards whose content hash did not change are kept. A
+// failed index load is also kept for the TTL so requests fall back to the
+// full artifact without retrying every time.
+function loadShards() {
+  if (shardState && Date.now() < shardState.expiresAt) return shardState.ready;
+  const previous = shardState;
+  const state = { expiresAt: Date.now() + CACHE_TTL_MS };
+  state.ready = (async () => {
+    const indexUrl = new URL(
+      process.env.DAKGG_STATS_SHARDS_URL || "dakgg_stats.shards.json",
+      new URL(process.env.DAKGG_STATS_URL || DEFAULT_URL),
+    );
+    const index = JSON.parse((await download(indexUrl)).toString("utf8"));
+    if (index?.kind !== "dakgg-stats-shards" || index.schemaVersion !== 2) {
+      throw new Error("Unsupported DAK.GG statistics shard index");
+    }
+    const loaded = await previous?.ready.catch(() => null);
+    if (loaded?.version === index.version) return loaded;
+    const characters =
+      loaded?.index.characters.contentHash === index.characters.contentHash
+        ? loaded.characters
+        : await fetchShard(index.characters, indexUrl);
+    const tiers = new Map();
+    for (const [tierKey, tier] of loaded?.tiers || []) {
+      const hash = loaded.index.tiers[tierKey].contentHash;
+      if (index.tiers[tierKey]?.contentHash === hash) tiers.set(tierKey, tier);
+    }
+    return {
+      version: index.version,
+      index,
+      indexUrl,
+      characters,
+      stats: {
+        ...index.artifact,
+        characters: characters.characters,
+        ...(characters.allTiers && { allTiers: characters.allTiers }),
+      },
+      tiers,
+    };
+  })();
+  state.ready.catch(() => {});
+  shardState = state;
+  return state.ready;
+}
+
+// Returns the statistics artifact with only `tierKey` in `tiers`, fetching
+// just that tier's shard. Falls back to the full artifact when it is already
+// cached or the shards are unavailable.
+export async function getDakggTierStats(tierKey) {
+  if (cache && Date.now() < cacheExpiresAt) return cache;
+  try {
+    const shards = await loadShards();
+    const entry = shards.index.tiers[tierKey];
+    if (!entry) return { ...shards.stats, tiers: {} };
+    if (!shards.tiers.has(tierKey)) {
+      const tier = fetchShard(entry, shards.indexUrl).then(
+        (shard) => shard.tier,
+      );
+      tier.catch(() => shards.tiers.delete(tierKey));
+      shards.tiers.set(tierKey, tier);
+    }
+    return { ...shards.stats, tiers: { [tierKey]: await shards.tiers.get(tierKey) } };
+  } catch (error) {
+    console.warn("DAK.GG statistics shards are unavailable:", error.message);
+    return getDakggStats();
+  }
 }
 
 export function tierForMmr(mmr, rank = null) {
@@ -99,6 +537,72 @@ export function tierForMmr(mmr, rank = null) {
   return "mithril_plus";
 }
 
+const COMPARED_METRICS = ["winRate", "top3Rate", "averagePlacement", "averageDamage"];
+
+// The sorted values of a metric over a tier's characters, computed once per
+// loaded tier.
+const sortedTierValues = new WeakMap();
+
+function tierValues(tier, metric) {
+  let sorted = sortedTierValues.get(tier);
+  if (!sorted) sortedTierValues.set(tier, (sorted = new Map()));
+  if (!sorted.has(metric)) {
+    const values = Object.values(tier.characters)
+      .map((entry) => entry[metric])
+      .filter(Number.isFinite);
+    sorted.set(metric, Float64Array.from(values).sort());
+  }
+  return sorted.get(metric);
+}
+
+// The number of sorted `values` below `value`, or not above it when
+// `inclusive`.
+function countBelow(values, value, inclusive) {
+  let low = 0;
+  let high = values.length;
+  while (low < high) {
+    const middle = (low + high) >> 1;
+    if (values[middle] < value || (inclusive && values[middle] === value)) {
+      low = middle + 1;
+    } else {
+      high = middle;
+    }
+  }
+  return low;
+}
+
+// A character's standing in its tier for the compared metrics: "percentiles"
+// is the share of the tier's characters below it, ties counted as half, and
+// "zScores" its distance from the tier mean in standard deviations. Both are
+// derived from the tier's characters and metric summaries; artifacts written
+// before the summaries existed give null.
+function tierStanding(tier, characterId, table) {
+  if (!tier.metrics) return null;
+  const entry = tier.characters[String(characterId)];
+  return Object.fromEntries(
+    COMPARED_METRICS.map((metric) => {
+      const summary = tier.metrics[metric];
+      const value = entry?.[metric];
+      if (!summary || !Number.isFinite(value)) return [metric, null];
+      if (table === "zScores") {
+        const { mean, stddev } = summary;
+        return [metric, stddev ? roundTo((value - mean) / stddev, 2) : 0];
+      }
+      const values = tierValues(tier, metric);
+      const below = countBelow(values, value, false);
+      const ties = countBelow(values, value, true) - below;
+      return [metric, roundTo((below + ties / 2) / values.length, 3)];
+    }),
+  );
+}
+
+// The Wilson interval of a baseline rate, when the artifact has one.
+function rateInterval(baseline, field) {
+  const low = baseline[`${field}Low`];
+  const high = baseline[`${field}High`];
+  return low == null || high == null ? null : [low, high];
+}
+
 export function compareMostCharacters(stats, recentGames, dakggStats, limit = 5) {
   const tierKey = tierForMmr(stats.mmr, stats.rank);
   const tier = dakggStats.tiers[tierKey];
@@ -161,6 +665,14 @@ export function compareMostCharacters(stats, recentGames, dakggStats, limit = 5)
           averageDamage === null
             ? null
             : averageDamage - baseline.averageDamage,
+        baselineWinRateShrunk: baseline.winRateShrunk ?? null,
+        baselineWinRateInterval: rateInterval(baseline, "winRate"),
+        baselineTop3RateShrunk: baseline.top3RateShrunk ?? null,
+        baselineTop3RateInterval: rateInterval(baseline, "top3Rate"),
+        baselinePercentiles: tierStanding(tier, characterId, "percentiles"),
+        baselineZScores: tierStanding(tier, characterId, "zScores"),
+        allTiersBaseline:
+          dakggStats.allTiers?.characters?.[String(characterId)] || null,
       };
     })
     .filter(Boolean);
@@ -177,6 +689,9 @@ export function compareMostCharacters(stats, recentGames, dakggStats, limit = 5)
 
 export function resetDakggStatsCacheForTests() {
   cache = null;
+  cacheVersion = null;
   cacheExpiresAt = 0;
   pendingLoad = null;
+  shardState = null;
+  dictionaries.clear();
 }
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""Benchmark the DAK.GG collector against deterministic synthetic payloads.
+
+Each collector phase is timed separately. Results can be saved as JSON
+(``--output``) and compared with a stored run (``--baseline``); the script
+exits with status 1 when a phase is slower than the baseline by more than
+``--threshold``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import closing, redirect_stdout
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import collect_dakgg_stats as collector
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tiers", type=int, default=len(collector.TIERS))
+    parser.add_argument("--characters", type=int, default=90)
+    parser.add_argument("--weapons", type=int, default=4)
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=1,
+        help="copies of the tier set, standing in for extra dimensions such "
+        "as matching or team modes",
+    )
+    parser.add_argument(
+        "--aggregation-engine",
+        choices=collector.AGGREGATION_ENGINES,
+        default=collector.DEFAULT_AGGREGATION_ENGINE,
+        help="tier_rows engine used by every phase",
+    )
+    parser.add_argument(
+        "--build-backend",
+        choices=collector.BUILD_BACKENDS,
+        default="file",
+        help="StagingDatabase backend used by build_database",
+    )
+    parser.add_argument(
+        "--verify",
+        choices=collector.VERIFY_MODES,
+        default="full",
+        help="database check used by build_database",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--phase",
+        action="append",
+        choices=PHASES,
+        help="phase to run; repeat for several (default: all)",
+    )
+    parser.add_argument(
+        "--compare-legacy",
+        action="store_true",
+        help="also compare the batched insert path with the row-at-a-time one",
+    )
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown against --baseline as a fraction (default 0.2)",
+    )
+    return parser.parse_args()
+
+
+DIMENSION_KEY = collector.DEFAULT_DIMENSION.key
+BUILD_OPTIONS = {"backend": "file", "verify": "full"}
+
+
+def synthetic_tiers(count, dimensions=1):
+    tiers = list(collector.TIERS[:count])
+    for index in range(len(tiers), count):
+        tiers.append((f"synthetic_{index}", f"Synthetic {index}"))
+    return [
+        (tier_key, tier_label)
+        if dimension == 0
+        else (f"{tier_key}_d{dimension}", f"{tier_label} ({dimension})")
+        for dimension in range(dimensions)
+        for tier_key, tier_label in tiers
+    ]
+
+
+def synthetic_characters(characters):
+    return {
+        str(character_id): {
+            "key": f"Character{character_id}",
+            "name": f"Character {character_id}",
+            "imageUrl": "",
+        }
+        for character_id in range(1, characters + 1)
+    }
+
+
+def synthetic_payload(tier_key, characters, weapons, seed, period_days=7):
+    """Return a DAK.GG ``character-stats`` response with the same shape and
+    value ranges as the real API. The same arguments give the same payload."""
+    rng = random.Random(f"{seed}:{tier_key}")
+    character_stats = []
+    for character_id in range(1, characters + 1):
+        weapon_stats = []
+        for weapon_index in range(weapons):
+            count = rng.randint(1, 40000)
+            weapon_stats.append(
+                {
+                    "key": 100 + weapon_index,
+                    "count": count,
+                    "win": rng.randint(0, count // 5),
+                    "top3": rng.randint(0, count // 2),
+                    "place": count * rng.randint(3, 6),
+                    "damageToPlayer": count * rng.randint(8000, 25000),
+                    "damageToMonster": count * rng.randint(10000, 40000),
+                    "mmrGain": count * rng.randint(-20, 40),
+                    "teamKill": count * rng.randint(2, 8),
+                    "playerKill": count * rng.randint(1, 4),
+                    "playerAssistant": count * rng.randint(1, 6),
+                    "monsterKill": count * rng.randint(20, 60),
+                    "playerDeaths": count * rng.randint(1, 2),
+                    "viewContribution": count * rng.randint(10, 50),
+                    "rank": {
+                        "size": characters * weapons,
+                        "count": rng.randint(1, characters * weapons),
+                        "win": rng.randint(1, characters * weapons),
+                        "top3": rng.randint(1, characters * weapons),
+                        "place": rng.randint(1, characters * weapons),
+                        "damageToPlayer": rng.randint(1, characters * weapons),
+                    },
+                    "tier": rng.choice(("OP", "1", "2", "3", "4", "5")),
+                    "tierScore": round(rng.uniform(0, 10), 4),
+                }
+            )
+        character_stats.append({"key": character_id, "weaponStats": weapon_stats})
+    return {
+        "meta": {"tier": tier_key, "dt": period_days, "updatedAt": 1_700_000_000_000},
+        "patches": [10040, 10030],
+        "characterStatSnapshot": {
+            "tierCount": rng.randint(10_000, 2_000_000),
+            "characterStats": character_stats,
+        },
+    }
+
+
+def legacy_insert_snapshot(conn, tier_key, tier_label, payload):
+    """The original row-at-a-time insert path, kept as the baseline.
+
+    The rate estimates need every row of the tier, so rows are aggregated one
+    at a time, given their estimates, and then inserted one at a time.
+    """
+    meta = payload["meta"]
+    snapshot = payload["characterStatSnapshot"]
+    conn.execute(
+        """
+        INSERT INTO tier_snapshots (
+            dimension_key, tier_key, tier_label, game_count, source_updated_at
+        ) VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            DIMENSION_KEY,
+            tier_key,
+            tier_label,
+            collector.require_int(snapshot["tierCount"], "tierCount"),
+            collector.require_int(meta["updatedAt"], "meta.updatedAt"),
+        ),
+    )
+    character_rows = []
+    weapon_rows = []
+    for character in snapshot["characterStats"]:
+        character_id = collector.require_int(character["key"], "character.key")
+        aggregate = collector.aggregate_character(character)
+        character_rows.append(
+            (
+                DIMENSION_KEY,
+                tier_key,
+                character_id,
+                *collector.normalized_row(aggregate),
+            )
+        )
+        for weapon in character["weaponStats"]:
+            if collector.require_int(weapon.get("count"), "weapon.count") <= 0:
+                continue
+            rank = weapon.get("rank") or {}
+            weapon_rows.append(
+                (
+                    DIMENSION_KEY,
+                    tier_key,
+                    character_id,
+                    collector.require_int(weapon["key"], "weapon.key"),
+                    *collector.normalized_row(weapon),
+                    rank.get("size"),
+                    rank.get("count"),
+                    rank.get("win"),
+                    rank.get("top3"),
+                    rank.get("place"),
+                    rank.get("damageToPlayer"),
+                    weapon.get("tier"),
+                    weapon.get("tierScore"),
+                )
+            )
+    for row in collector.with_rate_estimates(character_rows, 3):
+        conn.execute(
+            """
+            INSERT INTO character_stats VALUES (
+                ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?
+            )
+            """,
+            row,
+        )
+    for row in collector.with_rate_estimates(weapon_rows, 4):
+        conn.execute(
+            """
+            INSERT INTO weapon_stats VALUES (
+                ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?
+            )
+            """,
+            row,
+        )
+
+
+def load_legacy(db_path, payloads):
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.executescript(collector.SCHEMA)
+        for statement in collector.INDEXES:
+            conn.execute(statement)
+        with conn:
+            for tier_key, tier_label, payload in payloads:
+                legacy_insert_snapshot(conn, tier_key, tier_label, payload)
+
+
+def load_batched(db_path, payloads):
+    with closing(sqlite3.connect(db_path)) as conn:
+        collector.apply_build_pragmas(conn, collector.DEFAULT_BUILD_PRAGMAS)
+        conn.executescript(collector.SCHEMA)
+        with conn:
+            for tier_label, record in decode_payloads(payloads):
+                collector.insert_snapshot(conn, DIMENSION_KEY, tier_label, record)
+            for statement in collector.INDEXES:
+                conn.execute(statement)
+
+
+def count_rows(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        return sum(
+            conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("character_stats", "weapon_stats")
+        )
+
+
+def bench_inserts(payloads, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, load in (("legacy", load_legacy), ("batched", load_batched)):
+            timings = []
+            for index in range(repeat):
+                db_path = Path(directory) / f"{name}-{index}.sqlite3"
+                started = time.perf_counter()
+                load(db_path, payloads)
+                timings.append(time.perf_counter() - started)
+            rows = count_rows(db_path)
+            median = statistics.median(timings)
+            results[name] = {
+                "rows": rows,
+                "seconds": median,
+                "rowsPerSecond": rows / median,
+            }
+    return results
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def decode_payloads(payloads):
+    return [
+        (tier_label, collector.decode_tier(payload, tier_key))
+        for tier_key, tier_label, payload in payloads
+    ]
+
+
+def run_validate(payloads, records, directory):
+    decode_payloads(payloads)
+
+
+def run_aggregate(payloads, records, directory):
+    for _, record in records:
+        collector.tier_rows((DIMENSION_KEY, record.tier_key), record)
+
+
+def run_insert(payloads, records, directory):
+    with closing(sqlite3.connect(":memory:")) as conn:
+        conn.executescript(collector.SCHEMA)
+        with conn:
+            for tier_label, record in records:
+                collector.insert_snapshot(conn, DIMENSION_KEY, tier_label, record)
+
+
+def run_build_database(payloads, records, directory):
+    db_path = directory / "build.sqlite3"
+    db_path.unlink(missing_ok=True)
+    collector.build_database(
+        db_path, payloads, 7, incremental=False, **BUILD_OPTIONS
+    )
+
+
+def release_files(payloads, directory, manifest_path=None):
+    characters = len(payloads[0][2]["characterStatSnapshot"]["characterStats"])
+    return collector.build_release_artifact(
+        directory / "release.sqlite3",
+        directory / "dakgg_stats.json.gz",
+        synthetic_characters(characters),
+        columnar_path=directory / "dakgg_stats.bin.gz",
+        manifest_path=manifest_path,
+    )
+
+
+def run_build_release_artifact(payloads, records, directory):
+    # Without a manifest every repeat encodes the files again.
+    return release_files(payloads, directory)
+
+
+def run_release_unchanged(payloads, records, directory):
+    return release_files(payloads, directory, directory / "dakgg_stats.manifest.json")
+
+
+def prepare_release(payloads, records, directory):
+    """Build the database the release phases export and write the manifest
+    that ``release_unchanged`` finds current; neither is part of their time."""
+    run_build_database(payloads, records, directory)
+    (directory / "build.sqlite3").rename(directory / "release.sqlite3")
+    run_release_unchanged(payloads, records, directory)
+
+
+PHASES = {
+    "validate": run_validate,
+    "aggregate": run_aggregate,
+    "insert": run_insert,
+    "build_database": run_build_database,
+    "build_release_artifact": run_build_release_artifact,
+    "release_unchanged": run_release_unchanged,
+}
+
+
+def bench_phases(payloads, phases, repeat):
+    """Time each phase ``repeat`` times and return its median and throughput.
+
+    Throughput is counted in weapon rows, the unit every phase iterates over.
+    ``validate`` decodes the payloads into records, and ``aggregate`` and
+    ``insert`` start from records decoded before they are timed.
+    ``build_release_artifact`` encodes every release file on each repeat, and
+    ``release_unchanged`` times the check that skips them when the manifest
+    is current.
+    """
+    rows = sum(
+        len(character["weaponStats"])
+        for _, _, payload in payloads
+        for character in payload["characterStatSnapshot"]["characterStats"]
+    )
+    records = decode_payloads(payloads)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if {"build_release_artifact", "release_unchanged"} & set(phases):
+            with redirect_stdout(io.StringIO()):
+                prepare_release(payloads, records, Path(directory))
+        for phase in phases:
+            run = PHASES[phase]
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    run(payloads, records, Path(directory))
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings)
+            results[phase] = {
+                "seconds": median,
+                "minSeconds": min(timings),
+                "rows": rows,
+                "rowsPerSecond": rows / median,
+                "peakRssBytes": peak_rss_bytes(),
+            }
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Print the change of every phase against ``baseline`` and return the
+    phases that are slower than the threshold allows."""
+    def workload(config):
+        return {key: value for key, value in config.items() if key != "repeat"}
+
+    if workload(baseline.get("config", {})) != workload(results["config"]):
+        print("warning: the baseline was run with a different workload")
+    regressions = []
+    for phase, result in results["phases"].items():
+        previous = baseline.get("phases", {}).get(phase)
+        if not previous:
+            continue
+        # Throughput rather than seconds, so different workloads stay comparable.
+        change = previous["rowsPerSecond"] / result["rowsPerSecond"] - 1
+        regressed = change > threshold
+        print(
+            f"{phase:>22}: {change:+.1%} time per row against the baseline"
+            + (" (regression)" if regressed else "")
+        )
+        if regressed:
+            regressions.append(phase)
+    return regressions
+
+
+def main():
+    args = parse_args()
+    collector.DEFAULT_AGGREGATION_ENGINE = args.aggregation_engine
+    BUILD_OPTIONS.update(backend=args.build_backend, verify=args.verify)
+    payloads = [
+        (
+            tier_key,
+            tier_label,
+            synthetic_payload(tier_key, args.characters, args.weapons, args.seed),
+        )
+        for tier_key, tier_label in synthetic_tiers(args.tiers, args.dimensions)
+    ]
+    results = {
+        "schemaVersion": 1,
+        "config": {
+            "tiers": args.tiers,
+            "characters": args.characters,
+            "weapons": args.weapons,
+            "dimensions": args.dimensions,
+            "aggregationEngine": args.aggregation_engine,
+            "buildBackend": args.build_backend,
+            "verify": args.verify,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "phases": bench_phases(payloads, args.phase or PHASES, args.repeat),
+    }
+    for phase, result in results["phases"].items():
+        rss = result["peakRssBytes"]
+        print(
+            f"{phase:>22}: {result['seconds'] * 1000:.1f} ms"
+            f" ({result['rowsPerSecond']:,.0f} rows/s"
+            + (f", peak RSS {rss / 2**20:.1f} MiB)" if rss else ")")
+        )
+
+    if args.compare_legacy:
+        inserts = bench_inserts(payloads, args.repeat)
+        for name, result in inserts.items():
+            print(
+                f"{name:>8}: {result['rows']:,} rows in"
+                f" {result['seconds'] * 1000:.1f} ms"
+                f" ({result['rowsPerSecond']:,.0f} rows/s)"
+            )
+        speedup = inserts["legacy"]["seconds"] / inserts["batched"]["seconds"]
+        print(f"speedup: {speedup:.2f}x")
+        results["inserts"] = inserts
+
+    if args.output:
+        args.output.write_text(
+            json.dumps(results, indent=2, sort_keys=True) + "\n", encoding="utf-8"
+        )
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(
+                f"slower than the baseline by more than {args.threshold:.0%}: "
+                + ", ".join(regressions)
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Compare release codecs on a real DAK.GG statistics artifact.
+
+For the JSON, columnar and shard forms of the artifact, every codec is timed
+compressing and decompressing the same bytes, and its compressed size is
+reported next to gzip at level 9, the collector's default. Results can be
+saved as JSON with ``--output``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+
+import collect_dakgg_stats as collector
+
+FORMS = ("json", "columnar", "shards")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--artifact",
+        type=Path,
+        default=collector.DEFAULT_ARTIFACT_PATH,
+        help="JSON artifact to measure (default: the bundled one)",
+    )
+    parser.add_argument(
+        "--previous",
+        type=Path,
+        action="append",
+        help="earlier JSON artifact to build the zlib dictionary from; repeat "
+        "for several (default: the measured artifact, which flatters it)",
+    )
+    parser.add_argument(
+        "--codec",
+        action="append",
+        help="NAME[:LEVEL] to measure; repeat for several "
+        "(default: a range of levels of every available codec)",
+    )
+    parser.add_argument(
+        "--form",
+        action="append",
+        choices=FORMS,
+        help="artifact form to measure; repeat for several (default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    return parser.parse_args()
+
+
+def default_codecs():
+    specs = ["gzip:1", "gzip:6", "gzip:9", "zlib:9", "zlib:9+dictionary"]
+    available = collector.available_codecs()
+    if "zstd" in available:
+        specs += ["zstd:3", "zstd:19"]
+    if "brotli" in available:
+        specs += ["brotli:5", "brotli:11"]
+    return specs
+
+
+def artifact_forms(artifact):
+    """``{form: [encoded bytes]}``; shards are compressed one by one, like the
+    collector writes them."""
+    _, characters, tiers, weapons = collector.artifact_shards(artifact)
+    return {
+        "json": [collector.encode_artifact(artifact)],
+        "columnar": [collector.encode_columnar_artifact(artifact)],
+        "shards": [
+            collector.encode_artifact(shard)
+            for shard in (characters, *tiers.values(), weapons)
+            if shard is not None
+        ],
+    }
+
+
+def measure(files, codec, dictionary, repeat):
+    """Median compression and decompression time of ``files`` and their total
+    compressed size."""
+    compress_times = []
+    decompress_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compressed = [collector.compress(data, codec, dictionary) for data in files]
+        compress_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        for data in compressed:
+            collector.decompress(data, codec.name, dictionary)
+        decompress_times.append(time.perf_counter() - started)
+    return {
+        "bytes": sum(map(len, compressed)),
+        "rawBytes": sum(map(len, files)),
+        "compressSeconds": statistics.median(compress_times),
+        "decompressSeconds": statistics.median(decompress_times),
+    }
+
+
+def bench_codecs(forms, specs, dictionary, repeat):
+    results = {}
+    for form, files in forms.items():
+        results[form] = {}
+        for spec in specs:
+            name, _, option = spec.partition("+")
+            codec = collector.parse_codec(name)
+            results[form][spec] = measure(
+                files, codec, dictionary if option else None, repeat
+            )
+    return results
+
+
+def main():
+    args = parse_args()
+    artifact = collector.read_artifact(args.artifact)
+    if artifact is None:
+        raise SystemExit(f"{args.artifact} is not a readable JSON artifact")
+    forms = {
+        form: files
+        for form, files in artifact_forms(artifact).items()
+        if form in (args.form or FORMS)
+    }
+    samples = []
+    for path in args.previous or [args.artifact]:
+        previous = collector.read_artifact(path)
+        if previous is None:
+            raise SystemExit(f"{path} is not a readable JSON artifact")
+        samples.append(collector.encode_artifact(previous))
+    if not args.previous:
+        print("note: the zlib dictionary is built from the measured artifact")
+    dictionary = collector.build_dictionary(samples)
+
+    specs = args.codec or default_codecs()
+    results = {
+        "schemaVersion": 1,
+        "config": {
+            "artifact": str(args.artifact),
+            "previous": [str(path) for path in args.previous or ()],
+            "dictionaryBytes": len(dictionary),
+            "repeat": args.repeat,
+        },
+        "python": platform.python_version(),
+        "forms": bench_codecs(forms, specs, dictionary, args.repeat),
+    }
+    for form, codecs in results["forms"].items():
+        baseline = codecs.get("gzip:9")
+        for spec, result in codecs.items():
+            size = f"{result['bytes']:>9,} bytes"
+            if baseline:
+                size += f" ({result['bytes'] / baseline['bytes'] - 1:+6.1%})"
+            print(
+                f"{form:>8} {spec:>17}: {size},"
+                f" compress {result['compressSeconds'] * 1000:7.1f} ms,"
+                f" decompress {result['decompressSeconds'] * 1000:6.2f} ms"
+            )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"results: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,26 +4,99 @@
 from __future__ import annotations
 
 import argparse
+import cProfile
 import gzip
+import hashlib
 import json
+import math
 import os
+import random
 import sqlite3
+import statistics
+import struct
+import threading
 import time
-from contextlib import closing
-from datetime import datetime, timezone
+import zlib
+from array import array
+from collections import namedtuple
+from itertools import chain, product
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing, contextmanager, nullcontext
+from operator import itemgetter
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from urllib.error import HTTPError, URLError
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
+try:
+    import numpy
+except ImportError:  # the collector also runs on the standard library alone
+    numpy = None
 
-API_URL = "https://er.dakgg.io/api/v1/character-stats"
-CHARACTER_API_URL = "https://er.dakgg.io/api/v0/characters?hl=ko"
+# Optional release codecs: zstd from the standard library on Python 3.14 or
+# the zstandard package, and brotli from the brotli package.
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+DEFAULT_API_BASE = "https://er.dakgg.io"
+API_PATH = "/api/v1/character-stats"
+CHARACTER_API_PATH = "/api/v0/characters?hl=ko"
+API_URL = DEFAULT_API_BASE + API_PATH
 DEFAULT_DB_PATH = Path(__file__).resolve().parents[1] / "data" / "dakgg_stats.sqlite3"
 DEFAULT_ARTIFACT_PATH = (
     Path(__file__).resolve().parents[1] / "data" / "dakgg_stats.json.gz"
 )
+DEFAULT_COLUMNAR_PATH = (
+    Path(__file__).resolve().parents[1] / "data" / "dakgg_stats.bin.gz"
+)
+DEFAULT_DELTA_PATH = (
+    Path(__file__).resolve().parents[1] / "data" / "dakgg_stats.delta.json.gz"
+)
+DEFAULT_MANIFEST_PATH = (
+    Path(__file__).resolve().parents[1] / "data" / "dakgg_stats.manifest.json"
+)
+SHARD_INDEX_NAME = "dakgg_stats.shards.json"
+WEAPON_SHARD_NAME = "dakgg_stats.weapons.json.gz"
+DEFAULT_HISTORY_PATH = (
+    Path(__file__).resolve().parents[1] / "data" / "dakgg_history.sqlite3"
+)
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[1] / "data" / "http_cache"
+DEFAULT_SPOOL_DIR = Path(__file__).resolve().parents[1] / "data" / "dakgg_spool"
+DEFAULT_SCHEDULE_PATH = (
+    Path(__file__).resolve().parents[1] / "data" / "dakgg_schedule.json"
+)
+DEFAULT_PROFILE_PATH = (
+    Path(__file__).resolve().parents[1] / "data" / "dakgg_collector.prof"
+)
 USER_AGENT = "ER-Dodge-Check/1.0 (+https://github.com/dejava-daisky/er-dodge)"
+REQUEST_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip",
+    "Dakgg-Language": "ko",
+    "User-Agent": USER_AGENT,
+}
+DEFAULT_CONCURRENCY = 4
+REQUEST_DEADLINE = 90.0
+SOCKET_TIMEOUT = 30.0
+RETRY_BACKOFF = 1.0
+RESUME_MAX_AGE = 3600.0
+BREAKER_THRESHOLD = 5
+PROBE_INTERVAL = 900.0
+MAX_PROBE_INTERVAL = 6 * 3600.0
+PROBE_WINDOW = 60.0
+UPDATE_HISTORY = 8
 TIERS = (
     ("in1000", "상위 1000명"),
     ("mithril_plus", "미스릴+"),
@@ -37,12 +110,26 @@ TIERS = (
     ("iron", "아이언"),
 )
 
+
+class Dimension(namedtuple("Dimension", "matching_mode team_mode period_days")):
+    """One (matching mode, team mode, period) combination of the matrix."""
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return f"{self.matching_mode}_{self.team_mode}_{self.period_days}d".lower()
+
+
+DEFAULT_DIMENSION = Dimension("RANK", "SQUAD", 7)
+
+SCHEMA_VERSION = 4
 SCHEMA = """
 PRAGMA foreign_keys = ON;
-PRAGMA user_version = 1;
+PRAGMA user_version = 4;
 
 CREATE TABLE collection_meta (
-    id INTEGER PRIMARY KEY CHECK (id = 1),
+    dimension_key TEXT PRIMARY KEY,
     source_url TEXT NOT NULL,
     collected_at TEXT NOT NULL,
     period_days INTEGER NOT NULL,
@@ -56,13 +143,16 @@ CREATE TABLE collection_meta (
 );
 
 CREATE TABLE tier_snapshots (
-    tier_key TEXT PRIMARY KEY,
+    dimension_key TEXT NOT NULL,
+    tier_key TEXT NOT NULL,
     tier_label TEXT NOT NULL,
     game_count INTEGER NOT NULL,
-    source_updated_at INTEGER NOT NULL
+    source_updated_at INTEGER NOT NULL,
+    PRIMARY KEY (dimension_key, tier_key)
 );
 
 CREATE TABLE character_stats (
+    dimension_key TEXT NOT NULL,
     tier_key TEXT NOT NULL,
     character_id INTEGER NOT NULL,
     game_count INTEGER NOT NULL,
@@ -90,11 +180,19 @@ CREATE TABLE character_stats (
     average_monster_kills REAL NOT NULL,
     average_player_deaths REAL NOT NULL,
     average_view_contribution REAL NOT NULL,
-    PRIMARY KEY (tier_key, character_id),
-    FOREIGN KEY (tier_key) REFERENCES tier_snapshots(tier_key) ON DELETE CASCADE
+    win_rate_shrunk REAL NOT NULL,
+    win_rate_low REAL NOT NULL,
+    win_rate_high REAL NOT NULL,
+    top3_rate_shrunk REAL NOT NULL,
+    top3_rate_low REAL NOT NULL,
+    top3_rate_high REAL NOT NULL,
+    PRIMARY KEY (dimension_key, tier_key, character_id),
+    FOREIGN KEY (dimension_key, tier_key)
+        REFERENCES tier_snapshots(dimension_key, tier_key) ON DELETE CASCADE
 );
 
 CREATE TABLE weapon_stats (
+    dimension_key TEXT NOT NULL,
     tier_key TEXT NOT NULL,
     character_id INTEGER NOT NULL,
     weapon_id INTEGER NOT NULL,
@@ -131,16 +229,334 @@ CREATE TABLE weapon_stats (
     damage_to_player_rank INTEGER,
     dak_tier TEXT,
     dak_tier_score REAL,
-    PRIMARY KEY (tier_key, character_id, weapon_id),
-    FOREIGN KEY (tier_key, character_id)
-        REFERENCES character_stats(tier_key, character_id) ON DELETE CASCADE
+    win_rate_shrunk REAL NOT NULL,
+    win_rate_low REAL NOT NULL,
+    win_rate_high REAL NOT NULL,
+    top3_rate_shrunk REAL NOT NULL,
+    top3_rate_low REAL NOT NULL,
+    top3_rate_high REAL NOT NULL,
+    PRIMARY KEY (dimension_key, tier_key, character_id, weapon_id),
+    FOREIGN KEY (dimension_key, tier_key, character_id)
+        REFERENCES character_stats(dimension_key, tier_key, character_id)
+        ON DELETE CASCADE
+);
+"""
+
+# Character fields exported to the release artifact:
+# (artifact name, character_stats column, rounding digits, columnar type).
+ARTIFACT_FIELDS = (
+    ("games", "game_count", None, "I"),
+    ("winRate", "win_rate", 7, "d"),
+    ("top3Rate", "top3_rate", 7, "d"),
+    ("averagePlacement", "average_placement", 5, "d"),
+    ("averageDamage", "average_damage_to_player", 2, "f"),
+    ("averageMmrGain", "average_mmr_gain", 4, "f"),
+    ("averageTeamKills", "average_team_kills", 4, "f"),
+    ("averagePlayerKills", "average_player_kills", 4, "f"),
+    ("averagePlayerAssists", "average_player_assists", 4, "f"),
+    ("averagePlayerDeaths", "average_player_deaths", 4, "f"),
+    ("averageViewContribution", "average_view_contribution", 4, "f"),
+    ("winRateShrunk", "win_rate_shrunk", 7, "d"),
+    ("winRateLow", "win_rate_low", 7, "d"),
+    ("winRateHigh", "win_rate_high", 7, "d"),
+    ("top3RateShrunk", "top3_rate_shrunk", 7, "d"),
+    ("top3RateLow", "top3_rate_low", 7, "d"),
+    ("top3RateHigh", "top3_rate_high", 7, "d"),
+)
+
+# Weapon fields exported per tier and character:
+# (artifact name, weapon_stats column, rounding digits, columnar type). They
+# are rounded more coarsely than the character fields, which keeps the
+# artifact small, and empty values are left out. The "S" type is a string
+# table reference.
+WEAPON_ARTIFACT_FIELDS = (
+    ("games", "game_count", None, "I"),
+    ("winRate", "win_rate", 4, "f"),
+    ("winRateShrunk", "win_rate_shrunk", 4, "f"),
+    ("winRateLow", "win_rate_low", 4, "f"),
+    ("winRateHigh", "win_rate_high", 4, "f"),
+    ("top3Rate", "top3_rate", 4, "f"),
+    ("top3RateShrunk", "top3_rate_shrunk", 4, "f"),
+    ("top3RateLow", "top3_rate_low", 4, "f"),
+    ("top3RateHigh", "top3_rate_high", 4, "f"),
+    ("averagePlacement", "average_placement", 3, "f"),
+    ("averageDamage", "average_damage_to_player", 0, "f"),
+    ("averageTeamKills", "average_team_kills", 2, "f"),
+    ("rankingSize", "ranking_size", None, "f"),
+    ("pickRank", "pick_rank", None, "f"),
+    ("winRank", "win_rank", None, "f"),
+    ("top3Rank", "top3_rank", None, "f"),
+    ("placementRank", "placement_rank", None, "f"),
+    ("damageRank", "damage_to_player_rank", None, "f"),
+    ("dakTier", "dak_tier", None, "S"),
+    ("dakTierScore", "dak_tier_score", 2, "f"),
+)
+
+# The sum column behind each averaged column, for game-weighted rollups.
+AVERAGE_SUMS = {
+    "win_rate": "wins",
+    "top3_rate": "top3_count",
+    "average_placement": "placement_sum",
+    "average_damage_to_player": "damage_to_player_sum",
+    "average_mmr_gain": "mmr_gain_sum",
+    "average_team_kills": "team_kill_sum",
+    "average_player_kills": "player_kill_sum",
+    "average_player_assists": "player_assistant_sum",
+    "average_player_deaths": "player_death_sum",
+    "average_view_contribution": "view_contribution_sum",
+}
+# Each "+" tier includes every tier above it and in1000 is part of
+# mithril_plus, so only these tiers add up to the ranked population without
+# counting a game twice.
+ROLLUP_TIERS = ("diamond_plus", "platinum", "gold", "silver", "bronze", "iron")
+# Percentiles of each metric over a tier's characters kept in its summary.
+METRIC_QUANTILES = (10, 25, 50, 75, 90)
+
+Codec = namedtuple("Codec", "name level")
+CODEC_LEVELS = {"gzip": (1, 9), "zlib": (1, 9), "zstd": (1, 22), "brotli": (0, 11)}
+DEFAULT_CODEC = Codec("gzip", 9)
+DICTIONARY_SIZE = 32 * 1024
+DICTIONARY_CHUNK = 256
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+DECODE_ERRORS = tuple(
+    error
+    for error in (
+        OSError,
+        EOFError,
+        zlib.error,
+        zstd and zstd.ZstdError,
+        zstandard and zstandard.ZstdError,
+        brotli and brotli.error,
+    )
+    if error
+)
+
+# Columnar (schemaVersion 2) layout: a fixed header followed by a directory
+# of (name string, type code, rounding digits, byte offset, element count).
+COLUMNAR_MAGIC = b"ERDS"
+COLUMNAR_HEADER = struct.Struct("<4sHHII")
+COLUMNAR_SECTION = struct.Struct("<IBbxxII")
+COLUMNAR_META_STRINGS = ("source", "collectedAt", "matchingMode", "teamMode")
+COLUMNAR_META_NUMBERS = (
+    "schemaVersion",
+    "periodDays",
+    "currentPatch",
+    "previousPatch",
+    "sourceUpdatedAtMin",
+    "sourceUpdatedAtMax",
+)
+NO_STRING = 0xFFFFFFFF
+NAN = float("nan")
+FLOAT32 = struct.Struct("<f")
+# The tier metric summaries are typed sections too, one per-tier column per
+# statistic, and the allTiers character rollup is a row table of
+# (artifact name, rounding digits, columnar type) fields.
+METRIC_DIGITS = {
+    name: digits
+    for name, column, digits, _ in ARTIFACT_FIELDS
+    if column in AVERAGE_SUMS
+}
+CHARACTER_ROW_FIELDS = tuple(
+    (name, digits, code) for name, _, digits, code in ARTIFACT_FIELDS
+)
+METRIC_TABLES = ("mean", "stddev", *(f"p{q}" for q in METRIC_QUANTILES))
+TIER_METRICS_FLAG = 1
+# The tables a delta replaces one entry at a time, per tier and in allTiers.
+TIER_DELTA_TABLES = ("characters", "metrics")
+ALL_TIERS_DELTA_TABLES = ("characters",)
+
+# Secondary indexes are created after the bulk load of a full rebuild. They
+# also carry the most compared metrics, so cross-tier lookups of a character or
+# weapon are answered from the index alone.
+COVERED_METRICS = (
+    "game_count",
+    "win_rate",
+    "top3_rate",
+    "average_placement",
+    "average_damage_to_player",
+)
+INDEXES = (
+    "CREATE INDEX idx_character_stats_character ON character_stats("
+    f"character_id, dimension_key, tier_key, {', '.join(COVERED_METRICS)})",
+    "CREATE INDEX idx_weapon_stats_character ON weapon_stats("
+    f"character_id, weapon_id, dimension_key, tier_key, {', '.join(COVERED_METRICS)})",
+)
+
+# The build writes a temporary file that is integrity checked and fsynced
+# before it replaces the database, so it can skip the rollback journal and
+# per-transaction syncs.
+DEFAULT_BUILD_PRAGMAS = {
+    "journal_mode": "off",
+    "synchronous": "off",
+    "cache_size": -65536,
+}
+BUILD_BACKENDS = ("file", "memory")
+VERIFY_MODES = ("full", "quick", "counts")
+# Integer columns summed per tier by --verify counts; the row positions follow
+# the leading (dimension_key, tier_key) pair.
+CHECKSUM_COLUMNS = {
+    "character_stats": ("character_id", "game_count", "wins", "top3_count"),
+    "weapon_stats": ("character_id", "weapon_id", "game_count", "wins"),
+}
+
+HISTORY_CHARACTER_COLUMNS = (
+    "game_count",
+    "wins",
+    "top3_count",
+    "placement_sum",
+    "damage_to_player_sum",
+    "damage_to_monster_sum",
+    "mmr_gain_sum",
+    "team_kill_sum",
+    "player_kill_sum",
+    "player_assistant_sum",
+    "monster_kill_sum",
+    "player_death_sum",
+    "view_contribution_sum",
+)
+HISTORY_WEAPON_COLUMNS = HISTORY_CHARACTER_COLUMNS + (
+    "ranking_size",
+    "pick_rank",
+    "win_rank",
+    "top3_rank",
+    "placement_rank",
+    "damage_to_player_rank",
+    "dak_tier",
+    "dak_tier_score",
+)
+
+# History rows hold only the collected facts. Each dimension gets its own
+# snapshots, and a row version is valid for every snapshot of its dimension
+# between first_snapshot_id and last_snapshot_id, so a row that did not change
+# between refreshes is stored once. Rates are derived by the trend views.
+HISTORY_SCHEMA = """
+PRAGMA user_version = 2;
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id INTEGER PRIMARY KEY,
+    dimension_key TEXT NOT NULL,
+    collected_at TEXT NOT NULL,
+    period_days INTEGER NOT NULL,
+    matching_mode TEXT NOT NULL,
+    team_mode TEXT NOT NULL,
+    current_patch INTEGER,
+    previous_patch INTEGER,
+    source_updated_at_min INTEGER NOT NULL,
+    source_updated_at_max INTEGER NOT NULL,
+    tier_count INTEGER NOT NULL,
+    granularity TEXT NOT NULL DEFAULT 'raw'
+        CHECK (granularity IN ('raw', 'daily', 'patch'))
+);
+
+CREATE TABLE IF NOT EXISTS tier_history (
+    snapshot_id INTEGER NOT NULL,
+    tier_key TEXT NOT NULL,
+    tier_label TEXT NOT NULL,
+    game_count INTEGER NOT NULL,
+    source_updated_at INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, tier_key)
+);
+
+CREATE TABLE IF NOT EXISTS character_history (
+    dimension_key TEXT NOT NULL,
+    character_id INTEGER NOT NULL,
+    tier_key TEXT NOT NULL,
+    first_snapshot_id INTEGER NOT NULL,
+    last_snapshot_id INTEGER NOT NULL,
+    game_count INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    top3_count INTEGER NOT NULL,
+    placement_sum INTEGER NOT NULL,
+    damage_to_player_sum INTEGER NOT NULL,
+    damage_to_monster_sum INTEGER NOT NULL,
+    mmr_gain_sum INTEGER NOT NULL,
+    team_kill_sum INTEGER NOT NULL,
+    player_kill_sum INTEGER NOT NULL,
+    player_assistant_sum INTEGER NOT NULL,
+    monster_kill_sum INTEGER NOT NULL,
+    player_death_sum INTEGER NOT NULL,
+    view_contribution_sum INTEGER NOT NULL,
+    PRIMARY KEY (dimension_key, character_id, tier_key, first_snapshot_id)
+);
+
+CREATE TABLE IF NOT EXISTS weapon_history (
+    dimension_key TEXT NOT NULL,
+    character_id INTEGER NOT NULL,
+    weapon_id INTEGER NOT NULL,
+    tier_key TEXT NOT NULL,
+    first_snapshot_id INTEGER NOT NULL,
+    last_snapshot_id INTEGER NOT NULL,
+    game_count INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    top3_count INTEGER NOT NULL,
+    placement_sum INTEGER NOT NULL,
+    damage_to_player_sum INTEGER NOT NULL,
+    damage_to_monster_sum INTEGER NOT NULL,
+    mmr_gain_sum INTEGER NOT NULL,
+    team_kill_sum INTEGER NOT NULL,
+    player_kill_sum INTEGER NOT NULL,
+    player_assistant_sum INTEGER NOT NULL,
+    monster_kill_sum INTEGER NOT NULL,
+    player_death_sum INTEGER NOT NULL,
+    view_contribution_sum INTEGER NOT NULL,
+    ranking_size INTEGER,
+    pick_rank INTEGER,
+    win_rank INTEGER,
+    top3_rank INTEGER,
+    placement_rank INTEGER,
+    damage_to_player_rank INTEGER,
+    dak_tier TEXT,
+    dak_tier_score REAL,
+    PRIMARY KEY (dimension_key, character_id, weapon_id, tier_key, first_snapshot_id)
 );
 
-CREATE INDEX idx_character_stats_character
-    ON character_stats(character_id, tier_key);
+CREATE INDEX IF NOT EXISTS idx_character_history_last
+    ON character_history(last_snapshot_id);
+
+CREATE INDEX IF NOT EXISTS idx_weapon_history_last
+    ON weapon_history(last_snapshot_id);
 
-CREATE INDEX idx_weapon_stats_character
-    ON weapon_stats(character_id, weapon_id, tier_key);
+CREATE VIEW IF NOT EXISTS character_trend AS
+SELECT
+    s.snapshot_id,
+    s.dimension_key,
+    s.collected_at,
+    s.current_patch,
+    s.granularity,
+    h.tier_key,
+    h.character_id,
+    h.game_count,
+    CAST(h.wins AS REAL) / h.game_count AS win_rate,
+    CAST(h.top3_count AS REAL) / h.game_count AS top3_rate,
+    CAST(h.placement_sum AS REAL) / h.game_count AS average_placement,
+    CAST(h.damage_to_player_sum AS REAL) / h.game_count AS average_damage_to_player,
+    CAST(h.mmr_gain_sum AS REAL) / h.game_count AS average_mmr_gain
+FROM character_history h
+JOIN snapshots s
+    ON s.dimension_key = h.dimension_key
+    AND s.snapshot_id BETWEEN h.first_snapshot_id AND h.last_snapshot_id;
+
+CREATE VIEW IF NOT EXISTS weapon_trend AS
+SELECT
+    s.snapshot_id,
+    s.dimension_key,
+    s.collected_at,
+    s.current_patch,
+    s.granularity,
+    h.tier_key,
+    h.character_id,
+    h.weapon_id,
+    h.game_count,
+    CAST(h.wins AS REAL) / h.game_count AS win_rate,
+    CAST(h.top3_count AS REAL) / h.game_count AS top3_rate,
+    CAST(h.placement_sum AS REAL) / h.game_count AS average_placement,
+    CAST(h.damage_to_player_sum AS REAL) / h.game_count AS average_damage_to_player,
+    h.dak_tier,
+    h.dak_tier_score
+FROM weapon_history h
+JOIN snapshots s
+    ON s.dimension_key = h.dimension_key
+    AND s.snapshot_id BETWEEN h.first_snapshot_id AND h.last_snapshot_id;
 """
 
 SUM_FIELDS = (
@@ -163,434 +579,3772 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH)
     parser.add_argument("--artifact", type=Path, default=DEFAULT_ARTIFACT_PATH)
-    parser.add_argument("--period-days", type=int, default=7)
-    parser.add_argument("--delay", type=float, default=0.35)
-    return parser.parse_args()
-
-
-def fetch_tier(tier_key, period_days, attempts=3):
-    query = urlencode(
-        {
-            "dt": period_days,
-            "matchingMode": "RANK",
-            "teamMode": "SQUAD",
-            "tier": tier_key,
-        }
+    parser.add_argument(
+        "--columnar-artifact",
+        type=Path,
+        default=DEFAULT_COLUMNAR_PATH,
+        help="schemaVersion 2 columnar artifact written next to the JSON one",
     )
-    request = Request(
-        f"{API_URL}?{query}",
-        headers={
-            "Accept": "application/json",
-            "Dakgg-Language": "ko",
-            "User-Agent": USER_AGENT,
-        },
+    parser.add_argument(
+        "--previous-artifact",
+        type=Path,
+        help="previously published JSON artifact to diff against "
+        "(default: the existing --artifact file)",
     )
-
-    for attempt in range(1, attempts + 1):
-        try:
-            with urlopen(request, timeout=30) as response:
-                if response.status != 200:
-                    raise RuntimeError(f"unexpected HTTP status {response.status}")
-                return json.load(response)
-        except (HTTPError, URLError, TimeoutError, json.JSONDecodeError) as exc:
-            if attempt == attempts:
-                raise RuntimeError(f"failed to fetch tier {tier_key}: {exc}") from exc
-            time.sleep(attempt * 2)
-
-
-def fetch_characters(attempts=3):
-    request = Request(
-        CHARACTER_API_URL,
-        headers={
-            "Accept": "application/json",
-            "Dakgg-Language": "ko",
-            "User-Agent": USER_AGENT,
-        },
+    parser.add_argument("--delta-artifact", type=Path, default=DEFAULT_DELTA_PATH)
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument(
+        "--codec",
+        default=f"{DEFAULT_CODEC.name}:{DEFAULT_CODEC.level}",
+        help="compression of the columnar, delta and shard files as NAME[:LEVEL], "
+        f"NAME one of {', '.join(CODEC_LEVELS)}; zstd and brotli need their "
+        "modules (default gzip:9; the JSON artifact is always gzip)",
     )
-    for attempt in range(1, attempts + 1):
-        try:
-            with urlopen(request, timeout=30) as response:
-                if response.status != 200:
-                    raise RuntimeError(f"unexpected HTTP status {response.status}")
-                payload = json.load(response)
-            characters = payload.get("characters")
-            if not isinstance(characters, list) or not characters:
-                raise ValueError("character metadata is empty")
-            return {
-                str(require_int(character.get("id"), "character.id")): {
-                    "key": character.get("key") or "",
-                    "name": character.get("name") or character.get("key") or "",
-                    "imageUrl": character.get("imageUrl") or "",
-                }
-                for character in characters
-            }
-        except (HTTPError, URLError, TimeoutError, json.JSONDecodeError, ValueError) as exc:
-            if attempt == attempts:
-                raise RuntimeError(f"failed to fetch character metadata: {exc}") from exc
-            time.sleep(attempt * 2)
+    parser.add_argument(
+        "--compression-dictionary",
+        type=Path,
+        help="preset dictionary for the zlib codec, built from the previous "
+        "artifact when the file does not exist",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        type=Path,
+        help="also write one artifact per tier, a character metadata shard "
+        f"and {SHARD_INDEX_NAME} to this directory",
+    )
+    parser.add_argument(
+        "--matching-mode",
+        action="append",
+        type=str.upper,
+        help="DAK.GG matching mode to collect; repeat for several "
+        f"(default: {DEFAULT_DIMENSION.matching_mode})",
+    )
+    parser.add_argument(
+        "--team-mode",
+        action="append",
+        type=str.upper,
+        help="DAK.GG team mode to collect; repeat for several "
+        f"(default: {DEFAULT_DIMENSION.team_mode})",
+    )
+    parser.add_argument(
+        "--period-days",
+        action="append",
+        type=int,
+        help="statistics period in days; repeat for several "
+        f"(default: {DEFAULT_DIMENSION.period_days})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="maximum number of DAK.GG requests in flight",
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.35,
+        help="average seconds between request starts (token bucket refill)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=REQUEST_DEADLINE,
+        help="deadline in seconds for one request, including its retries",
+    )
+    parser.add_argument("--attempts", type=int, default=3)
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="directory for cached responses used by conditional requests",
+    )
+    parser.add_argument(
+        "--spool-dir",
+        type=Path,
+        default=DEFAULT_SPOOL_DIR,
+        help="directory where each validated payload is saved as it arrives",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="read spooled payloads younger than --resume-max-age instead of "
+        "fetching them again",
+    )
+    parser.add_argument(
+        "--resume-max-age",
+        type=float,
+        default=RESUME_MAX_AGE,
+        help=f"seconds a spooled payload stays fresh (default {RESUME_MAX_AGE:g})",
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=BREAKER_THRESHOLD,
+        help="consecutive failed requests after which no more are sent and "
+        "the missing payloads are read from the spool; 0 never stops "
+        f"(default {BREAKER_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and probe each tier around its next expected update",
+    )
+    parser.add_argument(
+        "--schedule-state",
+        type=Path,
+        default=DEFAULT_SCHEDULE_PATH,
+        help="JSON file with the learned update cadence of every tier",
+    )
+    parser.add_argument(
+        "--probe-interval",
+        type=float,
+        default=PROBE_INTERVAL,
+        help="seconds between probes of a tier whose cadence is unknown, and "
+        f"the first delay after an expected update (default {PROBE_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--max-probe-interval",
+        type=float,
+        default=MAX_PROBE_INTERVAL,
+        help="longest time a tier goes without a probe "
+        f"(default {MAX_PROBE_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="rebuild every tier instead of only the tiers that changed",
+    )
+    parser.add_argument(
+        "--journal-mode",
+        choices=("delete", "truncate", "persist", "memory", "off"),
+        default=DEFAULT_BUILD_PRAGMAS["journal_mode"],
+        help="SQLite journal mode used while building the database",
+    )
+    parser.add_argument(
+        "--synchronous",
+        choices=("off", "normal", "full", "extra"),
+        default=DEFAULT_BUILD_PRAGMAS["synchronous"],
+        help="SQLite synchronous mode used while building the database",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_BUILD_PRAGMAS["cache_size"],
+        help="SQLite cache_size used while building (negative values are KiB)",
+    )
+    parser.add_argument(
+        "--build-backend",
+        choices=BUILD_BACKENDS,
+        default="file",
+        help="build in a temporary file, or in memory and write the result "
+        "out compactly with VACUUM INTO",
+    )
+    parser.add_argument(
+        "--verify",
+        choices=VERIFY_MODES,
+        default="full",
+        help="check the built database with PRAGMA integrity_check, "
+        "PRAGMA quick_check, or the row counts and checksums of the tiers "
+        "written in this run",
+    )
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help="append each new collection to the history database",
+    )
+    parser.add_argument("--history-db", type=Path, default=DEFAULT_HISTORY_PATH)
+    parser.add_argument(
+        "--history-retention-days",
+        type=int,
+        default=14,
+        help="keep every history snapshot for this many days",
+    )
+    parser.add_argument(
+        "--history-compaction",
+        choices=("daily", "patch"),
+        default="daily",
+        help="rollup kept for snapshots older than the retention window",
+    )
+    parser.add_argument(
+        "--api-base",
+        default=DEFAULT_API_BASE,
+        help="DAK.GG compatible host to fetch from, such as the stand-in "
+        f"server of scripts/dakgg_fixtures.py (default: {DEFAULT_API_BASE})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="ignore the response cache and download every payload",
+    )
+    parser.add_argument(
+        "--unchanged-exit-code",
+        type=int,
+        default=0,
+        help="exit status when the release files were left unchanged, so a "
+        "caller can skip publishing them (default 0)",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="append timings and counters of this run to a JSON lines file, or "
+        "write Prometheus text format when the name ends in .prom",
+    )
+    parser.add_argument(
+        "--profile-phase",
+        choices=PHASES,
+        help="run every span of this phase under cProfile",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=Path,
+        default=DEFAULT_PROFILE_PATH,
+        help="cProfile stats file written for --profile-phase",
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.attempts < 1:
+        parser.error("--attempts must be at least 1")
+    try:
+        args.codec = parse_codec(args.codec)
+    except ValueError as exc:
+        parser.error(f"--codec: {exc}")
+    if args.compression_dictionary and args.codec.name != "zlib":
+        parser.error("--compression-dictionary needs the zlib codec")
+    if args.breaker_threshold < 0:
+        parser.error("--breaker-threshold must not be negative")
+    if not 0 < args.probe_interval <= args.max_probe_interval:
+        parser.error(
+            "--probe-interval must be positive and at most --max-probe-interval"
+        )
+    for option, values in (
+        ("--matching-mode", args.matching_mode),
+        ("--team-mode", args.team_mode),
+    ):
+        for value in values or ():
+            if not value.replace("_", "").isalnum():
+                parser.error(f"{option} must be a DAK.GG mode name, not {value!r}")
+    if any(period_days < 1 for period_days in args.period_days or ()):
+        parser.error("--period-days must be at least 1")
+    args.dimensions = dimension_matrix(
+        args.matching_mode, args.team_mode, args.period_days
+    )
+    return args
 
 
-def require_int(value, field):
-    if isinstance(value, bool):
-        raise ValueError(f"{field} must be an integer")
-    try:
-        return int(value)
-    except (TypeError, ValueError) as exc:
-        raise ValueError(f"{field} must be an integer") from exc
+def dimension_matrix(matching_modes=None, team_modes=None, periods=None):
+    """Every combination of the given modes and periods, in order, with the
+    defaults standing in for empty lists. The first one is the primary
+    dimension, published under the unsuffixed artifact paths."""
+    return list(
+        dict.fromkeys(
+            Dimension(*values)
+            for values in product(
+                matching_modes or [DEFAULT_DIMENSION.matching_mode],
+                team_modes or [DEFAULT_DIMENSION.team_mode],
+                periods or [DEFAULT_DIMENSION.period_days],
+            )
+        )
+    )
 
 
-def validate_snapshot(payload, tier_key, period_days):
-    meta = payload.get("meta") or {}
-    snapshot = payload.get("characterStatSnapshot") or {}
-    characters = snapshot.get("characterStats")
+class TokenBucket:
+    """Thread-safe token bucket shared by every outgoing DAK.GG request."""
 
-    if meta.get("tier") != tier_key:
-        raise ValueError(f"{tier_key}: response tier mismatch")
-    if require_int(meta.get("dt"), "meta.dt") != period_days:
-        raise ValueError(f"{tier_key}: response period mismatch")
-    if not isinstance(characters, list) or not characters:
-        raise ValueError(f"{tier_key}: character statistics are empty")
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.lock = threading.Lock()
 
-    require_int(meta.get("updatedAt"), "meta.updatedAt")
-    require_int(snapshot.get("tierCount"), "tierCount")
-    for character in characters:
-        require_int(character.get("key"), "character.key")
-        weapons = character.get("weaponStats")
-        if not isinstance(weapons, list) or not weapons:
-            raise ValueError(f"{tier_key}: weapon statistics are empty")
+    def acquire(self, deadline=None):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and self.clock() + wait > deadline:
+                raise TimeoutError("rate limit wait exceeds the request deadline")
+            self.sleep(wait)
 
 
-def zero_totals():
-    return {field: 0 for field in SUM_FIELDS}
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request once the breaker has opened."""
 
 
-def normalized_row(stats):
-    count = require_int(stats.get("count"), "count")
-    if count <= 0:
-        raise ValueError("count must be positive")
+class CircuitBreaker:
+    """Consecutive failure count shared by every outgoing DAK.GG request.
 
-    totals = {
-        field: require_int(stats.get(field, 0), field)
-        for field in SUM_FIELDS
-    }
-    return (
-        count,
-        totals["win"],
-        totals["top3"],
-        totals["place"],
-        totals["damageToPlayer"],
-        totals["damageToMonster"],
-        totals["mmrGain"],
-        totals["teamKill"],
-        totals["playerKill"],
-        totals["playerAssistant"],
-        totals["monsterKill"],
-        totals["playerDeaths"],
-        totals["viewContribution"],
-        totals["win"] / count,
-        totals["top3"] / count,
-        totals["place"] / count,
-        totals["damageToPlayer"] / count,
-        totals["damageToMonster"] / count,
-        totals["mmrGain"] / count,
-        totals["teamKill"] / count,
-        totals["playerKill"] / count,
-        totals["playerAssistant"] / count,
-        totals["monsterKill"] / count,
-        totals["playerDeaths"] / count,
-        totals["viewContribution"] / count,
-    )
+    Every failed attempt counts, and any answer, 304 included, resets the
+    count. After ``threshold`` failures in a row the breaker stays open for
+    the rest of the run: pending attempts fail at once with
+    ``CircuitOpenError`` instead of retrying. A threshold of 0 never opens.
+    """
 
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.failures = 0
+        self.open = False
+        self.lock = threading.Lock()
 
-def aggregate_character(character):
-    totals = zero_totals()
-    count = 0
-    for weapon in character["weaponStats"]:
-        weapon_count = require_int(weapon.get("count"), "weapon.count")
-        if weapon_count <= 0:
-            continue
-        count += weapon_count
-        for field in SUM_FIELDS:
-            totals[field] += require_int(weapon.get(field, 0), field)
-    if count <= 0:
-        raise ValueError(f"character {character.get('key')} has no games")
-    return {"count": count, **totals}
+    def check(self, label):
+        if self.open:
+            raise CircuitOpenError(
+                f"not fetching {label}: {self.failures} requests failed in a row"
+            )
 
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
 
-def insert_snapshot(conn, tier_key, tier_label, payload):
-    meta = payload["meta"]
-    snapshot = payload["characterStatSnapshot"]
-    conn.execute(
-        """
-        INSERT INTO tier_snapshots (
-            tier_key, tier_label, game_count, source_updated_at
-        ) VALUES (?, ?, ?, ?)
-        """,
-        (
-            tier_key,
-            tier_label,
-            require_int(snapshot["tierCount"], "tierCount"),
-            require_int(meta["updatedAt"], "meta.updatedAt"),
-        ),
-    )
+    def failed(self):
+        """Count a failed attempt and return True if it opened the breaker."""
+        with self.lock:
+            self.failures += 1
+            if self.open or not self.threshold or self.failures < self.threshold:
+                return False
+            self.open = True
+            return True
 
-    for character in snapshot["characterStats"]:
-        character_id = require_int(character["key"], "character.key")
-        aggregate = aggregate_character(character)
-        conn.execute(
-            """
-            INSERT INTO character_stats VALUES (
-                ?, ?,
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-            )
-            """,
-            (tier_key, character_id, *normalized_row(aggregate)),
-        )
 
-        for weapon in character["weaponStats"]:
-            if require_int(weapon.get("count"), "weapon.count") <= 0:
-                continue
-            rank = weapon.get("rank") or {}
-            conn.execute(
-                """
-                INSERT INTO weapon_stats VALUES (
-                    ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?, ?
-                )
-                """,
-                (
-                    tier_key,
-                    character_id,
-                    require_int(weapon["key"], "weapon.key"),
-                    *normalized_row(weapon),
-                    rank.get("size"),
-                    rank.get("count"),
-                    rank.get("win"),
-                    rank.get("top3"),
-                    rank.get("place"),
-                    rank.get("damageToPlayer"),
-                    weapon.get("tier"),
-                    weapon.get("tierScore"),
-                ),
-            )
+PHASES = (
+    "collect",
+    "fetch",
+    "validate",
+    "aggregate",
+    "insert",
+    "publish",
+    "integrity_check",
+    "write",
+    "history",
+    "export",
+    "encode",
+    "compress",
+    "columnar",
+    "shards",
+    "delta",
+)
 
 
-def build_database(db_path, payloads, period_days):
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = db_path.with_name(f".{db_path.name}.tmp")
-    temp_path.unlink(missing_ok=True)
+class Metrics:
+    """Timing spans, counters and samples recorded during one run.
 
-    updated_values = [
-        require_int(payload["meta"]["updatedAt"], "meta.updatedAt")
-        for _, _, payload in payloads
-    ]
-    patches = payloads[0][2].get("patches") or []
-    collected_at = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    Spans are recorded per phase, and per tier where a phase handles one tier
+    at a time. ``write`` appends the run to a JSON lines file, or replaces a
+    Prometheus text file when the path ends in ``.prom``. With
+    ``profile_phase``, every span of that phase also runs under cProfile.
+    Recording is thread-safe.
+    """
 
-    try:
-        with closing(sqlite3.connect(temp_path)) as conn:
-            conn.executescript(SCHEMA)
-            with conn:
-                for tier_key, tier_label, payload in payloads:
-                    insert_snapshot(conn, tier_key, tier_label, payload)
-                conn.execute(
-                    """
-                    INSERT INTO collection_meta
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        1,
-                        API_URL,
-                        collected_at,
-                        period_days,
-                        "RANK",
-                        "SQUAD",
-                        patches[0] if len(patches) > 0 else None,
-                        patches[1] if len(patches) > 1 else None,
-                        min(updated_values),
-                        max(updated_values),
-                        len(payloads),
-                    ),
+    def __init__(self, profile_phase=None):
+        self.run_id = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.spans = []
+        self.counters = {}
+        self.samples = {}
+        self.profile_phase = profile_phase
+        self.profiler = cProfile.Profile() if profile_phase else None
+
+    @contextmanager
+    def span(self, name, **labels):
+        profile = name == self.profile_phase
+        started = time.perf_counter()
+        if profile:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                self.profiler.disable()
+            seconds = time.perf_counter() - started
+            with self.lock:
+                self.spans.append(
+                    (name, labels, started - self.started, seconds)
                 )
-                conn.execute("PRAGMA optimize")
 
-        with closing(sqlite3.connect(temp_path)) as conn:
-            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
-            if integrity != "ok":
-                raise RuntimeError(f"SQLite integrity check failed: {integrity}")
-        os.replace(temp_path, db_path)
-    finally:
-        temp_path.unlink(missing_ok=True)
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
 
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.samples.setdefault(key, []).append(value)
 
-def database_is_current(db_path, payloads, period_days):
-    if not db_path.exists():
-        return False
+    def records(self, status):
+        run = {"run": self.run_id}
+        for name, labels, start, seconds in self.spans:
+            yield {
+                **run,
+                "kind": "span",
+                "name": name,
+                "labels": labels,
+                "start": round(start, 6),
+                "seconds": round(seconds, 6),
+            }
+        for (name, labels), value in self.counters.items():
+            yield {
+                **run,
+                "kind": "counter",
+                "name": name,
+                "labels": dict(labels),
+                "value": value,
+            }
+        for (name, labels), values in self.samples.items():
+            yield {
+                **run,
+                "kind": "samples",
+                "name": name,
+                "labels": dict(labels),
+                "count": len(values),
+                "sum": round(sum(values), 6),
+                "values": [round(value, 6) for value in values],
+            }
+        yield {
+            **run,
+            "kind": "run",
+            "status": status,
+            "seconds": round(time.perf_counter() - self.started, 6),
+        }
 
-    updated_values = [
-        require_int(payload["meta"]["updatedAt"], "meta.updatedAt")
-        for _, _, payload in payloads
-    ]
-    patches = payloads[0][2].get("patches") or []
-    try:
-        with closing(sqlite3.connect(db_path)) as conn:
-            if conn.execute("PRAGMA user_version").fetchone()[0] != 1:
-                return False
-            row = conn.execute(
-                """
-                SELECT
-                    period_days,
-                    current_patch,
-                    previous_patch,
-                    source_updated_at_min,
-                    source_updated_at_max,
-                    tier_count
-                FROM collection_meta
-                WHERE id = 1
-                """
-            ).fetchone()
-    except sqlite3.DatabaseError:
-        return False
+    def prometheus(self, status):
+        def series(name, labels, value):
+            text = ",".join(f'{key}="{label}"' for key, label in labels)
+            labels = f"{{{text}}}" if text else ""
+            return f"dakgg_collector_{name}{labels} {value}"
 
-    expected = (
-        period_days,
-        patches[0] if len(patches) > 0 else None,
-        patches[1] if len(patches) > 1 else None,
-        min(updated_values),
-        max(updated_values),
-        len(payloads),
-    )
-    return row == expected
+        lines = [
+            "# TYPE dakgg_collector_run_seconds gauge",
+            series("run_seconds", (), round(time.perf_counter() - self.started, 6)),
+            "# TYPE dakgg_collector_run_success gauge",
+            series("run_success", (), int(status == "ok")),
+        ]
+        spans = {}
+        for name, labels, _, seconds in self.spans:
+            key = (("span", name), *sorted(labels.items()))
+            spans[key] = spans.get(key, 0) + seconds
+        lines.append("# TYPE dakgg_collector_span_seconds gauge")
+        lines.extend(
+            series("span_seconds", key, round(seconds, 6))
+            for key, seconds in spans.items()
+        )
+        family = None
+        for (name, labels), value in sorted(self.counters.items()):
+            if name != family:
+                family = name
+                lines.append(f"# TYPE dakgg_collector_{name}_total counter")
+            lines.append(series(f"{name}_total", labels, value))
+        for (name, labels), values in sorted(self.samples.items()):
+            if name != family:
+                family = name
+                lines.append(f"# TYPE dakgg_collector_{name} summary")
+            values = sorted(values)
+            for quantile in (0.5, 0.9, 1.0):
+                value = values[min(len(values) - 1, int(quantile * len(values)))]
+                lines.append(
+                    series(name, (*labels, ("quantile", quantile)), round(value, 6))
+                )
+            lines.append(series(f"{name}_sum", labels, round(sum(values), 6)))
+            lines.append(series(f"{name}_count", labels, len(values)))
+        return "\n".join(lines) + "\n"
 
+    def write(self, path, status="ok"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".prom":
+            write_atomic(path, self.prometheus(status).encode("utf-8"))
+            return
+        with path.open("a", encoding="utf-8") as output:
+            for record in self.records(status):
+                output.write(json.dumps(record, sort_keys=True) + "\n")
 
-def print_summary(db_path):
-    with closing(sqlite3.connect(db_path)) as conn:
-        tiers = conn.execute("SELECT COUNT(*) FROM tier_snapshots").fetchone()[0]
-        characters = conn.execute("SELECT COUNT(*) FROM character_stats").fetchone()[0]
-        weapons = conn.execute("SELECT COUNT(*) FROM weapon_stats").fetchone()[0]
-        games = conn.execute("SELECT SUM(game_count) FROM tier_snapshots").fetchone()[0]
-        patch = conn.execute(
-            "SELECT current_patch FROM collection_meta WHERE id = 1"
-        ).fetchone()[0]
-    print(f"database: {db_path}")
-    print(f"patch: {patch}")
-    print(f"tiers: {tiers}")
-    print(f"tier game samples: {games:,}")
-    print(f"character rows: {characters}")
-    print(f"weapon rows: {weapons}")
+    def dump_profile(self, path):
+        if self.profiler is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.profiler.dump_stats(path)
 
 
-def build_release_artifact(db_path, artifact_path, character_metadata):
+class NullMetrics(Metrics):
+    """Metrics that record nothing, used when a caller passes none."""
+
+    def span(self, name, **labels):
+        return nullcontext()
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class ResponseCache:
+    """On-disk cache of DAK.GG responses keyed by request URL.
+
+    Each entry keeps the ETag/Last-Modified validators next to the gzip
+    compressed body. New responses are staged in memory and only written by
+    ``commit`` once the refresh has produced its outputs, so a failed run never
+    leaves validators behind that would make the next run skip its rebuild.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def _paths(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return (
+            self.directory / f"{digest}.json",
+            self.directory / f"{digest}.body.gz",
+        )
+
+    def lookup(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            entry = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url or not body_path.exists():
+            return None
+        return entry
+
+    def validators(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+    def read_body(self, url):
+        _, body_path = self._paths(url)
+        try:
+            return gzip.decompress(body_path.read_bytes())
+        except (OSError, EOFError) as exc:
+            self.invalidate(url)
+            raise ValueError(f"cached response is unreadable: {exc}") from exc
+
+    def invalidate(self, url):
+        for path in self._paths(url):
+            path.unlink(missing_ok=True)
+
+    def stage(self, url, headers, compressed_body):
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        entry = {"url": url, "etag": etag, "lastModified": last_modified}
+        with self.lock:
+            self.pending[url] = (entry, compressed_body)
+
+    def commit(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for url, (entry, compressed_body) in pending.items():
+            meta_path, body_path = self._paths(url)
+            write_atomic(body_path, compressed_body)
+            write_atomic(meta_path, json.dumps(entry, sort_keys=True).encode("utf-8"))
+
+
+class Spool:
+    """Validated payloads saved as soon as they arrive.
+
+    The character metadata and each tier of each dimension are written to
+    their own gzip file with the request URL and the time they were fetched,
+    replacing the previous entry atomically. A run that fails part-way keeps
+    what it downloaded: ``load`` with ``max_age`` returns the entries that are
+    still fresh for ``--resume``, and without it the last good entry of a
+    request that failed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, dimension, tier_key):
+        name = f"{dimension.key}.{tier_key}" if tier_key else "characters"
+        return self.directory / f"{name}.json.gz"
+
+    def save(self, dimension, tier_key, url, payload):
+        entry = {"url": url, "fetchedAt": time.time(), "payload": payload}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self._path(dimension, tier_key),
+            gzip.compress(
+                json.dumps(entry, separators=(",", ":")).encode("utf-8"),
+                compresslevel=1,
+                mtime=0,
+            ),
+        )
+
+    def load(self, dimension, tier_key, url, max_age=None):
+        """The spooled payload of ``url``, or None when there is none or it
+        is older than ``max_age`` seconds."""
+        try:
+            entry = json.loads(
+                gzip.decompress(self._path(dimension, tier_key).read_bytes())
+            )
+        except (OSError, EOFError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("url") != url:
+            return None
+        if max_age is not None and time.time() - entry.get("fetchedAt", 0) > max_age:
+            return None
+        return entry.get("payload")
+
+
+def write_atomic(path, data):
+    temp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def fetch_json(
+    url,
+    label,
+    limiter,
+    deadline,
+    attempts=3,
+    parse=None,
+    cache=None,
+    metrics=NULL_METRICS,
+    breaker=None,
+):
+    """Fetch one JSON document and return ``(payload, changed)``.
+
+    With a cache, the request is conditional. A 304 answer returns
+    ``(None, False)`` without touching the cached body; ``load_cached`` reads
+    it when the caller needs it after all. With a ``CircuitBreaker``, nothing
+    is sent once it has opened.
+    """
+    with metrics.span("fetch", resource=label):
+        return fetch_attempts(
+            url, label, limiter, deadline, attempts, parse, cache, metrics, breaker
+        )
+
+
+def fetch_attempts(
+    url, label, limiter, deadline, attempts, parse, cache, metrics, breaker=None
+):
+    expires_at = time.monotonic() + deadline
+
+    for attempt in range(1, attempts + 1):
+        if breaker:
+            breaker.check(label)
+        headers = dict(REQUEST_HEADERS)
+        entry = cache.lookup(url) if cache else None
+        if entry:
+            headers.update(cache.validators(entry))
+        try:
+            limiter.acquire(expires_at)
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("request deadline exceeded")
+            requested = time.perf_counter()
+            try:
+                with urlopen(
+                    Request(url, headers=headers),
+                    timeout=min(SOCKET_TIMEOUT, remaining),
+                ) as response:
+                    if response.status != 200:
+                        raise RuntimeError(
+                            f"unexpected HTTP status {response.status}"
+                        )
+                    response_headers = response.headers
+                    body = response.read()
+            except HTTPError as exc:
+                metrics.count("http_responses", resource=label, status=exc.code)
+                if exc.code != 304 or not entry:
+                    raise
+                exc.close()
+                body = None
+            else:
+                metrics.count("http_responses", resource=label, status=200)
+                metrics.count("http_bytes", len(body), resource=label)
+            finally:
+                metrics.observe(
+                    "http_request_seconds",
+                    time.perf_counter() - requested,
+                    resource=label,
+                )
+
+            if breaker:
+                breaker.succeeded()
+            if body is None:
+                return None, False
+            if response_headers.get("Content-Encoding", "").lower() == "gzip":
+                compressed_body, body = body, gzip.decompress(body)
+            else:
+                compressed_body = gzip.compress(body, mtime=0)
+            payload = json.loads(body)
+            del body
+            result = parse(payload) if parse else payload
+            if cache:
+                cache.stage(url, response_headers, compressed_body)
+            return result, True
+        except (
+            HTTPError,
+            URLError,
+            TimeoutError,
+            EOFError,
+            json.JSONDecodeError,
+            ValueError,
+        ) as exc:
+            if breaker and breaker.failed():
+                metrics.count("circuit_breaker_open")
+                raise CircuitOpenError(
+                    f"failed to fetch {label}: {exc}; {breaker.failures} requests"
+                    " failed in a row, stopping"
+                ) from exc
+            # Full jitter keeps concurrent workers from retrying in lockstep,
+            # but never sooner than a throttled answer asked for.
+            backoff = max(
+                random.uniform(0, RETRY_BACKOFF * 2**attempt), retry_after(exc)
+            )
+            if attempt == attempts or time.monotonic() + backoff >= expires_at:
+                raise RuntimeError(f"failed to fetch {label}: {exc}") from exc
+            metrics.count("http_retries", resource=label)
+            time.sleep(backoff)
+
+
+def retry_after(exc):
+    """Seconds a 429 or 503 answer asked to wait before retrying, or 0."""
+    if not isinstance(exc, HTTPError) or exc.code not in (429, 503):
+        return 0
+    try:
+        return max(0.0, float(exc.headers.get("Retry-After", 0)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def api_url(api_base=DEFAULT_API_BASE):
+    """The character statistics endpoint of ``api_base``, DAK.GG or a
+    compatible host such as the stand-in server of
+    ``scripts/dakgg_fixtures.py``."""
+    return api_base.rstrip("/") + API_PATH
+
+
+def character_url(api_base=DEFAULT_API_BASE):
+    return api_base.rstrip("/") + CHARACTER_API_PATH
+
+
+def tier_url(tier_key, dimension, api_base=DEFAULT_API_BASE):
+    query = urlencode(
+        {
+            "dt": dimension.period_days,
+            "matchingMode": dimension.matching_mode,
+            "teamMode": dimension.team_mode,
+            "tier": tier_key,
+        }
+    )
+    return f"{api_url(api_base)}?{query}"
+
+
+def fetch_tier(
+    tier_key,
+    dimension,
+    limiter,
+    deadline,
+    attempts=3,
+    cache=None,
+    metrics=NULL_METRICS,
+    breaker=None,
+    api_base=DEFAULT_API_BASE,
+):
+    return fetch_json(
+        tier_url(tier_key, dimension, api_base),
+        f"tier {dimension.key}/{tier_key}",
+        limiter,
+        deadline,
+        attempts,
+        cache=cache,
+        metrics=metrics,
+        breaker=breaker,
+    )
+
+
+def load_cached(cache, url, parse=None):
+    payload = json.loads(cache.read_body(url))
+    return parse(payload) if parse else payload
+
+
+def parse_characters(payload):
+    characters = payload.get("characters")
+    if not isinstance(characters, list) or not characters:
+        raise ValueError("character metadata is empty")
+    return {
+        str(require_int(character.get("id"), "character.id")): {
+            "key": character.get("key") or "",
+            "name": character.get("name") or character.get("key") or "",
+            "imageUrl": character.get("imageUrl") or "",
+        }
+        for character in characters
+    }
+
+
+def fetch_characters(
+    limiter,
+    deadline,
+    attempts=3,
+    cache=None,
+    metrics=NULL_METRICS,
+    breaker=None,
+    api_base=DEFAULT_API_BASE,
+):
+    return fetch_json(
+        character_url(api_base),
+        "character metadata",
+        limiter,
+        deadline,
+        attempts,
+        parse=parse_characters,
+        cache=cache,
+        metrics=metrics,
+        breaker=breaker,
+    )
+
+
+def fetch_stream(
+    dimensions,
+    concurrency,
+    limiter,
+    deadline,
+    attempts=3,
+    cache=None,
+    metrics=NULL_METRICS,
+    breaker=None,
+    skip=frozenset(),
+    failures=None,
+    api_base=DEFAULT_API_BASE,
+):
+    """Fetch character metadata and every tier of every dimension
+    concurrently from ``api_base``.
+
+    Yields ``(dimension, tier_key, tier_label, payload, changed)`` in
+    completion order, with ``dimension`` and ``tier_key`` None for the
+    character metadata and ``payload`` None for a 304 answer. ``(dimension,
+    tier_key)`` pairs in ``skip``, ``(None, None)`` for the metadata, are not
+    fetched. Requests are submitted one dimension after another and share
+    ``limiter``, so earlier dimensions tend to complete first. Without a
+    ``failures`` list, the first failure cancels the requests that have not
+    started yet and is re-raised, so a refresh takes about as long as its
+    slowest request; with one, each failure is appended to it as
+    ``(dimension, tier_key, tier_label, exc)`` and the other requests go on.
+    Each result is released once it has been yielded, so only the payloads
+    still in flight are held in memory.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="dakgg-fetch"
+    )
+    started = time.monotonic()
+    try:
+        labels = {}
+        if (None, None) not in skip:
+            future = executor.submit(
+                fetch_characters,
+                limiter,
+                deadline,
+                attempts,
+                cache,
+                metrics,
+                breaker,
+                api_base,
+            )
+            labels[future] = (None, None, None)
+        for dimension in dimensions:
+            for tier_key, tier_label in TIERS:
+                if (dimension, tier_key) in skip:
+                    continue
+                future = executor.submit(
+                    fetch_tier,
+                    tier_key,
+                    dimension,
+                    limiter,
+                    deadline,
+                    attempts,
+                    cache,
+                    metrics,
+                    breaker,
+                    api_base,
+                )
+                labels[future] = (dimension, tier_key, tier_label)
+
+        pending = set(labels)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dimension, tier_key, tier_label = labels.pop(future)
+                elapsed = time.monotonic() - started
+                label = (
+                    f"{dimension.key}/{tier_key}" if tier_key else "character metadata"
+                )
+                try:
+                    payload, changed = future.result()
+                except Exception as exc:
+                    if failures is None:
+                        raise
+                    print(f"failed {label} ({elapsed:.1f}s): {exc}")
+                    failures.append((dimension, tier_key, tier_label, exc))
+                    continue
+                status = "fetched" if changed else "unchanged"
+                print(f"{status} {label} ({elapsed:.1f}s)")
+                yield dimension, tier_key, tier_label, payload, changed
+            del done
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def require_int(value, field):
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"{field} must be an integer") from exc
+
+
+def zero_totals():
+    return {field: 0 for field in SUM_FIELDS}
+
+
+def derived_row(count, totals):
+    """Return the stored row for ``count`` games and ``totals`` in
+    ``SUM_FIELDS`` order: the count, the totals, then their averages."""
+    return (count, *totals, *[total / count for total in totals])
+
+
+def normalized_row(stats):
+    count = require_int(stats.get("count"), "count")
+    if count <= 0:
+        raise ValueError("count must be positive")
+    return derived_row(
+        count, [require_int(stats.get(field, 0), field) for field in SUM_FIELDS]
+    )
+
+
+def aggregate_character(character):
+    totals = zero_totals()
+    count = 0
+    for weapon in character["weaponStats"]:
+        weapon_count = require_int(weapon.get("count"), "weapon.count")
+        if weapon_count <= 0:
+            continue
+        count += weapon_count
+        for field in SUM_FIELDS:
+            totals[field] += require_int(weapon.get(field, 0), field)
+    if count <= 0:
+        raise ValueError(f"character {character.get('key')} has no games")
+    return {"count": count, **totals}
+
+
+AGGREGATION_ENGINES = ("numpy", "array", "python")
+DEFAULT_AGGREGATION_ENGINE = "numpy" if numpy is not None else "array"
+# Float64 division of two integers below 2**53 is correctly rounded, like
+# Python's int / int, so batched averages only stay exact under this bound.
+EXACT_FLOAT_LIMIT = 2**53
+RANK_FIELDS = ("size", "count", "win", "top3", "place", "damageToPlayer")
+weapon_values = itemgetter("count", *SUM_FIELDS)
+rank_values = itemgetter(*RANK_FIELDS)
+
+
+class TierRecord:
+    """One validated tier payload, read into columns.
+
+    ``character_ids`` and ``starts`` group the positive-count weapons by
+    character: character ``i`` owns entries ``starts[i]`` to
+    ``starts[i + 1]`` of ``keys`` (``(character_id, weapon_id)``),
+    ``values`` (``(count, *SUM_FIELDS)`` as ints) and ``extras`` (the rank
+    fields, tier and tierScore as sent).
+    """
+
+    __slots__ = (
+        "tier_key",
+        "updated_at",
+        "tier_count",
+        "patches",
+        "character_ids",
+        "starts",
+        "keys",
+        "values",
+        "extras",
+    )
+
+    def __init__(
+        self,
+        tier_key,
+        updated_at,
+        tier_count,
+        patches,
+        character_ids,
+        starts,
+        keys,
+        values,
+        extras,
+    ):
+        self.tier_key = tier_key
+        self.updated_at = updated_at
+        self.tier_count = tier_count
+        self.patches = patches
+        self.character_ids = character_ids
+        self.starts = starts
+        self.keys = keys
+        self.values = values
+        self.extras = extras
+
+
+def decode_tier(payload, tier_key, dimension=DEFAULT_DIMENSION):
+    """Validate a ``character-stats`` response and read it into a
+    ``TierRecord`` in one pass over its characters and weapons.
+
+    Values that are not plain ints are coerced with ``require_int``, and
+    errors name the tier, character and weapon they come from. Weapons
+    without games are skipped, and a character left without any is an error.
+    """
+    meta = payload.get("meta") or {}
+    snapshot = payload.get("characterStatSnapshot") or {}
+    characters = snapshot.get("characterStats")
+
+    if meta.get("tier") != tier_key:
+        raise ValueError(f"{tier_key}: response tier mismatch")
+    if require_int(meta.get("dt"), "meta.dt") != dimension.period_days:
+        raise ValueError(f"{tier_key}: response period mismatch")
+    for field, expected in (
+        ("matchingMode", dimension.matching_mode),
+        ("teamMode", dimension.team_mode),
+    ):
+        if meta.get(field) not in (None, expected):
+            raise ValueError(f"{tier_key}: response {field} mismatch")
+    if not isinstance(characters, list) or not characters:
+        raise ValueError(f"{tier_key}: character statistics are empty")
+    updated_at = require_int(meta.get("updatedAt"), "meta.updatedAt")
+    tier_count = require_int(snapshot.get("tierCount"), "tierCount")
+
+    character_ids = []
+    starts = [0]
+    keys = []
+    values = []
+    extras = []
+    for character in characters:
+        character_id = character.get("key")
+        if type(character_id) is not int:
+            character_id = require_int(character_id, f"{tier_key}: character.key")
+        weapons = character.get("weaponStats")
+        if not isinstance(weapons, list) or not weapons:
+            raise ValueError(
+                f"{tier_key}: weapon statistics of character {character_id}"
+                " are empty"
+            )
+        for weapon in weapons:
+            # itemgetter reads complete records in one call; missing fields
+            # take the slower path with the defaults.
+            try:
+                weapon_stats = weapon_values(weapon)
+            except KeyError:
+                weapon_stats = (
+                    weapon.get("count"),
+                    *[weapon.get(field, 0) for field in SUM_FIELDS],
+                )
+            count = weapon_stats[0]
+            if type(count) is not int:
+                count = require_int(
+                    count, f"{tier_key}: character {character_id} weapon.count"
+                )
+            if count <= 0:
+                continue
+            weapon_id = weapon.get("key")
+            if type(weapon_id) is not int:
+                weapon_id = require_int(
+                    weapon_id, f"{tier_key}: character {character_id} weapon.key"
+                )
+            rank = weapon.get("rank") or {}
+            try:
+                ranks = rank_values(rank)
+            except KeyError:
+                ranks = tuple(rank.get(field) for field in RANK_FIELDS)
+            keys.append((character_id, weapon_id))
+            values.append(weapon_stats)
+            extras.append((*ranks, weapon.get("tier"), weapon.get("tierScore")))
+        if len(values) == starts[-1]:
+            raise ValueError(f"{tier_key}: character {character_id} has no games")
+        character_ids.append(character_id)
+        starts.append(len(values))
+
+    # One type scan over every value; only payloads that send strings, floats
+    # or bools pay for per-value coercion.
+    if set(map(type, chain.from_iterable(values))) != {int}:
+        for index, (character_id, weapon_id) in enumerate(keys):
+            values[index] = tuple(
+                value
+                if type(value) is int
+                else require_int(
+                    value,
+                    f"{tier_key}: character {character_id} weapon {weapon_id} {field}",
+                )
+                for field, value in zip(("count", *SUM_FIELDS), values[index])
+            )
+    return TierRecord(
+        tier_key,
+        updated_at,
+        tier_count,
+        payload.get("patches") or [],
+        character_ids,
+        starts,
+        keys,
+        values,
+        extras,
+    )
+
+
+def numpy_averages(values, starts):
+    """Return ``(character_totals, character_averages, weapon_averages)``
+    from grouped NumPy reductions, or None outside the exact range."""
+    try:
+        matrix = numpy.array(values, dtype=numpy.int64)
+    except OverflowError:
+        return None
+    largest_group = max(end - start for start, end in zip(starts, starts[1:]))
+    if int(numpy.abs(matrix).max()) * largest_group >= EXACT_FLOAT_LIMIT:
+        return None
+    totals = numpy.add.reduceat(matrix, starts[:-1], axis=0)
+    return (
+        totals.tolist(),
+        (totals[:, 1:] / totals[:, :1]).tolist(),
+        (matrix[:, 1:] / matrix[:, :1]).tolist(),
+    )
+
+
+def array_averages(values, starts):
+    """The ``numpy_averages`` results from ``array`` columns and slice sums."""
+    columns = [array("q", column) for column in zip(*values)]
+    counts = columns[0]
+    bounds = list(zip(starts, starts[1:]))
+    totals = list(
+        zip(*[[sum(column[start:end]) for start, end in bounds] for column in columns])
+    )
+    return (
+        totals,
+        [[total / row[0] for total in row[1:]] for row in totals],
+        list(
+            zip(
+                *[
+                    [total / count for total, count in zip(column, counts)]
+                    for column in columns[1:]
+                ]
+            )
+        ),
+    )
+
+
+def tier_rows(prefix, record, engine=None):
+    """Build the ``character_stats`` and ``weapon_stats`` rows of one tier.
+
+    ``prefix`` is the ``(dimension_key, tier_key)`` pair that leads every
+    row, and ``record`` the ``TierRecord`` of the tier.
+
+    Character totals come from grouped reductions over the record's columns,
+    and every average is divided in batch, with NumPy when it is installed and
+    ``array`` columns otherwise. The rows are identical to
+    ``python_tier_rows``, which is used for the ``python`` engine and for
+    totals outside the batched engines' exact range.
+    """
+    engine = engine or DEFAULT_AGGREGATION_ENGINE
+    if engine == "numpy" and numpy is None:
+        raise RuntimeError("the numpy aggregation engine needs NumPy installed")
+    if engine == "python":
+        return python_tier_rows(prefix, record)
+    if engine == "numpy":
+        results = numpy_averages(record.values, record.starts)
+    else:
+        try:
+            results = array_averages(record.values, record.starts)
+        except OverflowError:
+            results = None
+    if results is None:
+        return python_tier_rows(prefix, record)
+    character_totals, character_averages, weapon_averages = results
+    character_rows = [
+        (*prefix, character_id, *totals, *averages)
+        for character_id, totals, averages in zip(
+            record.character_ids, character_totals, character_averages
+        )
+    ]
+    weapon_rows = [
+        (*prefix, *key, *weapon_stats, *averages, *extra)
+        for key, weapon_stats, averages, extra in zip(
+            record.keys, record.values, weapon_averages, record.extras
+        )
+    ]
+    return character_rows, weapon_rows
+
+
+def python_tier_rows(prefix, record):
+    """Build the tier rows one weapon at a time with Python integers.
+
+    Each weapon's totals feed both its own row and the character aggregate,
+    which matches ``aggregate_character``.
+    """
+    character_rows = []
+    weapon_rows = []
+    bounds = zip(record.starts, record.starts[1:])
+    for character_id, (start, end) in zip(record.character_ids, bounds):
+        count = 0
+        totals = [0] * len(SUM_FIELDS)
+        for key, weapon_stats, extra in zip(
+            record.keys[start:end], record.values[start:end], record.extras[start:end]
+        ):
+            weapon_count, *weapon_totals = weapon_stats
+            count += weapon_count
+            totals = [a + b for a, b in zip(totals, weapon_totals)]
+            weapon_rows.append(
+                (*prefix, *key, *derived_row(weapon_count, weapon_totals), *extra)
+            )
+        character_rows.append((*prefix, character_id, *derived_row(count, totals)))
+    return character_rows, weapon_rows
+
+
+# Rates that get sample-size-aware estimates, as offsets of their success
+# count from game_count in a stats row.
+ESTIMATED_RATES = (("win_rate", 1), ("top3_rate", 2))
+# Two-sided 95% normal quantile for the Wilson score intervals.
+WILSON_Z = 1.959963984540054
+
+
+def rate_prior(counts, successes):
+    """Fit a beta prior to the rates ``successes / counts`` of one tier.
+
+    Returns ``(mean, strength)``: the game-weighted tier rate and the prior's
+    pseudo-game count from the method of moments. The variance between rows
+    beyond what binomial noise alone explains sets the strength; None means
+    no variance is left, so every row is shrunk all the way to the mean.
+    """
+    total = sum(counts)
+    mean = sum(successes) / total
+    noise = mean * (1 - mean)
+    observed = (
+        math.fsum(
+            count * (success / count - mean) ** 2
+            for count, success in zip(counts, successes)
+        )
+        / total
+    )
+    spread = observed - noise * len(counts) / total
+    if spread <= 0 or noise <= 0:
+        return mean, None
+    return mean, max(noise / spread - 1, 0.0)
+
+
+def rate_estimates(counts, successes, engine=None):
+    """Return ``(shrunk, low, high)`` lists for the rates of one tier.
+
+    ``shrunk`` is the posterior mean under ``rate_prior``, and ``low`` and
+    ``high`` bound the Wilson score interval of the raw rate. The elementwise
+    work runs in one NumPy pass with the ``numpy`` engine and in plain Python
+    otherwise; both give the same floats.
+    """
+    mean, strength = rate_prior(counts, successes)
+    z2 = WILSON_Z * WILSON_Z
+    if (engine or DEFAULT_AGGREGATION_ENGINE) == "numpy":
+        n = numpy.array(counts, dtype=numpy.float64)
+        hits = numpy.array(successes, dtype=numpy.float64)
+        rate = hits / n
+        if strength is None:
+            shrunk = numpy.full(len(counts), mean)
+        else:
+            shrunk = (hits + strength * mean) / (n + strength)
+        scale = 1 + z2 / n
+        center = (rate + z2 / (2 * n)) / scale
+        half = WILSON_Z * numpy.sqrt(rate * (1 - rate) / n + z2 / (4 * n * n)) / scale
+        return shrunk.tolist(), (center - half).tolist(), (center + half).tolist()
+
+    shrunk = []
+    low = []
+    high = []
+    for count, success in zip(counts, successes):
+        n = float(count)
+        hits = float(success)
+        rate = hits / n
+        if strength is None:
+            shrunk.append(mean)
+        else:
+            shrunk.append((hits + strength * mean) / (n + strength))
+        scale = 1 + z2 / n
+        center = (rate + z2 / (2 * n)) / scale
+        half = WILSON_Z * math.sqrt(rate * (1 - rate) / n + z2 / (4 * n * n)) / scale
+        low.append(center - half)
+        high.append(center + half)
+    return shrunk, low, high
+
+
+def with_rate_estimates(rows, count_index, engine=None):
+    """Append the ``ESTIMATED_RATES`` columns to the stats ``rows`` of one
+    tier, whose game_count is at ``count_index``."""
+    if not rows:
+        return rows
+    counts = [row[count_index] for row in rows]
+    columns = []
+    for _, offset in ESTIMATED_RATES:
+        successes = [row[count_index + offset] for row in rows]
+        columns += rate_estimates(counts, successes, engine)
+    return [(*row, *values) for row, values in zip(rows, zip(*columns))]
+
+
+def snapshot_rows(dimension_key, tier_label, record):
+    """Return the ``tier_snapshots`` row and the character and weapon rows of
+    the tier in ``record``, ready for ``write_snapshot_rows``."""
+    character_rows, weapon_rows = tier_rows((dimension_key, record.tier_key), record)
+    character_rows = with_rate_estimates(character_rows, 3)
+    weapon_rows = with_rate_estimates(weapon_rows, 4)
+    tier_row = (
+        dimension_key,
+        record.tier_key,
+        tier_label,
+        record.tier_count,
+        record.updated_at,
+    )
+    return tier_row, character_rows, weapon_rows
+
+
+def write_snapshot_rows(conn, tier_row, character_rows, weapon_rows):
+    # An upsert keeps the tier's rowid, and with it the tier order, when an
+    # incremental update replaces an existing tier.
+    conn.execute(
+        """
+        INSERT INTO tier_snapshots (
+            dimension_key, tier_key, tier_label, game_count, source_updated_at
+        ) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (dimension_key, tier_key) DO UPDATE SET
+            tier_label = excluded.tier_label,
+            game_count = excluded.game_count,
+            source_updated_at = excluded.source_updated_at
+        """,
+        tier_row,
+    )
+    conn.executemany(
+        """
+        INSERT INTO character_stats VALUES (
+            ?, ?, ?,
+            ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            ?, ?, ?, ?, ?, ?
+        )
+        """,
+        character_rows,
+    )
+    conn.executemany(
+        """
+        INSERT INTO weapon_stats VALUES (
+            ?, ?, ?, ?,
+            ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+            ?, ?, ?, ?, ?, ?, ?, ?,
+            ?, ?, ?, ?, ?, ?
+        )
+        """,
+        weapon_rows,
+    )
+    return len(character_rows), len(weapon_rows)
+
+
+def insert_snapshot(conn, dimension_key, tier_label, record):
+    return write_snapshot_rows(conn, *snapshot_rows(dimension_key, tier_label, record))
+
+
+def apply_build_pragmas(conn, pragmas):
+    for name, value in (pragmas or DEFAULT_BUILD_PRAGMAS).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def rows_checksum(rows):
+    """Row count and sum of the ``CHECKSUM_COLUMNS`` of ``tier_rows`` rows."""
+    return len(rows), sum(sum(row[2:6]) for row in rows)
+
+
+def stored_checksums(conn, table):
+    columns = " + ".join(CHECKSUM_COLUMNS[table])
+    return {
+        (dimension_key, tier_key): (count, checksum)
+        for dimension_key, tier_key, count, checksum in conn.execute(
+            f"""
+            SELECT dimension_key, tier_key, COUNT(*), SUM({columns})
+            FROM {table}
+            GROUP BY dimension_key, tier_key
+            """
+        )
+    }
+
+
+def verify_database(conn, mode, expected):
+    """Raise RuntimeError unless ``conn`` passes the ``mode`` check.
+
+    ``full`` and ``quick`` run SQLite's integrity_check and quick_check.
+    ``counts`` compares the row count and checksum of every tier in
+    ``expected``, ``{(dimension_key, tier_key): {table: rows_checksum}}``,
+    with the stored rows.
+    """
+    if mode in ("full", "quick"):
+        pragma = "integrity_check" if mode == "full" else "quick_check"
+        result = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        if result != "ok":
+            raise RuntimeError(f"SQLite {pragma} failed: {result}")
+        return
+    for table in CHECKSUM_COLUMNS:
+        stored = stored_checksums(conn, table)
+        for key, checksums in expected.items():
+            if stored.get(key, (0, None)) != checksums[table]:
+                raise RuntimeError(
+                    f"{table} of {'/'.join(key)} does not match its payload:"
+                    f" {stored.get(key)} != {checksums[table]}"
+                )
+
+
+TierSummary = namedtuple(
+    "TierSummary", "tier_key tier_label updated_at game_count patches"
+)
+
+
+def summarize_tier(tier_label, record):
+    """Keep the few fields the collection metadata needs from a record."""
+    return TierSummary(
+        record.tier_key,
+        tier_label,
+        record.updated_at,
+        record.tier_count,
+        record.patches,
+    )
+
+
+def delete_tier_stats(conn, dimension_key, tier_key):
+    for table in ("weapon_stats", "character_stats"):
+        conn.execute(
+            f"DELETE FROM {table} WHERE dimension_key = ? AND tier_key = ?",
+            (dimension_key, tier_key),
+        )
+
+
+def delete_dimension(conn, dimension_key):
+    for table in (
+        "weapon_stats",
+        "character_stats",
+        "tier_snapshots",
+        "collection_meta",
+    ):
+        conn.execute(f"DELETE FROM {table} WHERE dimension_key = ?", (dimension_key,))
+
+
+def collection_values(summaries, period_days):
+    updated_values = [summary.updated_at for summary in summaries]
+    patches = summaries[0].patches
+    return (
+        period_days,
+        patches[0] if len(patches) > 0 else None,
+        patches[1] if len(patches) > 1 else None,
+        min(updated_values),
+        max(updated_values),
+        len(summaries),
+    )
+
+
+def write_collection_meta(conn, dimension, summaries, source_url=API_URL):
+    (
+        period_days,
+        current_patch,
+        previous_patch,
+        updated_min,
+        updated_max,
+        tier_count,
+    ) = collection_values(summaries, dimension.period_days)
+    collected_at = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO collection_meta
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            dimension.key,
+            source_url,
+            collected_at,
+            period_days,
+            dimension.matching_mode,
+            dimension.team_mode,
+            current_patch,
+            previous_patch,
+            updated_min,
+            updated_max,
+            tier_count,
+        ),
+    )
+
+
+def stored_tier_versions(db_path):
+    """Return ``{(dimension_key, tier_key): source_updated_at}`` when
+    ``db_path`` can be updated in place, or None when it needs a full
+    rebuild."""
+    if not db_path.exists():
+        return None
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                return None
+            return {
+                (dimension_key, tier_key): updated_at
+                for dimension_key, tier_key, updated_at in conn.execute(
+                    """
+                    SELECT dimension_key, tier_key, source_updated_at
+                    FROM tier_snapshots
+                    """
+                )
+            }
+    except sqlite3.DatabaseError:
+        return None
+
+
+def ordered_summaries(summaries):
+    order = {tier_key: index for index, (tier_key, _) in enumerate(TIERS)}
+    return sorted(
+        summaries.values(),
+        key=lambda summary: order.get(summary.tier_key, len(order)),
+    )
+
+
+class StagingDatabase:
+    """Temporary database that tiers are written to as they arrive.
+
+    In incremental mode an existing compatible database is copied and only
+    tiers whose ``source_updated_at`` changed are rewritten; otherwise every
+    tier is loaded into a fresh schema. The rows of a dimension are built as
+    its tiers arrive and written in one transaction by ``commit_dimension``,
+    once the dimension is complete. ``publish`` commits the remaining
+    dimensions, removes the ones that were not collected, and checks the
+    database (``verify``) before it atomically replaces ``db_path``.
+
+    The ``file`` backend builds in a temporary file next to ``db_path``. The
+    ``memory`` backend builds in ``:memory:`` and writes the finished database
+    to that file with ``VACUUM INTO``, or the backup API on SQLite before
+    3.27, so the file is written once, compactly. Leaving the context without
+    publishing discards the database, which is only created when the first
+    tier is added. ``source_url`` is recorded as the endpoint the tiers came
+    from.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        incremental=True,
+        pragmas=None,
+        metrics=NULL_METRICS,
+        backend="file",
+        verify="full",
+        source_url=API_URL,
+    ):
+        self.db_path = db_path
+        self.temp_path = db_path.with_name(f".{db_path.name}.tmp")
+        self.incremental = incremental
+        self.pragmas = pragmas
+        self.metrics = metrics
+        self.backend = backend
+        self.verify = verify
+        self.source_url = source_url
+        self.conn = None
+        self.stored_versions = None
+        self.summaries = {}
+        self.pending = {}
+        self.expected = {}
+        self.changed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.discard()
+
+    def open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.temp_path.unlink(missing_ok=True)
+        if self.incremental:
+            self.stored_versions = stored_tier_versions(self.db_path)
+        self.conn = sqlite3.connect(
+            ":memory:" if self.backend == "memory" else self.temp_path
+        )
+        if self.stored_versions is None:
+            apply_build_pragmas(self.conn, self.pragmas)
+            self.conn.executescript(SCHEMA)
+        else:
+            with closing(sqlite3.connect(self.db_path)) as source:
+                source.backup(self.conn)
+            apply_build_pragmas(self.conn, self.pragmas)
+            self.conn.execute("PRAGMA foreign_keys = ON")
+
+    def add_tier(self, dimension, tier_label, record):
+        """Stage the ``TierRecord`` of one tier of ``dimension``."""
+        if self.conn is None:
+            self.open()
+        tier_key = record.tier_key
+        summary = summarize_tier(tier_label, record)
+        if (
+            self.stored_versions is not None
+            and self.stored_versions.get((dimension.key, tier_key))
+            == summary.updated_at
+        ):
+            rows = None
+        else:
+            with self.metrics.span("aggregate", tier=tier_key, dimension=dimension.key):
+                rows = snapshot_rows(dimension.key, tier_label, record)
+        self.pending.setdefault(dimension, []).append((tier_key, tier_label, rows))
+        self.summaries.setdefault(dimension, {})[tier_key] = summary
+        return summary
+
+    def commit_dimension(self, dimension):
+        """Write the tiers of ``dimension`` and its collection metadata in one
+        transaction."""
+        tiers = self.pending.pop(dimension, [])
+        if not tiers:
+            return
+        summaries = ordered_summaries(self.summaries[dimension])
+        with self.metrics.span("insert", dimension=dimension.key), self.conn:
+            for tier_key, tier_label, rows in tiers:
+                if rows is None:
+                    self.conn.execute(
+                        """
+                        UPDATE tier_snapshots SET tier_label = ?
+                        WHERE dimension_key = ? AND tier_key = ?
+                        """,
+                        (tier_label, dimension.key, tier_key),
+                    )
+                    continue
+                delete_tier_stats(self.conn, dimension.key, tier_key)
+                character_count, weapon_count = write_snapshot_rows(self.conn, *rows)
+                self.metrics.count("rows", character_count, table="character_stats")
+                self.metrics.count("rows", weapon_count, table="weapon_stats")
+                if self.verify == "counts":
+                    self.expected[(dimension.key, tier_key)] = {
+                        "character_stats": rows_checksum(rows[1]),
+                        "weapon_stats": rows_checksum(rows[2]),
+                    }
+                self.changed.append(f"{dimension.key}/{tier_key}")
+            for dimension_key, tier_key in self.stored_versions or ():
+                if (
+                    dimension_key == dimension.key
+                    and tier_key not in self.summaries[dimension]
+                ):
+                    delete_tier_stats(self.conn, dimension_key, tier_key)
+                    self.conn.execute(
+                        """
+                        DELETE FROM tier_snapshots
+                        WHERE dimension_key = ? AND tier_key = ?
+                        """,
+                        (dimension_key, tier_key),
+                    )
+                    self.changed.append(f"{dimension_key}/{tier_key}")
+            write_collection_meta(self.conn, dimension, summaries, self.source_url)
+
+    def dimension_summaries(self):
+        return {
+            dimension: ordered_summaries(summaries)
+            for dimension, summaries in self.summaries.items()
+        }
+
+    def publish(self):
+        with self.metrics.span("publish"):
+            self.publish_database()
+
+    def publish_database(self):
+        try:
+            for dimension in list(self.pending):
+                self.commit_dimension(dimension)
+            collected = {dimension.key for dimension in self.summaries}
+            with self.conn:
+                if self.stored_versions is None:
+                    for statement in INDEXES:
+                        self.conn.execute(statement)
+                else:
+                    stored = {key for key, _ in self.stored_versions}
+                    for dimension_key in sorted(stored - collected):
+                        delete_dimension(self.conn, dimension_key)
+                        self.changed.append(dimension_key)
+            self.conn.execute("PRAGMA optimize")
+            with self.metrics.span("integrity_check", mode=self.verify):
+                verify_database(self.conn, self.verify, self.expected)
+            with self.metrics.span("write", backend=self.backend):
+                self.write_out()
+            os.replace(self.temp_path, self.db_path)
+        finally:
+            self.discard()
+
+        tier_count = sum(len(summaries) for summaries in self.summaries.values())
+        if self.stored_versions is None:
+            print(
+                f"rebuilt database with {tier_count} tiers"
+                f" in {len(self.summaries)} dimensions"
+            )
+        else:
+            print(
+                f"updated {len(self.changed)} of {tier_count} tiers"
+                " incrementally"
+                + (f": {', '.join(self.changed)}" if self.changed else "")
+            )
+
+    def write_out(self):
+        if self.backend == "memory":
+            self.temp_path.unlink(missing_ok=True)
+            if sqlite3.sqlite_version_info >= (3, 27):
+                self.conn.execute("VACUUM INTO ?", (str(self.temp_path),))
+            else:
+                with closing(sqlite3.connect(self.temp_path)) as target:
+                    self.conn.backup(target)
+        self.conn.close()
+        self.conn = None
+        fsync_file(self.temp_path)
+
+    def discard(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.temp_path.unlink(missing_ok=True)
+
+
+def build_database(
+    db_path,
+    payloads,
+    period_days,
+    incremental=True,
+    pragmas=None,
+    dimension=None,
+    backend="file",
+    verify="full",
+):
+    """Decode and write ``(tier_key, tier_label, payload)`` items of one
+    dimension to ``db_path``; the default is the RANK/SQUAD dimension of
+    ``period_days``."""
+    dimension = dimension or DEFAULT_DIMENSION._replace(period_days=period_days)
+    with StagingDatabase(
+        db_path, incremental, pragmas, backend=backend, verify=verify
+    ) as staging:
+        for tier_key, tier_label, payload in payloads:
+            staging.add_tier(
+                dimension, tier_label, decode_tier(payload, tier_key, dimension)
+            )
+        staging.publish()
+
+
+def database_is_current(db_path, summaries):
+    """Whether ``db_path`` holds exactly the ``{dimension: [TierSummary]}``
+    collections in ``summaries``."""
+    if not db_path.exists():
+        return False
+
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                return False
+            rows = {
+                row[0]: row[1:]
+                for row in conn.execute(
+                    """
+                    SELECT
+                        dimension_key,
+                        period_days,
+                        current_patch,
+                        previous_patch,
+                        source_updated_at_min,
+                        source_updated_at_max,
+                        tier_count
+                    FROM collection_meta
+                    """
+                )
+            }
+    except sqlite3.DatabaseError:
+        return False
+    return rows == {
+        dimension.key: collection_values(tiers, dimension.period_days)
+        for dimension, tiers in summaries.items()
+    }
+
+
+def append_history_rows(conn, table, source, keys, columns, snapshot_id, previous_id):
+    """Carry unchanged rows of ``previous_id`` forward and add new versions."""
+    matches = " AND ".join(
+        f"c.{column} IS {table}.{column}" for column in (*keys, *columns)
+    )
+    conn.execute(
+        f"""
+        UPDATE {table} SET last_snapshot_id = ?
+        WHERE last_snapshot_id = ?
+            AND EXISTS (SELECT 1 FROM {source} c WHERE {matches})
+        """,
+        (snapshot_id, previous_id),
+    )
+    selected = ", ".join(f"c.{column}" for column in (*keys, *columns))
+    same_key = " AND ".join(f"h.{key} = c.{key}" for key in keys)
+    return conn.execute(
+        f"""
+        INSERT INTO {table} (
+            first_snapshot_id, last_snapshot_id, {", ".join((*keys, *columns))}
+        )
+        SELECT ?, ?, {selected}
+        FROM {source} c
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table} h
+            WHERE {same_key} AND h.last_snapshot_id = ?
+        )
+        """,
+        (snapshot_id, snapshot_id, snapshot_id),
+    ).rowcount
+
+
+def compact_history(conn, retention_days, compaction):
+    """Reduce the snapshots of each dimension older than the retention window
+    to one per day or patch and drop row versions no remaining snapshot
+    refers to."""
+    cutoff = (
+        (datetime.now(timezone.utc) - timedelta(days=retention_days))
+        .replace(microsecond=0)
+        .isoformat()
+    )
+    bucket = (
+        "substr(collected_at, 1, 10)"
+        if compaction == "daily"
+        else "coalesce(current_patch, -1)"
+    )
+    removed = conn.execute(
+        f"""
+        DELETE FROM snapshots
+        WHERE collected_at < :cutoff
+            AND snapshot_id NOT IN (
+                SELECT MAX(snapshot_id) FROM snapshots GROUP BY dimension_key
+            )
+            AND snapshot_id NOT IN (
+                SELECT MAX(snapshot_id)
+                FROM snapshots
+                WHERE collected_at < :cutoff
+                GROUP BY dimension_key, {bucket}
+            )
+        """,
+        {"cutoff": cutoff},
+    ).rowcount
+    conn.execute(
+        """
+        UPDATE snapshots SET granularity = ?
+        WHERE collected_at < ? AND granularity = 'raw'
+        """,
+        (compaction, cutoff),
+    )
+    if not removed:
+        return 0
+    conn.execute(
+        """
+        DELETE FROM tier_history
+        WHERE snapshot_id NOT IN (SELECT snapshot_id FROM snapshots)
+        """
+    )
+    for table in ("character_history", "weapon_history"):
+        conn.execute(
+            f"""
+            DELETE FROM {table}
+            WHERE NOT EXISTS (
+                SELECT 1 FROM snapshots s
+                WHERE s.dimension_key = {table}.dimension_key
+                    AND s.snapshot_id
+                    BETWEEN {table}.first_snapshot_id AND {table}.last_snapshot_id
+            )
+            """
+        )
+    return removed
+
+
+def migrate_history(conn, dimension_key):
+    """Key a version 1 history database, which held the snapshots of one
+    dimension, by ``dimension_key``."""
+    tables = ("snapshots", "character_history", "weapon_history")
+    columns = {
+        table: ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+        for table in tables
+    }
+    literal = "'" + dimension_key.replace("'", "''") + "'"
+    conn.executescript(
+        "BEGIN;\n"
+        "DROP VIEW character_trend;\n"
+        "DROP VIEW weapon_trend;\n"
+        "DROP INDEX idx_character_history_last;\n"
+        "DROP INDEX idx_weapon_history_last;\n"
+        + "".join(f"ALTER TABLE {table} RENAME TO {table}_v1;\n" for table in tables)
+        + HISTORY_SCHEMA
+        + "".join(
+            f"INSERT INTO {table} (dimension_key, {columns[table]})"
+            f" SELECT {literal}, {columns[table]} FROM {table}_v1;\n"
+            f"DROP TABLE {table}_v1;\n"
+            for table in tables
+        )
+        + "COMMIT;"
+    )
+
+
+def append_history_snapshot(conn, dimension):
+    """Add a snapshot of the ``dimension`` collection in the attached
+    ``current`` database and return ``(snapshot_id, character versions,
+    weapon versions)``, or None when its latest snapshot already has the same
+    ``collected_at`` or the database does not hold the dimension."""
+    meta = conn.execute(
+        """
+        SELECT
+            collected_at, period_days, matching_mode, team_mode,
+            current_patch, previous_patch, source_updated_at_min,
+            source_updated_at_max, tier_count
+        FROM current.collection_meta
+        WHERE dimension_key = ?
+        """,
+        (dimension.key,),
+    ).fetchone()
+    latest = conn.execute(
+        """
+        SELECT snapshot_id, collected_at
+        FROM snapshots
+        WHERE dimension_key = ?
+        ORDER BY snapshot_id DESC
+        LIMIT 1
+        """,
+        (dimension.key,),
+    ).fetchone()
+    if meta is None or (latest and latest[1] == meta[0]):
+        return None
+    previous_id = latest[0] if latest else None
+
+    snapshot_id = conn.execute(
+        """
+        INSERT INTO snapshots (
+            dimension_key, collected_at, period_days, matching_mode, team_mode,
+            current_patch, previous_patch, source_updated_at_min,
+            source_updated_at_max, tier_count
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (dimension.key, *meta),
+    ).lastrowid
+    dimension_literal = "'" + dimension.key.replace("'", "''") + "'"
+    for table in ("tier_snapshots", "character_stats", "weapon_stats"):
+        conn.execute(
+            f"""
+            CREATE TEMP VIEW dimension_{table} AS
+            SELECT * FROM current.{table}
+            WHERE dimension_key = {dimension_literal}
+            """
+        )
+    conn.execute(
+        """
+        INSERT INTO tier_history
+        SELECT ?, tier_key, tier_label, game_count, source_updated_at
+        FROM dimension_tier_snapshots
+        """,
+        (snapshot_id,),
+    )
+    characters = append_history_rows(
+        conn,
+        "character_history",
+        "dimension_character_stats",
+        ("dimension_key", "character_id", "tier_key"),
+        HISTORY_CHARACTER_COLUMNS,
+        snapshot_id,
+        previous_id,
+    )
+    weapons = append_history_rows(
+        conn,
+        "weapon_history",
+        "dimension_weapon_stats",
+        ("dimension_key", "character_id", "weapon_id", "tier_key"),
+        HISTORY_WEAPON_COLUMNS,
+        snapshot_id,
+        previous_id,
+    )
+    for table in ("tier_snapshots", "character_stats", "weapon_stats"):
+        conn.execute(f"DROP VIEW dimension_{table}")
+    return snapshot_id, characters, weapons
+
+
+def record_history(
+    history_path,
+    db_path,
+    retention_days,
+    compaction,
+    dimensions=(DEFAULT_DIMENSION,),
+):
+    """Append the collection of every dimension in ``dimensions`` in
+    ``db_path`` to the history database.
+
+    A dimension whose latest history snapshot already has the same
+    ``collected_at`` is skipped, so it is safe to call after every run. A
+    version 1 history database is migrated first; its snapshots are taken to
+    be of the first dimension, the only one it recorded.
+    """
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(history_path)) as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 1:
+            migrate_history(conn, dimensions[0].key)
+        conn.executescript(HISTORY_SCHEMA)
+        conn.execute("ATTACH DATABASE ? AS current", (str(db_path),))
+        added = []
+        removed = 0
+        with conn:
+            for dimension in dimensions:
+                counts = append_history_snapshot(conn, dimension)
+                if counts is not None:
+                    added.append((dimension, *counts))
+            if added:
+                removed = compact_history(conn, retention_days, compaction)
+        conn.execute("DETACH DATABASE current")
+    for dimension, snapshot_id, characters, weapons in added:
+        print(
+            f"history snapshot {snapshot_id} of {dimension.key}: {characters}"
+            f" character and {weapons} weapon row versions added"
+        )
+    if removed:
+        print(f"{removed} old history snapshots compacted")
+
+
+def print_summary(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        tiers = conn.execute("SELECT COUNT(*) FROM tier_snapshots").fetchone()[0]
+        characters = conn.execute("SELECT COUNT(*) FROM character_stats").fetchone()[0]
+        weapons = conn.execute("SELECT COUNT(*) FROM weapon_stats").fetchone()[0]
+        games = conn.execute("SELECT SUM(game_count) FROM tier_snapshots").fetchone()[0]
+        dimensions = conn.execute(
+            "SELECT dimension_key, current_patch FROM collection_meta ORDER BY rowid"
+        ).fetchall()
+    print(f"database: {db_path}")
+    print(f"patch: {dimensions[0][1]}")
+    print(f"dimensions: {', '.join(key for key, _ in dimensions)}")
+    print(f"tiers: {tiers}")
+    print(f"tier game samples: {games:,}")
+    print(f"character rows: {characters}")
+    print(f"weapon rows: {weapons}")
+
+
+def artifact_value(value, digits):
+    """``value`` rounded to ``digits``; 0 digits gives an integer."""
+    if digits is None or value is None:
+        return value
+    return round(value, digits) if digits else round(value)
+
+
+def quantile(values, q):
+    """The ``q``-th percentile of sorted ``values``, interpolated linearly."""
+    position = (len(values) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def tier_metrics(rows):
+    """Summary of every exported character metric of one tier.
+
+    Each metric gets the game-weighted mean and standard deviation over the
+    tier's characters and the ``METRIC_QUANTILES`` of their values. A
+    character's percentile rank and z-score follow from these and the tier's
+    character entries, so runtimes derive them instead of downloading them.
+    """
+    total = sum(row["game_count"] for row in rows)
+    metrics = {}
+    for name, column, digits, _ in ARTIFACT_FIELDS:
+        if column not in AVERAGE_SUMS or not total:
+            continue
+        values = sorted(row[column] for row in rows)
+        mean = sum(row["game_count"] * row[column] for row in rows) / total
+        stddev = math.sqrt(
+            sum(row["game_count"] * (row[column] - mean) ** 2 for row in rows) / total
+        )
+        metrics[name] = {
+            "mean": artifact_value(mean, digits),
+            "stddev": artifact_value(stddev, digits),
+            **{
+                f"p{q}": artifact_value(quantile(values, q), digits)
+                for q in METRIC_QUANTILES
+            },
+        }
+    return metrics
+
+
+def weapon_baselines(rows):
+    """``{character_id: {weapon_id: fields}}`` from ``weapon_stats`` rows."""
+    weapons = {}
+    for row in rows:
+        weapons.setdefault(str(row["character_id"]), {})[str(row["weapon_id"])] = {
+            name: artifact_value(row[column], digits)
+            for name, column, digits, _ in WEAPON_ARTIFACT_FIELDS
+            if row[column] is not None
+        }
+    return weapons
+
+
+def rollup_rows(conn, table, keys, fields, dimension_key, tier_keys):
+    """Game-weighted totals of ``table`` over ``tier_keys`` grouped by
+    ``keys``, as ``{key: {name: value}}`` nested one level per key."""
+    rolled = [(name, column, digits) for name, column, digits, *_ in fields]
+    sums = [
+        f"SUM({AVERAGE_SUMS[column]})"
+        for _, column, _ in rolled
+        if column in AVERAGE_SUMS
+    ]
+    placeholders = ", ".join("?" for _ in tier_keys)
+    result = {}
+    for row in conn.execute(
+        f"""
+        SELECT {", ".join(keys)}, SUM(game_count), {", ".join(sums)}
+        FROM {table}
+        WHERE dimension_key = ? AND tier_key IN ({placeholders})
+        GROUP BY {", ".join(keys)}
+        ORDER BY {", ".join(keys)}
+        """,
+        (dimension_key, *tier_keys),
+    ):
+        games = row[len(keys)]
+        totals = iter(row[len(keys) + 1 :])
+        entry = {}
+        for name, column, digits in rolled:
+            if column == "game_count":
+                entry[name] = games
+            elif column in AVERAGE_SUMS:
+                entry[name] = artifact_value(next(totals) / games, digits)
+        target = result
+        for key in row[: len(keys) - 1]:
+            target = target.setdefault(str(key), {})
+        target[str(row[len(keys) - 1])] = entry
+    return result
+
+
+def release_artifact(db_path, character_metadata, dimension_key=None):
+    dimension_key = dimension_key or DEFAULT_DIMENSION.key
     with closing(sqlite3.connect(db_path)) as conn:
         conn.row_factory = sqlite3.Row
-        meta = dict(conn.execute("SELECT * FROM collection_meta WHERE id = 1").fetchone())
+        meta = dict(
+            conn.execute(
+                "SELECT * FROM collection_meta WHERE dimension_key = ?",
+                (dimension_key,),
+            ).fetchone()
+        )
         tiers = {}
         tier_rows = conn.execute(
             """
             SELECT tier_key, tier_label, game_count, source_updated_at
             FROM tier_snapshots
+            WHERE dimension_key = ?
             ORDER BY rowid
-            """
+            """,
+            (dimension_key,),
         ).fetchall()
+        columns = ", ".join(column for _, column, _, _ in ARTIFACT_FIELDS)
         for tier in tier_rows:
             tier_characters = {}
             rows = conn.execute(
-                """
-                SELECT
-                    character_id,
-                    game_count,
-                    win_rate,
-                    top3_rate,
-                    average_placement,
-                    average_damage_to_player,
-                    average_mmr_gain,
-                    average_team_kills,
-                    average_player_kills,
-                    average_player_assists,
-                    average_player_deaths,
-                    average_view_contribution
+                f"""
+                SELECT character_id, {columns}
                 FROM character_stats
-                WHERE tier_key = ?
+                WHERE dimension_key = ? AND tier_key = ?
                 ORDER BY character_id
                 """,
-                (tier["tier_key"],),
+                (dimension_key, tier["tier_key"]),
             ).fetchall()
             for row in rows:
                 tier_characters[str(row["character_id"])] = {
-                    "games": row["game_count"],
-                    "winRate": round(row["win_rate"], 7),
-                    "top3Rate": round(row["top3_rate"], 7),
-                    "averagePlacement": round(row["average_placement"], 5),
-                    "averageDamage": round(row["average_damage_to_player"], 2),
-                    "averageMmrGain": round(row["average_mmr_gain"], 4),
-                    "averageTeamKills": round(row["average_team_kills"], 4),
-                    "averagePlayerKills": round(row["average_player_kills"], 4),
-                    "averagePlayerAssists": round(row["average_player_assists"], 4),
-                    "averagePlayerDeaths": round(row["average_player_deaths"], 4),
-                    "averageViewContribution": round(
-                        row["average_view_contribution"], 4
-                    ),
+                    name: artifact_value(row[column], digits)
+                    for name, column, digits, _ in ARTIFACT_FIELDS
+                }
+            tiers[tier["tier_key"]] = {
+                "label": tier["tier_label"],
+                "games": tier["game_count"],
+                "updatedAt": tier["source_updated_at"],
+                "characters": tier_characters,
+                "metrics": tier_metrics(rows),
+            }
+
+        rollup_tiers = [
+            tier["tier_key"] for tier in tier_rows if tier["tier_key"] in ROLLUP_TIERS
+        ]
+        all_tiers = None
+        if rollup_tiers:
+            all_tiers = {
+                "tiers": rollup_tiers,
+                "games": sum(tiers[key]["games"] for key in rollup_tiers),
+                "characters": rollup_rows(
+                    conn,
+                    "character_stats",
+                    ("character_id",),
+                    ARTIFACT_FIELDS,
+                    dimension_key,
+                    rollup_tiers,
+                ),
+            }
+
+    artifact = {
+        "schemaVersion": 1,
+        "source": meta["source_url"],
+        "collectedAt": meta["collected_at"],
+        "periodDays": meta["period_days"],
+        "matchingMode": meta["matching_mode"],
+        "teamMode": meta["team_mode"],
+        "currentPatch": meta["current_patch"],
+        "previousPatch": meta["previous_patch"],
+        "sourceUpdatedAtMin": meta["source_updated_at_min"],
+        "sourceUpdatedAtMax": meta["source_updated_at_max"],
+        "characters": character_metadata,
+        "tiers": tiers,
+    }
+    if all_tiers is not None:
+        artifact["allTiers"] = all_tiers
+    return artifact
+
+
+def release_weapons(db_path, dimension_key=None):
+    """The weapon baselines of one dimension, which only the shards carry:
+    ``{"tiers": {tier_key: weapons}, "allTiers": weapons}``, the latter
+    present when the dimension has ``ROLLUP_TIERS``."""
+    dimension_key = dimension_key or DEFAULT_DIMENSION.key
+    columns = ", ".join(column for _, column, _, _ in WEAPON_ARTIFACT_FIELDS)
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.row_factory = sqlite3.Row
+        tier_keys = [
+            tier_key
+            for (tier_key,) in conn.execute(
+                "SELECT tier_key FROM tier_snapshots WHERE dimension_key = ?"
+                " ORDER BY rowid",
+                (dimension_key,),
+            )
+        ]
+        tiers = {}
+        for tier_key in tier_keys:
+            tiers[tier_key] = weapon_baselines(
+                conn.execute(
+                    f"""
+                    SELECT character_id, weapon_id, {columns}
+                    FROM weapon_stats
+                    WHERE dimension_key = ? AND tier_key = ?
+                    ORDER BY character_id, weapon_id
+                    """,
+                    (dimension_key, tier_key),
+                )
+            )
+        weapons = {"tiers": tiers}
+        rollup_tiers = [tier_key for tier_key in tier_keys if tier_key in ROLLUP_TIERS]
+        if rollup_tiers:
+            weapons["allTiers"] = rollup_rows(
+                conn,
+                "weapon_stats",
+                ("character_id", "weapon_id"),
+                WEAPON_ARTIFACT_FIELDS,
+                dimension_key,
+                rollup_tiers,
+            )
+    return weapons
+
+
+def encode_artifact(artifact):
+    return json.dumps(
+        artifact, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+    ).encode("utf-8")
+
+
+def available_codecs():
+    codecs = ["gzip", "zlib"]
+    if zstd is not None or zstandard is not None:
+        codecs.append("zstd")
+    if brotli is not None:
+        codecs.append("brotli")
+    return codecs
+
+
+def parse_codec(spec):
+    """``gzip``, ``zlib:6``, ... -> ``Codec``; the level defaults to the
+    highest one."""
+    name, _, level = spec.lower().partition(":")
+    if name not in CODEC_LEVELS:
+        raise ValueError(
+            f"unknown codec {name!r}; expected one of {', '.join(CODEC_LEVELS)}"
+        )
+    if name not in available_codecs():
+        raise ValueError(f"codec {name!r} needs a module that is not installed")
+    low, high = CODEC_LEVELS[name]
+    try:
+        level = int(level) if level else high
+    except ValueError:
+        raise ValueError(f"codec level must be an integer, not {level!r}") from None
+    if not low <= level <= high:
+        raise ValueError(f"{name} levels range from {low} to {high}")
+    return Codec(name, level)
+
+
+def compress(data, codec=DEFAULT_CODEC, dictionary=None):
+    """Compress ``data``; only zlib takes a preset ``dictionary``."""
+    name, level = codec
+    if dictionary is not None and name != "zlib":
+        raise ValueError(f"{name} does not take a preset dictionary")
+    if name == "gzip":
+        return gzip.compress(data, level, mtime=0)
+    if name == "zlib":
+        if dictionary is None:
+            compressor = zlib.compressobj(level)
+        else:
+            compressor = zlib.compressobj(level, zdict=dictionary)
+        return compressor.compress(data) + compressor.flush()
+    if name == "zstd":
+        if zstd is not None:
+            return zstd.compress(data, level)
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if name == "brotli":
+        return brotli.compress(data, quality=level)
+    raise ValueError(f"unknown codec {name!r}")
+
+
+def sniff_codec(data):
+    """The codec of ``data`` from its header; brotli has none and must be
+    named."""
+    if data[:2] == b"\x1f\x8b":
+        return "gzip"
+    if data[:4] == ZSTD_MAGIC:
+        return "zstd"
+    if len(data) > 1 and data[0] & 0x0F == 8 and (data[0] << 8 | data[1]) % 31 == 0:
+        return "zlib"
+    raise ValueError("unrecognized compressed data")
+
+
+def decompress(data, codec=None, dictionary=None):
+    """Decompress ``data`` written by ``compress``. ``codec`` is a name, and
+    is read from the header when omitted. Every failure is a ValueError."""
+    try:
+        name = codec or sniff_codec(data)
+        if name == "gzip":
+            return gzip.decompress(data)
+        if name == "zlib":
+            if dictionary is None:
+                return zlib.decompress(data)
+            decompressor = zlib.decompressobj(zdict=dictionary)
+            return decompressor.decompress(data) + decompressor.flush()
+        if name == "zstd" and zstd is not None:
+            return zstd.decompress(data)
+        if name == "zstd" and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(data)
+        if name == "brotli" and brotli is not None:
+            return brotli.decompress(data)
+    except DECODE_ERRORS as exc:
+        raise ValueError(f"cannot decompress {codec or 'the'} data: {exc}") from exc
+    raise ValueError(f"codec {name!r} is not available")
+
+
+def build_dictionary(samples, size=DICTIONARY_SIZE, chunk=DICTIONARY_CHUNK):
+    """A zlib preset dictionary of up to ``size`` bytes, made of
+    ``chunk``-byte slices spread evenly over ``samples`` (encoded earlier
+    artifacts), so it holds the field names and typical values of every
+    section."""
+    data = b"".join(samples)
+    step = max(chunk, len(data) // max(1, size // chunk))
+    slices = [data[start : start + chunk] for start in range(0, len(data), step)]
+    return b"".join(slices)[-size:]
+
+
+def codec_entry(codec, dictionary_entry=None):
+    """How a release file was compressed, as recorded next to its entry."""
+    entry = {"name": codec.name, "level": codec.level}
+    if dictionary_entry is not None:
+        entry["dictionary"] = dictionary_entry
+    return entry
+
+
+def write_compressed(path, data, codec=DEFAULT_CODEC, dictionary=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, compress(data, codec, dictionary))
+
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def ref(self, value):
+        if value is None:
+            return NO_STRING
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+
+def decoded_value(value, digits, code):
+    """A value read from a ``code`` section as the JSON artifact has it."""
+    if code in "IS" or digits is None:
+        return value
+    return int(value) if digits <= 0 else round(value, digits)
+
+
+def fits_columnar(value, digits, code):
+    """Whether ``value`` comes back from a ``code`` section unchanged, type
+    included, so the artifact keeps its content hash."""
+    kind = type(value)
+    if code == "S":
+        return kind is str
+    if code == "I":
+        return kind is int and 0 <= value < NO_STRING
+    if kind is not float and kind is not int or not math.isfinite(value):
+        return False
+    if code == "f":
+        try:
+            stored = FLOAT32.unpack(FLOAT32.pack(value))[0]
+        except OverflowError:
+            return False
+    else:
+        stored = value
+    if digits is None or digits <= 0:
+        return kind is int and int(stored) == value
+    return kind is float and round(stored, digits) == value
+
+
+def id_key(key):
+    return isinstance(key, str) and key.isdigit() and str(int(key)) == key
+
+
+def row_table_fields(entries, fields):
+    """The ``fields`` that ``entries`` use, or None when an entry lacks
+    ``games`` or has a field or value that the row sections cannot hold."""
+    specs = {name: (digits, code) for name, digits, code in fields}
+    used = {"games"}
+    for entry in entries:
+        if not isinstance(entry, dict) or "games" not in entry:
+            return None
+        for key, value in entry.items():
+            if key not in specs or not fits_columnar(value, *specs[key]):
+                return None
+            used.add(key)
+    return [field for field in fields if field[0] in used]
+
+
+def nested_rows(table, depth, inner=False):
+    """``[(int keys, entry)]`` of a table nested ``depth`` levels by id, or
+    None when it has other keys or empty inner levels."""
+    if depth == 0:
+        return [((), table)]
+    if not isinstance(table, dict) or (inner and not table):
+        return None
+    rows = []
+    for key, value in table.items():
+        nested = nested_rows(value, depth - 1, True) if id_key(key) else None
+        if nested is None:
+            return None
+        rows += [((int(key), *keys), entry) for keys, entry in nested]
+    return rows
+
+
+def row_sections(prefix, keys, rows, fields, strings):
+    """Sections of a row table: a uint32 column per key and a typed column
+    per field, NaN or ``NO_STRING`` where an entry lacks the field."""
+    sections = [
+        (f"{prefix}.{key}", "I", [row_keys[index] for row_keys, _ in rows])
+        for index, key in enumerate(keys)
+    ]
+    for name, digits, code in fields:
+        if code == "S":
+            values = [strings.ref(entry.get(name)) for _, entry in rows]
+        else:
+            values = [entry.get(name, NAN) for _, entry in rows]
+        sections.append((f"{prefix}.{name}", code, values, digits))
+    return sections
+
+
+def tier_metrics_fit(metrics):
+    if not isinstance(metrics, dict):
+        return False
+    for name, table in metrics.items():
+        digits = METRIC_DIGITS.get(name)
+        if (
+            name not in METRIC_DIGITS
+            or not isinstance(table, dict)
+            or set(table) != set(METRIC_TABLES)
+            or not all(fits_columnar(value, digits, "d") for value in table.values())
+        ):
+            return False
+    return True
+
+
+def encode_columnar_artifact(artifact):
+    """Encode ``artifact`` in the schemaVersion 2 columnar layout.
+
+    The file is a fixed header, a section directory and 8-byte aligned
+    little-endian sections. Strings are interned in one table, tier and
+    character metadata are parallel arrays of string references, and every
+    character field is a tier-major ``tiers x characters`` typed matrix in
+    which absent characters have 0 games and NaN values. Only the
+    ``ARTIFACT_FIELDS`` that every character has get a matrix, so artifacts
+    from before a field was added still encode. The tier ``metrics`` become
+    per-tier sections and the ``allTiers`` character rollup a row table.
+    Anything outside that layout is kept in a JSON ``extras`` section, so
+    decoding always returns the JSON form.
+    """
+    strings = StringTable()
+    tiers = artifact["tiers"]
+    tier_keys = list(tiers)
+    character_ids = sorted(
+        {int(key) for tier in tiers.values() for key in tier["characters"]}
+    )
+    metadata_ids = list(artifact["characters"])
+    extras = {
+        "top": {
+            key: value
+            for key, value in artifact.items()
+            if key not in COLUMNAR_META_STRINGS
+            and key not in COLUMNAR_META_NUMBERS
+            and key not in ("characters", "tiers")
+        },
+        "tiers": {},
+        "characters": {},
+    }
+
+    sections = [
+        (
+            "metaStrings",
+            "I",
+            [strings.ref(artifact[key]) for key in COLUMNAR_META_STRINGS],
+        ),
+        (
+            "metaNumbers",
+            "d",
+            [
+                NAN if artifact[key] is None else float(artifact[key])
+                for key in COLUMNAR_META_NUMBERS
+            ],
+        ),
+        ("characterMetaIds", "I", [int(key) for key in metadata_ids]),
+    ]
+    for field in ("key", "name", "imageUrl"):
+        sections.append(
+            (
+                f"characterMeta.{field}",
+                "I",
+                [
+                    strings.ref(artifact["characters"][key].get(field))
+                    for key in metadata_ids
+                ],
+            )
+        )
+    sections += [
+        ("tierKeys", "I", [strings.ref(key) for key in tier_keys]),
+        ("tierLabels", "I", [strings.ref(tiers[key]["label"]) for key in tier_keys]),
+        ("tierGames", "d", [float(tiers[key]["games"]) for key in tier_keys]),
+        ("tierUpdatedAt", "d", [float(tiers[key]["updatedAt"]) for key in tier_keys]),
+        ("characterIds", "I", character_ids),
+    ]
+
+    entries = [
+        entry for tier in tiers.values() for entry in tier["characters"].values()
+    ]
+    fields = [
+        field
+        for field in ARTIFACT_FIELDS
+        if field[0] == "games" or all(field[0] in entry for entry in entries)
+    ]
+    matrix = {name: [] for name, _, _, _ in fields}
+    tier_flags = bytearray(len(tier_keys))
+    typed_metrics = {}
+    for tier_index, tier_key in enumerate(tier_keys):
+        tier = tiers[tier_key]
+        typed = {"label", "games", "updatedAt", "characters"}
+        if "metrics" in tier and tier_metrics_fit(tier["metrics"]):
+            tier_flags[tier_index] |= TIER_METRICS_FLAG
+            typed.add("metrics")
+            for name in tier["metrics"]:
+                typed_metrics.setdefault(name, [])
+        tier_extra = {key: value for key, value in tier.items() if key not in typed}
+        if tier_extra:
+            extras["tiers"][tier_key] = tier_extra
+        for character_id in character_ids:
+            entry = tier["characters"].get(str(character_id))
+            for name, _, _, _ in fields:
+                if entry is None:
+                    matrix[name].append(0 if name == "games" else NAN)
+                else:
+                    matrix[name].append(entry[name])
+            if entry is not None:
+                entry_extra = {
+                    key: value for key, value in entry.items() if key not in matrix
                 }
-            tiers[tier["tier_key"]] = {
-                "label": tier["tier_label"],
-                "games": tier["game_count"],
-                "updatedAt": tier["source_updated_at"],
-                "characters": tier_characters,
-            }
+                if entry_extra:
+                    extras["characters"].setdefault(tier_key, {})[
+                        str(character_id)
+                    ] = entry_extra
+    for name, _, digits, code in fields:
+        sections.append((f"column.{name}", code, matrix[name], digits))
 
-    artifact = {
-        "schemaVersion": 1,
-        "source": meta["source_url"],
-        "collectedAt": meta["collected_at"],
-        "periodDays": meta["period_days"],
-        "matchingMode": meta["matching_mode"],
-        "teamMode": meta["team_mode"],
-        "currentPatch": meta["current_patch"],
-        "previousPatch": meta["previous_patch"],
-        "sourceUpdatedAtMin": meta["source_updated_at_min"],
-        "sourceUpdatedAtMax": meta["source_updated_at_max"],
-        "characters": character_metadata,
+    sections.append(("tierTables", "B", bytes(tier_flags)))
+    for name in typed_metrics:
+        tables = [
+            tiers[tier_key]["metrics"].get(name)
+            if tier_flags[tier_index] & TIER_METRICS_FLAG
+            else None
+            for tier_index, tier_key in enumerate(tier_keys)
+        ]
+        for key in METRIC_TABLES:
+            values = [NAN if table is None else table[key] for table in tables]
+            sections.append((f"metrics.{name}.{key}", "d", values, METRIC_DIGITS[name]))
+
+    all_tiers = artifact.get("allTiers")
+    if isinstance(all_tiers, dict):
+        rows = nested_rows(all_tiers.get("characters"), 1)
+        used = rows is not None and row_table_fields(
+            (entry for _, entry in rows), CHARACTER_ROW_FIELDS
+        )
+        if "characters" in all_tiers and used:
+            sections += row_sections(
+                "allTiers.characters", ("characterId",), rows, used, strings
+            )
+        extras["top"]["allTiers"] = {
+            key: value
+            for key, value in all_tiers.items()
+            if key != "characters" or not used
+        }
+
+    extras = {key: value for key, value in extras.items() if value}
+    if extras:
+        sections.append(("extras", "B", encode_artifact(extras)))
+
+    # Intern the section names before the string table is serialized; the
+    # table always occupies the first two sections.
+    names = [
+        strings.ref(name)
+        for name in ("stringOffsets", "stringBytes", *(item[0] for item in sections))
+    ]
+    encoded_strings = [value.encode("utf-8") for value in strings.strings]
+    offsets = [0]
+    for value in encoded_strings:
+        offsets.append(offsets[-1] + len(value))
+    sections = [
+        ("stringOffsets", "I", offsets),
+        ("stringBytes", "B", b"".join(encoded_strings)),
+        *sections,
+    ]
+
+    data_start = _align(COLUMNAR_HEADER.size + COLUMNAR_SECTION.size * len(sections))
+    directory = bytearray()
+    body = bytearray()
+    for name_ref, (_, code, values, *rest) in zip(names, sections):
+        digits = rest[0] if rest and rest[0] is not None else -1
+        body += bytes(_align(len(body)) - len(body))
+        directory += COLUMNAR_SECTION.pack(
+            name_ref, ord(code), digits, data_start + len(body), len(values)
+        )
+        if code == "B":
+            body += values
+        else:
+            body += struct.pack(f"<{len(values)}{code.replace('S', 'I')}", *values)
+
+    header = COLUMNAR_HEADER.pack(
+        COLUMNAR_MAGIC, 2, len(sections), len(tier_keys), len(character_ids)
+    )
+    prefix = header + directory
+    return bytes(prefix + bytes(data_start - len(prefix)) + body)
+
+
+def _align(size, boundary=8):
+    return (size + boundary - 1) // boundary * boundary
+
+
+def decode_columnar_artifact(data):
+    """Decode a schemaVersion 2 file back into the JSON artifact form."""
+    magic, version, section_count, tier_count, character_count = (
+        COLUMNAR_HEADER.unpack_from(data, 0)
+    )
+    if magic != COLUMNAR_MAGIC or version != 2:
+        raise ValueError("not a schemaVersion 2 DAK.GG statistics artifact")
+
+    raw_sections = []
+    for index in range(section_count):
+        raw_sections.append(
+            COLUMNAR_SECTION.unpack_from(
+                data, COLUMNAR_HEADER.size + index * COLUMNAR_SECTION.size
+            )
+        )
+
+    def read(section):
+        _, code, _, offset, count = section
+        code = chr(code)
+        if code == "B":
+            return bytes(data[offset : offset + count])
+        if code == "S":
+            refs = struct.unpack_from(f"<{count}I", data, offset)
+            return [string(ref) for ref in refs]
+        return struct.unpack_from(f"<{count}{code}", data, offset)
+
+    offsets = read(raw_sections[0])
+    blob = read(raw_sections[1])
+    strings = [
+        blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])
+    ]
+
+    def string(ref):
+        return None if ref == NO_STRING else strings[ref]
+
+    sections = {}
+    for section in raw_sections:
+        sections[strings[section[0]]] = (read(section), section[2], chr(section[1]))
+
+    artifact = {}
+    for key, ref in zip(COLUMNAR_META_STRINGS, sections["metaStrings"][0]):
+        artifact[key] = string(ref)
+    for key, value in zip(COLUMNAR_META_NUMBERS, sections["metaNumbers"][0]):
+        artifact[key] = None if math.isnan(value) else int(value)
+    artifact["characters"] = {
+        str(character_id): {
+            field: string(sections[f"characterMeta.{field}"][0][index])
+            for field in ("key", "name", "imageUrl")
+        }
+        for index, character_id in enumerate(sections["characterMetaIds"][0])
+    }
+
+    extras = {}
+    if "extras" in sections:
+        extras = json.loads(sections["extras"][0].decode("utf-8"))
+    artifact.update(extras.get("top", {}))
+    character_ids = sections["characterIds"][0]
+    columns = [
+        (name, *sections[f"column.{name}"][:2])
+        for name, _, _, _ in ARTIFACT_FIELDS
+        if f"column.{name}" in sections
+    ]
+    tier_flags = sections["tierTables"][0] if "tierTables" in sections else b""
+    metrics = [
+        (name, *(sections[f"metrics.{name}.{key}"][0] for key in METRIC_TABLES))
+        for name in METRIC_DIGITS
+        if f"metrics.{name}.mean" in sections
+    ]
+    if "allTiers.characters.characterId" in sections:
+        table = artifact["allTiers"]["characters"] = {}
+        for row_keys, entry in decode_rows(
+            sections, "allTiers.characters", ("characterId",)
+        ):
+            nest(table, row_keys, entry)
+
+    tiers = {}
+    for tier_index in range(tier_count):
+        tier_key = string(sections["tierKeys"][0][tier_index])
+        tier_characters = {}
+        base = tier_index * character_count
+        for character_index, character_id in enumerate(character_ids):
+            games = sections["column.games"][0][base + character_index]
+            if not games:
+                continue
+            entry = {}
+            for name, values, digits in columns:
+                value = values[base + character_index]
+                entry[name] = value if digits < 0 else round(value, digits)
+            entry.update(
+                extras.get("characters", {})
+                .get(tier_key, {})
+                .get(str(character_id), {})
+            )
+            tier_characters[str(character_id)] = entry
+        tiers[tier_key] = {
+            "label": string(sections["tierLabels"][0][tier_index]),
+            "games": int(sections["tierGames"][0][tier_index]),
+            "updatedAt": int(sections["tierUpdatedAt"][0][tier_index]),
+            "characters": tier_characters,
+            **extras.get("tiers", {}).get(tier_key, {}),
+        }
+        flags = tier_flags[tier_index] if tier_flags else 0
+        if flags & TIER_METRICS_FLAG:
+            tiers[tier_key]["metrics"] = decode_tier_metrics(metrics, tier_index)
+    artifact["tiers"] = tiers
+    return artifact
+
+
+def decode_rows(sections, prefix, keys):
+    """``[(keys, entry)]`` back from the sections of ``row_sections``."""
+    key_columns = [sections[f"{prefix}.{key}"][0] for key in keys]
+    columns = [
+        (name[len(prefix) + 1 :], values, digits, code)
+        for name, (values, digits, code) in sections.items()
+        if name.startswith(f"{prefix}.") and name[len(prefix) + 1 :] not in keys
+    ]
+    rows = []
+    for index, row_keys in enumerate(zip(*key_columns)):
+        entry = {}
+        for name, values, digits, code in columns:
+            value = values[index]
+            if value is not None and value == value:
+                entry[name] = decoded_value(value, digits, code)
+        rows.append((row_keys, entry))
+    return rows
+
+
+def nest(table, keys, entry):
+    for key in keys[:-1]:
+        table = table.setdefault(str(key), {})
+    table[str(keys[-1])] = entry
+
+
+def decode_tier_metrics(metrics, tier_index):
+    result = {}
+    for name, *tables in metrics:
+        if math.isnan(tables[0][tier_index]):
+            continue
+        digits = METRIC_DIGITS[name]
+        result[name] = {
+            key: round(values[tier_index], digits)
+            for key, values in zip(METRIC_TABLES, tables)
+        }
+    return result
+
+
+def artifact_hash(artifact):
+    return hashlib.sha256(encode_artifact(artifact)).hexdigest()
+
+
+def read_artifact(path):
+    """Return the JSON artifact at ``path``, or None when it is unusable."""
+    try:
+        artifact = json.loads(decompress(path.read_bytes()))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(artifact, dict) or not isinstance(artifact.get("tiers"), dict):
+        return None
+    return artifact
+
+
+def diff_fields(base, target, skip=()):
+    changed = {
+        key: value
+        for key, value in target.items()
+        if key not in skip and (key not in base or base[key] != value)
+    }
+    removed = sorted(key for key in base if key not in skip and key not in target)
+    return changed, removed
+
+
+def removed_key(table):
+    return "remove" + table[0].upper() + table[1:]
+
+
+def table_delta(base, target, tables):
+    """``set`` and ``remove`` for the fields of ``target`` that differ from
+    ``base``. Each of the ``tables`` that both have is diffed one entry at a
+    time instead, under its own name and ``remove<Table>``."""
+    shared = [
+        key
+        for key in tables
+        if isinstance(base.get(key), dict) and isinstance(target.get(key), dict)
+    ]
+    changed, removed = diff_fields(base, target, skip=shared)
+    delta = {"set": changed, "remove": removed}
+    for key in shared:
+        delta[key], delta[removed_key(key)] = diff_fields(base[key], target[key])
+    return delta
+
+
+def apply_table_delta(target, delta, tables):
+    for key in delta["remove"]:
+        target.pop(key, None)
+    target.update(delta["set"])
+    for key in tables:
+        if key in delta:
+            for entry_key in delta[removed_key(key)]:
+                target[key].pop(entry_key, None)
+            target[key].update(delta[key])
+
+
+def artifact_delta(base, target):
+    """Describe how to turn ``base`` into ``target``.
+
+    Top-level and tier fields are replaced whole, except the
+    ``TIER_DELTA_TABLES`` of each tier and the ``ALL_TIERS_DELTA_TABLES`` of
+    ``allTiers``, whose entries are replaced or removed one at a time. Both
+    content hashes are included so a consumer can tell which version a delta
+    applies to.
+    """
+    skip = ["tiers"]
+    all_tiers = None
+    if isinstance(base.get("allTiers"), dict) and isinstance(
+        target.get("allTiers"), dict
+    ):
+        skip.append("allTiers")
+        all_tiers = table_delta(
+            base["allTiers"], target["allTiers"], ALL_TIERS_DELTA_TABLES
+        )
+    changed, removed = diff_fields(base, target, skip=skip)
+    tiers = {}
+    for tier_key, tier in target["tiers"].items():
+        tier_delta = table_delta(
+            base["tiers"].get(tier_key, {}), tier, TIER_DELTA_TABLES
+        )
+        if any(tier_delta.values()):
+            tiers[tier_key] = tier_delta
+    delta = {
+        "kind": "dakgg-stats-delta",
+        "schemaVersion": 2,
+        "baseHash": artifact_hash(base),
+        "targetHash": artifact_hash(target),
+        "baseCollectedAt": base.get("collectedAt"),
+        "targetCollectedAt": target.get("collectedAt"),
+        "set": changed,
+        "remove": removed,
         "tiers": tiers,
+        "removeTiers": sorted(
+            key for key in base["tiers"] if key not in target["tiers"]
+        ),
     }
-    encoded = json.dumps(
-        artifact, ensure_ascii=False, separators=(",", ":"), sort_keys=True
-    ).encode("utf-8")
-    artifact_path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = artifact_path.with_name(f".{artifact_path.name}.tmp")
+    if all_tiers is not None and any(all_tiers.values()):
+        delta["allTiers"] = all_tiers
+    return delta
+
+
+def apply_artifact_delta(base, delta):
+    """Apply ``delta`` to ``base`` and verify both content hashes."""
+    if artifact_hash(base) != delta["baseHash"]:
+        raise ValueError("delta does not apply to this artifact version")
+    target = json.loads(encode_artifact(base))
+    for key in delta["remove"]:
+        target.pop(key, None)
+    target.update(delta["set"])
+    if "allTiers" in delta:
+        apply_table_delta(target["allTiers"], delta["allTiers"], ALL_TIERS_DELTA_TABLES)
+    for tier_key in delta["removeTiers"]:
+        target["tiers"].pop(tier_key, None)
+    for tier_key, tier_delta in delta["tiers"].items():
+        apply_table_delta(
+            target["tiers"].setdefault(tier_key, {}), tier_delta, TIER_DELTA_TABLES
+        )
+    if artifact_hash(target) != delta["targetHash"]:
+        raise ValueError("delta result does not match the target artifact")
+    return target
+
+
+def file_entry(path, content_hash):
+    return {
+        "file": path.name,
+        "contentHash": content_hash,
+        "bytes": path.stat().st_size,
+    }
+
+
+def tier_shard_name(tier_key):
+    return f"dakgg_stats.tier.{tier_key}.json.gz"
+
+
+def with_weapons(artifact, weapons):
+    """``artifact`` with the ``release_weapons`` tables of its dimension added
+    to each tier and to ``allTiers``, as its shards carry them."""
+    merged = {
+        **artifact,
+        "tiers": {
+            tier_key: {**tier, "weapons": weapons["tiers"].get(tier_key, {})}
+            for tier_key, tier in artifact["tiers"].items()
+        },
+    }
+    if "allTiers" in artifact and "allTiers" in weapons:
+        merged["allTiers"] = {**artifact["allTiers"], "weapons": weapons["allTiers"]}
+    return merged
+
+
+def artifact_shards(artifact):
+    """Split ``artifact`` into its shared fields, a character shard with the
+    character metadata and cross-tier character rollup, one shard per tier
+    and, when ``allTiers`` has weapons, a shard with the weapon rollup (None
+    otherwise). A shard depends only on its own content, so one whose content
+    did not change keeps its file and hash across versions."""
+    common = {
+        key: value
+        for key, value in artifact.items()
+        if key not in ("characters", "tiers", "allTiers")
+    }
+    characters = {"characters": artifact["characters"]}
+    weapons = None
+    if "allTiers" in artifact:
+        characters["allTiers"] = {
+            key: value
+            for key, value in artifact["allTiers"].items()
+            if key != "weapons"
+        }
+        if "weapons" in artifact["allTiers"]:
+            weapons = {"weapons": artifact["allTiers"]["weapons"]}
+    tiers = {
+        tier_key: {"tierKey": tier_key, "tier": tier}
+        for tier_key, tier in artifact["tiers"].items()
+    }
+    return common, characters, tiers, weapons
+
+
+def merge_artifact_shards(index, characters, tiers, weapons=None):
+    """Rebuild the monolithic artifact from a shard index and its shards,
+    which read_shard has checked against their index entries."""
+    if set(tiers) != set(index["tiers"]):
+        raise ValueError("shards do not cover the tiers in the index")
+    if (weapons is None) != ("weapons" not in index):
+        raise ValueError("the weapon shard does not match the index")
+    artifact = {
+        **index["artifact"],
+        "characters": characters["characters"],
+        "tiers": {tier_key: tiers[tier_key]["tier"] for tier_key in index["tiers"]},
+    }
+    if "allTiers" in characters:
+        artifact["allTiers"] = dict(characters["allTiers"])
+        if weapons is not None:
+            artifact["allTiers"]["weapons"] = weapons["weapons"]
+    return artifact
+
+
+def read_shard(shard_dir, entry, dictionary=None):
+    """Read the shard described by an index ``entry`` and check its hash.
+    ``dictionary`` is the preset dictionary named by the entry's codec."""
+    codec = entry.get("codec", {}).get("name")
+    shard = json.loads(
+        decompress((shard_dir / entry["file"]).read_bytes(), codec, dictionary)
+    )
+    if hashlib.sha256(encode_artifact(shard)).hexdigest() != entry["contentHash"]:
+        raise ValueError(f"{entry['file']} does not match its content hash")
+    return shard
+
+
+def read_artifact_shards(shard_dir, dictionary=None):
+    index = json.loads((shard_dir / SHARD_INDEX_NAME).read_text(encoding="utf-8"))
+    return merge_artifact_shards(
+        index,
+        read_shard(shard_dir, index["characters"], dictionary),
+        {
+            tier_key: read_shard(shard_dir, entry, dictionary)
+            for tier_key, entry in index["tiers"].items()
+        },
+        read_shard(shard_dir, index["weapons"], dictionary)
+        if "weapons" in index
+        else None,
+    )
+
+
+def write_artifact_shards(
+    shard_dir,
+    artifact,
+    version,
+    codec=DEFAULT_CODEC,
+    dictionary=None,
+    dictionary_entry=None,
+):
+    """Write the per-tier, character metadata and weapon rollup shards and
+    their index, then check that they merge back to ``artifact``, which
+    build_release_artifact passes ``with_weapons``.
+
+    Shards keep their ``.json.gz`` names whatever the ``codec``; each index
+    entry records the codec and, for a preset ``dictionary``, its
+    ``dictionary_entry``. Like the release manifest check, a shard whose
+    content hash and codec match its entry in the existing index, and whose
+    file is still in place, is not written again. Returns the index path and
+    the names of the shards written.
+    """
+    common, characters, tiers, weapons = artifact_shards(artifact)
+    codec_info = codec_entry(codec, dictionary_entry)
+    previous = {}
     try:
-        with temp_path.open("wb") as output:
-            with gzip.GzipFile(fileobj=output, mode="wb", mtime=0) as compressed:
-                compressed.write(encoded)
-        os.replace(temp_path, artifact_path)
-    finally:
-        temp_path.unlink(missing_ok=True)
+        existing = json.loads(
+            (shard_dir / SHARD_INDEX_NAME).read_text(encoding="utf-8")
+        )
+    except (OSError, ValueError):
+        existing = None
+    if isinstance(existing, dict) and existing.get("schemaVersion") == 2:
+        for entry in (
+            existing["characters"],
+            *existing["tiers"].values(),
+            *([existing["weapons"]] if "weapons" in existing else []),
+        ):
+            previous[entry["file"]] = entry
+    written = []
+
+    def write_shard(name, shard):
+        encoded = encode_artifact(shard)
+        content_hash = hashlib.sha256(encoded).hexdigest()
+        path = shard_dir / name
+        entry = previous.get(name)
+        if (
+            entry is not None
+            and entry["contentHash"] == content_hash
+            and entry.get("codec") == codec_info
+            and path.exists()
+            and path.stat().st_size == entry["bytes"]
+        ):
+            return entry
+        write_compressed(path, encoded, codec, dictionary)
+        written.append(name)
+        return {**file_entry(path, content_hash), "codec": codec_info}
+
+    index = {
+        "kind": "dakgg-stats-shards",
+        "schemaVersion": 2,
+        "version": version,
+        "artifact": common,
+        "characters": write_shard("dakgg_stats.characters.json.gz", characters),
+        "tiers": {
+            tier_key: write_shard(tier_shard_name(tier_key), shard)
+            for tier_key, shard in tiers.items()
+        },
+    }
+    if weapons is not None:
+        index["weapons"] = write_shard(WEAPON_SHARD_NAME, weapons)
+    else:
+        (shard_dir / WEAPON_SHARD_NAME).unlink(missing_ok=True)
+    current = {entry["file"] for entry in index["tiers"].values()}
+    for path in shard_dir.glob(tier_shard_name("*")):
+        if path.name not in current:
+            path.unlink()
+
+    index_path = shard_dir / SHARD_INDEX_NAME
+    write_atomic(
+        index_path,
+        (json.dumps(index, indent=2, sort_keys=True) + "\n").encode("utf-8"),
+    )
+    if read_artifact_shards(shard_dir, dictionary) != artifact:
+        raise RuntimeError("artifact shards do not merge back to the artifact")
+    return index_path, written
+
+
+def artifact_inputs_hash(
+    db_path, character_metadata, outputs, dimension_key=None, codec=DEFAULT_CODEC
+):
+    """Hash everything the release files of one dimension are built from.
+
+    That is the collection metadata, the tier snapshots, the exported
+    character and weapon columns, the character metadata, the artifact field
+    layout, the release ``codec`` and the names of the requested ``outputs``.
+    The same hash means the same files, so they do not need to be encoded
+    again.
+    """
+    dimension_key = dimension_key or DEFAULT_DIMENSION.key
+    digest = hashlib.sha256()
+
+    def update(value):
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\n")
+
+    update(
+        {
+            "fields": ARTIFACT_FIELDS,
+            "weaponFields": WEAPON_ARTIFACT_FIELDS,
+            "rollupTiers": ROLLUP_TIERS,
+            "codec": codec,
+            "outputs": sorted(outputs),
+        }
+    )
+    update(character_metadata)
+    columns = ", ".join(column for _, column, _, _ in ARTIFACT_FIELDS)
+    weapon_columns = ", ".join(column for _, column, _, _ in WEAPON_ARTIFACT_FIELDS)
+    with closing(sqlite3.connect(db_path)) as conn:
+        for query in (
+            "SELECT * FROM collection_meta WHERE dimension_key = ?",
+            "SELECT * FROM tier_snapshots WHERE dimension_key = ? ORDER BY rowid",
+            f"SELECT tier_key, character_id, {columns} FROM character_stats"
+            " WHERE dimension_key = ? ORDER BY tier_key, character_id",
+            f"SELECT tier_key, character_id, weapon_id, {weapon_columns}"
+            " FROM weapon_stats WHERE dimension_key = ?"
+            " ORDER BY tier_key, character_id, weapon_id",
+        ):
+            for row in conn.execute(query, (dimension_key,)):
+                update(row)
+    return digest.hexdigest()
+
+
+def release_is_current(manifest_path, inputs_hash, paths):
+    """Whether ``manifest_path`` was written for ``inputs_hash`` and each of
+    its entries still matches the file in ``paths`` by name and size."""
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    if manifest.get("inputsHash") != inputs_hash:
+        return False
+    for name, path in paths.items():
+        entry = manifest.get(name)
+        if not entry:
+            if name == "delta":
+                continue
+            return False
+        if (
+            path.name != entry["file"]
+            or not path.exists()
+            or path.stat().st_size != entry["bytes"]
+        ):
+            return False
+    return True
+
+
+def build_release_artifact(
+    db_path,
+    artifact_path,
+    character_metadata,
+    columnar_path=None,
+    delta_path=None,
+    manifest_path=None,
+    previous_path=None,
+    shard_dir=None,
+    metrics=NULL_METRICS,
+    dimension_key=None,
+    codec=DEFAULT_CODEC,
+    dictionary_path=None,
+):
+    """Export one dimension of the database and, when paths are given, the
+    columnar form, a delta against the previous artifact, per-tier shards and
+    a manifest pointing to them.
+
+    The JSON artifact is always gzip, since it doubles as the bundled
+    fallback; the other files use ``codec``, recorded in their manifest and
+    shard index entries. A zlib ``codec`` can use the preset dictionary at
+    ``dictionary_path``, which is built from the previous artifact when the
+    file does not exist yet and kept afterwards, so runtimes can cache it.
+
+    With a manifest, nothing is encoded again when it records the same
+    ``artifact_inputs_hash`` and its files are in place. Returns whether the
+    release files were written.
+    """
+    if dictionary_path is not None and codec.name != "zlib":
+        raise ValueError(f"{codec.name} does not take a preset dictionary")
+    paths = {"full": artifact_path}
+    if columnar_path is not None:
+        paths["columnar"] = columnar_path
+    if shard_dir is not None:
+        paths["shards"] = shard_dir / SHARD_INDEX_NAME
+    if delta_path is not None:
+        paths["delta"] = delta_path
+    if dictionary_path is not None:
+        paths["dictionary"] = dictionary_path
+    inputs_hash = artifact_inputs_hash(
+        db_path, character_metadata, paths, dimension_key, codec
+    )
+    if manifest_path is not None and release_is_current(
+        manifest_path, inputs_hash, paths
+    ):
+        print(f"release artifact is unchanged (inputs {inputs_hash[:12]})")
+        metrics.count("release_unchanged")
+        return False
+
+    with metrics.span("export"):
+        artifact = release_artifact(db_path, character_metadata, dimension_key)
+    previous = (
+        read_artifact(previous_path or artifact_path)
+        if delta_path or dictionary_path
+        else None
+    )
+    with metrics.span("encode"):
+        encoded = encode_artifact(artifact)
+        version = hashlib.sha256(encoded).hexdigest()
+    manifest = {
+        "schemaVersion": 1,
+        "version": version,
+        "inputsHash": inputs_hash,
+        "collectedAt": artifact["collectedAt"],
+    }
+
+    dictionary = dictionary_entry = None
+    if dictionary_path is not None:
+        try:
+            dictionary = dictionary_path.read_bytes()
+        except FileNotFoundError:
+            samples = [encode_artifact(previous) if previous else encoded]
+            dictionary = build_dictionary(samples)
+            dictionary_path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(dictionary_path, dictionary)
+            print(
+                f"compression dictionary: {dictionary_path}"
+                f" ({len(dictionary):,} bytes)"
+            )
+        dictionary_entry = file_entry(
+            dictionary_path, hashlib.sha256(dictionary).hexdigest()
+        )
+        manifest["dictionary"] = dictionary_entry
+    codec_info = codec_entry(codec, dictionary_entry)
+
+    with metrics.span("compress"):
+        write_compressed(artifact_path, encoded)
+    manifest["full"] = {
+        **file_entry(artifact_path, version),
+        "codec": codec_entry(DEFAULT_CODEC),
+    }
+    metrics.count("artifact_bytes", manifest["full"]["bytes"], file="full")
     print(f"release artifact: {artifact_path} ({artifact_path.stat().st_size:,} bytes)")
 
+    if columnar_path is not None:
+        with metrics.span("columnar"):
+            columnar = encode_columnar_artifact(artifact)
+            if decode_columnar_artifact(columnar) != artifact:
+                raise RuntimeError(
+                    "columnar artifact does not round-trip to the JSON form"
+                )
+            write_compressed(columnar_path, columnar, codec, dictionary)
+        manifest["columnar"] = {
+            **file_entry(columnar_path, hashlib.sha256(columnar).hexdigest()),
+            "codec": codec_info,
+        }
+        metrics.count("artifact_bytes", manifest["columnar"]["bytes"], file="columnar")
+        print(
+            f"columnar artifact: {columnar_path} "
+            f"({columnar_path.stat().st_size:,} bytes,"
+            f" {len(columnar):,} uncompressed)"
+        )
 
-def main():
-    args = parse_args()
-    print("fetching character metadata...")
-    characters = fetch_characters()
-    payloads = []
-    for index, (tier_key, tier_label) in enumerate(TIERS):
-        print(f"fetching {tier_key}...")
-        payload = fetch_tier(tier_key, args.period_days)
-        validate_snapshot(payload, tier_key, args.period_days)
-        payloads.append((tier_key, tier_label, payload))
-        if index + 1 < len(TIERS):
-            time.sleep(args.delay)
+    if shard_dir is not None:
+        with metrics.span("shards"):
+            index_path, written = write_artifact_shards(
+                shard_dir,
+                with_weapons(artifact, release_weapons(db_path, dimension_key)),
+                version,
+                codec,
+                dictionary,
+                dictionary_entry,
+            )
+        manifest["shards"] = file_entry(
+            index_path, hashlib.sha256(index_path.read_bytes()).hexdigest()
+        )
+        shard_bytes = sum(
+            path.stat().st_size for path in shard_dir.glob("dakgg_stats.*.json.gz")
+        )
+        print(
+            f"artifact shards: {shard_dir} ({len(artifact['tiers'])} tiers,"
+            f" {len(written)} written, {shard_bytes:,} bytes)"
+        )
+        metrics.count("artifact_bytes", shard_bytes, file="shards")
+
+    manifest["delta"] = None
+    if delta_path is not None and previous is not None:
+        with metrics.span("delta"):
+            delta = artifact_delta(previous, artifact)
+            if apply_artifact_delta(previous, delta) != artifact:
+                raise RuntimeError(
+                    "delta artifact does not reproduce the new artifact"
+                )
+            encoded_delta = encode_artifact(delta)
+            write_compressed(delta_path, encoded_delta, codec, dictionary)
+        manifest["delta"] = {
+            **file_entry(delta_path, hashlib.sha256(encoded_delta).hexdigest()),
+            "codec": codec_info,
+            "base": delta["baseHash"],
+            "target": delta["targetHash"],
+        }
+        metrics.count("artifact_bytes", manifest["delta"]["bytes"], file="delta")
+        changed_characters = sum(
+            len(tier.get("characters", {})) + len(tier.get("removeCharacters", []))
+            for tier in delta["tiers"].values()
+        )
+        print(
+            f"delta artifact: {delta_path} ({delta_path.stat().st_size:,} bytes,"
+            f" {len(delta['tiers'])} tiers, {changed_characters} characters changed)"
+        )
+    elif delta_path is not None:
+        delta_path.unlink(missing_ok=True)
+
+    if manifest_path is not None:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            manifest_path,
+            (json.dumps(manifest, indent=2, sort_keys=True) + "\n").encode("utf-8"),
+        )
+        print(f"manifest: {manifest_path} (version {version[:12]})")
+    return True
 
+
+def dimension_path(path, dimension_key):
+    """``dakgg_stats.json.gz`` -> ``dakgg_stats.<dimension_key>.json.gz``."""
+    stem, dot, rest = path.name.partition(".")
+    return path.with_name(f"{stem}.{dimension_key}{dot}{rest}")
+
+
+def collect(args, metrics, reuse=frozenset()):
+    """Run one refresh and return whether any release files were written.
+
+    ``(dimension, tier_key)`` pairs in ``reuse``, ``(None, None)`` for the
+    character metadata, are read from the spool whatever their age, and only
+    fetched when the spool has nothing for them.
+    """
+    api_base = args.api_base
+    limiter = TokenBucket(
+        1 / args.delay if args.delay > 0 else None, args.concurrency
+    )
+    cache = None if args.no_cache else ResponseCache(args.cache_dir.resolve())
+    spool = Spool(args.spool_dir.resolve())
+    breaker = CircuitBreaker(args.breaker_threshold)
     db_path = args.db.resolve()
-    if database_is_current(db_path, payloads, args.period_days):
-        print("source snapshots are unchanged; keeping the existing database")
-    else:
-        build_database(db_path, payloads, args.period_days)
+    artifact_path = args.artifact.resolve()
+    dimensions = args.dimensions
+    primary = dimensions[0]
+
+    def output(path, dimension):
+        # Extra dimensions get their own suffixed files; the primary one keeps
+        # the configured paths.
+        if path is None or dimension == primary:
+            return path
+        return dimension_path(path, dimension.key)
+
+    staging = StagingDatabase(
+        db_path,
+        incremental=not args.full_rebuild,
+        pragmas={
+            "journal_mode": args.journal_mode,
+            "synchronous": args.synchronous,
+            "cache_size": args.cache_size,
+        },
+        metrics=metrics,
+        backend=args.build_backend,
+        verify=args.verify,
+        source_url=api_url(api_base),
+    )
+
+    with staging, metrics.span("collect"):
+        # Tiers are validated, spooled and staged as they arrive, and each
+        # dimension is written once all of its tiers are in; 304 answers are
+        # only read back from the cache when something else changed.
+        characters = None
+        unchanged_tiers = []
+        waiting = set()
+        remaining = {dimension: len(TIERS) for dimension in dimensions}
+        changed = False
+
+        def stage(dimension, tier_key, tier_label, payload, save=True):
+            with metrics.span("validate", tier=tier_key, dimension=dimension.key):
+                record = decode_tier(payload, tier_key, dimension)
+            if save:
+                url = tier_url(tier_key, dimension, api_base)
+                spool.save(dimension, tier_key, url, payload)
+            staging.add_tier(dimension, tier_label, record)
+
+        def arrived(dimension):
+            remaining[dimension] -= 1
+            if not remaining[dimension] and dimension not in waiting:
+                staging.commit_dimension(dimension)
+
+        def spooled(dimension, tier_key, url):
+            if (dimension, tier_key) in reuse:
+                return spool.load(dimension, tier_key, url)
+            if args.resume:
+                return spool.load(dimension, tier_key, url, args.resume_max_age)
+            return None
+
+        resumed = set()
+        if args.resume or reuse:
+            characters = spooled(None, None, character_url(api_base))
+            if characters is not None:
+                resumed.add((None, None))
+            for dimension in dimensions:
+                for tier_key, tier_label in TIERS:
+                    payload = spooled(
+                        dimension, tier_key, tier_url(tier_key, dimension, api_base)
+                    )
+                    if payload is None:
+                        continue
+                    stage(dimension, tier_key, tier_label, payload, save=False)
+                    del payload
+                    resumed.add((dimension, tier_key))
+                    arrived(dimension)
+            if resumed and args.resume:
+                changed = True
+            metrics.count("spool_reads", len(resumed), reason="resume")
+            print(f"read {len(resumed)} spooled payloads from {spool.directory}")
+
+        if resumed:
+            requests = len(TIERS) * len(dimensions) + 1 - len(resumed)
+            print(f"fetching the {requests} remaining payloads...")
+        else:
+            print(
+                f"fetching character metadata and {len(TIERS)} tiers"
+                f" of {len(dimensions)} dimensions..."
+            )
+        failures = []
+        for dimension, tier_key, tier_label, payload, fresh in fetch_stream(
+            dimensions,
+            args.concurrency,
+            limiter,
+            args.timeout,
+            args.attempts,
+            cache,
+            metrics,
+            breaker,
+            resumed,
+            failures,
+            api_base,
+        ):
+            changed = changed or fresh
+            if tier_key is None:
+                characters = payload
+                if payload is not None:
+                    spool.save(None, None, character_url(api_base), payload)
+                continue
+            if payload is None:
+                unchanged_tiers.append((dimension, tier_key, tier_label))
+                waiting.add(dimension)
+            else:
+                stage(dimension, tier_key, tier_label, payload)
+            del payload
+            arrived(dimension)
+
+        # Requests that failed are replaced by their last spooled payload, so
+        # one outage does not lose the tiers that did arrive; the run only
+        # fails when the spool has nothing to fall back on.
+        missing = []
+        for dimension, tier_key, tier_label, exc in failures:
+            url = (
+                tier_url(tier_key, dimension, api_base)
+                if tier_key
+                else character_url(api_base)
+            )
+            payload = spool.load(dimension, tier_key, url)
+            if payload is None:
+                missing.append(exc)
+                continue
+            if tier_key is None:
+                print("using the spooled character metadata")
+                characters = payload
+                continue
+            print(f"using the spooled {dimension.key}/{tier_key}")
+            stage(dimension, tier_key, tier_label, payload, save=False)
+            del payload
+            arrived(dimension)
+        if missing:
+            raise RuntimeError(
+                f"{len(missing)} requests failed and {spool.directory} has no"
+                f" earlier payload for them; first error: {missing[0]}"
+            ) from missing[0]
+        if failures:
+            changed = True
+            metrics.count("spool_reads", len(failures), reason="fallback")
+
+        if (
+            not changed
+            and db_path.exists()
+            and all(output(artifact_path, item).exists() for item in dimensions)
+        ):
+            print("DAK.GG responses are unchanged; keeping the database and artifact")
+            print_summary(db_path)
+            if args.history:
+                with metrics.span("history"):
+                    record_history(
+                        args.history_db.resolve(),
+                        db_path,
+                        args.history_retention_days,
+                        args.history_compaction,
+                        dimensions,
+                    )
+            return False
+
+        if characters is None:
+            characters = load_cached(cache, character_url(api_base), parse_characters)
+        for dimension, tier_key, tier_label in unchanged_tiers:
+            payload = load_cached(cache, tier_url(tier_key, dimension, api_base))
+            stage(dimension, tier_key, tier_label, payload)
+            del payload
+
+        if database_is_current(db_path, staging.dimension_summaries()):
+            print("source snapshots are unchanged; keeping the existing database")
+        else:
+            staging.publish()
+
     print_summary(db_path)
-    build_release_artifact(db_path, args.artifact.resolve(), characters)
+    if args.history:
+        with metrics.span("history"):
+            record_history(
+                args.history_db.resolve(),
+                db_path,
+                args.history_retention_days,
+                args.history_compaction,
+                dimensions,
+            )
+    written = False
+    previous_path = args.previous_artifact and args.previous_artifact.resolve()
+    for dimension in dimensions:
+        # Only the primary dimension is split into shards for the runtime.
+        written |= build_release_artifact(
+            db_path,
+            output(artifact_path, dimension),
+            characters,
+            columnar_path=output(args.columnar_artifact.resolve(), dimension),
+            delta_path=output(args.delta_artifact.resolve(), dimension),
+            manifest_path=output(args.manifest.resolve(), dimension),
+            previous_path=output(previous_path, dimension),
+            shard_dir=args.shard_dir.resolve()
+            if args.shard_dir and dimension == primary
+            else None,
+            metrics=metrics,
+            dimension_key=dimension.key,
+            codec=args.codec,
+            dictionary_path=output(args.compression_dictionary.resolve(), dimension)
+            if args.compression_dictionary
+            else None,
+        )
+    if cache:
+        cache.commit()
+    return written
+
+
+class PollSchedule:
+    """When to probe each tier next, learned from its ``meta.updatedAt``.
+
+    Every tier keeps its last ``UPDATE_HISTORY`` distinct ``updatedAt``
+    values, and the median gap between them is its cadence. ``updatedAt`` is
+    in epoch milliseconds, as DAK.GG sends it; the clock, the cadence and the
+    intervals are in seconds. A tier is not probed again until one cadence
+    after its last update; from then on it is probed after ``probe_interval``
+    seconds, doubling after every unchanged answer, and never waits longer
+    than ``max_interval``. A tier with fewer than two known updates is probed
+    every ``probe_interval``. The state is kept in a JSON file so a restarted
+    daemon resumes its schedule.
+    """
+
+    def __init__(self, path, probe_interval, max_interval):
+        self.path = path
+        self.probe_interval = probe_interval
+        self.max_interval = max_interval
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            state = {}
+        tiers = state.get("tiers") if isinstance(state, dict) else None
+        self.tiers = tiers if isinstance(tiers, dict) else {}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self.path,
+            (json.dumps({"tiers": self.tiers}, indent=2, sort_keys=True) + "\n")
+            .encode("utf-8"),
+        )
+
+    def next_probe(self, key):
+        return self.tiers.get(key, {}).get("nextProbe", 0.0)
+
+    def due(self, keys, now):
+        """The keys whose probe is due within ``PROBE_WINDOW`` seconds, so
+        tiers expected at about the same time share one refresh."""
+        return [key for key in keys if self.next_probe(key) <= now + PROBE_WINDOW]
+
+    def cadence(self, key):
+        """The median gap between the updates of ``key``, in seconds."""
+        updates = self.tiers.get(key, {}).get("updates", [])
+        if len(updates) < 2:
+            return None
+        return statistics.median(b - a for a, b in zip(updates, updates[1:])) / 1000
+
+    def observe(self, key, updated_at, now):
+        """Record the ``updatedAt`` that a probe of ``key`` saw at ``now`` and
+        schedule the next probe."""
+        entry = self.tiers.setdefault(key, {"updates": [], "misses": 0})
+        updates = entry["updates"]
+        changed = not updates or updated_at > updates[-1]
+        if changed:
+            updates.append(updated_at)
+            del updates[:-UPDATE_HISTORY]
+            entry["misses"] = 0
+        cadence = self.cadence(key)
+        expected = None if cadence is None else updates[-1] / 1000 + cadence
+        if not changed and expected is not None and now >= expected:
+            entry["misses"] += 1
+
+        if expected is None:
+            delay = self.probe_interval
+        elif now < expected:
+            delay = expected - now
+        else:
+            delay = self.probe_interval * 2 ** min(max(entry["misses"] - 1, 0), 16)
+        entry["nextProbe"] = now + min(delay, self.max_interval)
+
+    def failed(self, key, now):
+        """Probe ``key`` again after ``probe_interval`` without learning from
+        the failed refresh."""
+        entry = self.tiers.setdefault(key, {"updates": [], "misses": 0})
+        entry["nextProbe"] = now + self.probe_interval
+
+
+def daemon(args, cycles=None, clock=time.time, sleep=time.sleep):
+    """Refresh whenever tiers are due under the ``PollSchedule`` in
+    ``--schedule-state``, ``cycles`` times or forever.
+
+    Only the due tiers are probed with conditional requests; the others are
+    read from the spool, so a refresh rewrites the database rows of the tiers
+    that changed and the release files of their dimension, writing only the
+    shards of the changed tiers. A refresh where every probe got 304 stops
+    before the database.
+    """
+    schedule = PollSchedule(
+        args.schedule_state.resolve(), args.probe_interval, args.max_probe_interval
+    )
+    keys = {
+        f"{dimension.key}/{tier_key}": (dimension, tier_key)
+        for dimension in args.dimensions
+        for tier_key, _ in TIERS
+    }
+    db_path = args.db.resolve()
+    completed = 0
+    while True:
+        due = schedule.due(keys, clock())
+        if due:
+            print(f"probing {len(due)} of {len(keys)} tiers")
+            reuse = {pair for key, pair in keys.items() if key not in due}
+            try:
+                run(args, reuse)
+            except Exception as exc:  # the daemon outlives a failed refresh
+                print(f"refresh failed: {exc}")
+                versions = {}
+            else:
+                versions = stored_tier_versions(db_path) or {}
+            now = clock()
+            for key in due:
+                dimension, tier_key = keys[key]
+                updated_at = versions.get((dimension.key, tier_key))
+                if updated_at is None:
+                    schedule.failed(key, now)
+                else:
+                    schedule.observe(key, updated_at, now)
+            schedule.save()
+            completed += 1
+            if completed == cycles:
+                return 0
+        wake = min(schedule.next_probe(key) for key in keys)
+        sleep(max(1.0, wake - clock()))
+
+
+def run(args, reuse=frozenset()):
+    """``collect`` with the metrics and profile requested by ``args``."""
+    if args.metrics or args.profile_phase:
+        metrics = Metrics(args.profile_phase)
+    else:
+        metrics = NULL_METRICS
+    status = "error"
+    try:
+        written = collect(args, metrics, reuse)
+        status = "ok"
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics.resolve(), status)
+            print(f"metrics: {args.metrics}")
+        if args.profile_phase:
+            metrics.dump_profile(args.profile_output.resolve())
+            print(f"profile of {args.profile_phase}: {args.profile_output}")
+    return written
+
+
+def main():
+    args = parse_args()
+    if args.daemon:
+        return daemon(args)
+    return 0 if run(args) else args.unchanged_exit_code
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
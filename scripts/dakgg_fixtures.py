@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""Record DAK.GG responses and replay them from a local stand-in server.
+
+``record`` saves the character metadata and every tier response, headers
+included, to a fixture directory; ``synthesize`` writes the same layout from
+the benchmark's synthetic payloads. ``serve`` replays a fixture directory
+over HTTP with configurable latency, errors, 304 answers and throttling, so
+the collector can be run against it with ``--api-base``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+import bench_dakgg_collector as bench
+import collect_dakgg_stats as collector
+
+DEFAULT_FIXTURE_DIR = Path(__file__).resolve().parents[1] / "data" / "dakgg_fixtures"
+INDEX_NAME = "index.json"
+# Headers that describe one particular transfer rather than the resource.
+TRANSFER_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "date",
+    "keep-alive",
+    "server",
+    "set-cookie",
+    "transfer-encoding",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="save live DAK.GG responses")
+    record.add_argument("--api-base", default=collector.DEFAULT_API_BASE)
+    record.add_argument("--delay", type=float, default=0.35)
+    record.add_argument("--timeout", type=float, default=collector.SOCKET_TIMEOUT)
+
+    synthesize = commands.add_parser(
+        "synthesize", help="write fixtures from deterministic synthetic payloads"
+    )
+    synthesize.add_argument("--characters", type=int, default=80)
+    synthesize.add_argument("--weapons", type=int, default=3)
+    synthesize.add_argument("--seed", type=int, default=1)
+
+    for command in (record, synthesize):
+        command.add_argument("--fixtures", type=Path, default=DEFAULT_FIXTURE_DIR)
+        command.add_argument("--matching-mode", action="append", type=str.upper)
+        command.add_argument("--team-mode", action="append", type=str.upper)
+        command.add_argument("--period-days", action="append", type=int)
+
+    serve = commands.add_parser("serve", help="replay fixtures over HTTP")
+    serve.add_argument("--fixtures", type=Path, default=DEFAULT_FIXTURE_DIR)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to each response"
+    )
+    serve.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="up to this many extra seconds, drawn uniformly per response",
+    )
+    serve.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests answered with --error-status",
+    )
+    serve.add_argument("--error-status", type=int, default=503)
+    serve.add_argument(
+        "--rate-limit",
+        type=float,
+        help="requests per second; requests beyond it are answered with 429",
+    )
+    serve.add_argument("--burst", type=int, default=1)
+    serve.add_argument(
+        "--ignore-validators",
+        action="store_true",
+        help="always answer 200, never 304",
+    )
+    serve.add_argument("--seed", type=int, help="seed for latency and errors")
+    serve.add_argument("--verbose", action="store_true", help="log every request")
+    return parser.parse_args()
+
+
+def fixture_key(url):
+    """Path and sorted query of ``url``, so any host and parameter order
+    finds the same fixture."""
+    parts = urlsplit(url)
+    return f"{parts.path}?{urlencode(sorted(parse_qsl(parts.query)))}"
+
+
+def fixture_urls(dimensions, api_base=collector.DEFAULT_API_BASE):
+    return [collector.character_url(api_base)] + [
+        collector.tier_url(tier_key, dimension, api_base)
+        for dimension in dimensions
+        for tier_key, _ in collector.TIERS
+    ]
+
+
+class FixtureWriter:
+    """Writes response bodies as they are added and the index on ``close``."""
+
+    def __init__(self, directory, source):
+        self.directory = directory
+        self.index = {
+            "schemaVersion": 1,
+            "source": source,
+            "recordedAt": datetime.now(timezone.utc)
+            .replace(microsecond=0)
+            .isoformat(),
+            "responses": {},
+        }
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def add(self, url, headers, body):
+        key = fixture_key(url)
+        name = f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.json.gz"
+        collector.write_atomic(self.directory / name, gzip.compress(body, mtime=0))
+        self.index["responses"][key] = {
+            "headers": {
+                header: value
+                for header, value in headers.items()
+                if header.lower() not in TRANSFER_HEADERS
+            },
+            "body": name,
+        }
+
+    def close(self):
+        collector.write_atomic(
+            self.directory / INDEX_NAME,
+            (json.dumps(self.index, indent=2, sort_keys=True) + "\n").encode("utf-8"),
+        )
+        print(f"{len(self.index['responses'])} responses: {self.directory}")
+
+
+def record(
+    fixtures, api_base, dimensions, delay=0.35, timeout=collector.SOCKET_TIMEOUT
+):
+    writer = FixtureWriter(fixtures, api_base)
+    for index, url in enumerate(fixture_urls(dimensions, api_base)):
+        if index and delay > 0:
+            time.sleep(delay)
+        with urlopen(
+            Request(url, headers=collector.REQUEST_HEADERS), timeout=timeout
+        ) as response:
+            headers = dict(response.headers.items())
+            body = response.read()
+        if headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        json.loads(body)
+        writer.add(url, headers, body)
+        print(f"recorded {fixture_key(url)} ({len(body):,} bytes)")
+    writer.close()
+
+
+def synthesize(fixtures, dimensions, characters=80, weapons=3, seed=1):
+    writer = FixtureWriter(fixtures, "synthetic")
+    metadata = bench.synthetic_characters(characters)
+    body = json.dumps(
+        {
+            "characters": [
+                {"id": int(character_id), **character}
+                for character_id, character in metadata.items()
+            ]
+        }
+    ).encode("utf-8")
+    writer.add(collector.character_url(), {"Content-Type": "application/json"}, body)
+    for dimension in dimensions:
+        for tier_key, _ in collector.TIERS:
+            payload = bench.synthetic_payload(
+                tier_key,
+                characters,
+                weapons,
+                f"{seed}:{dimension.key}",
+                dimension.period_days,
+            )
+            payload["meta"].update(
+                matchingMode=dimension.matching_mode, teamMode=dimension.team_mode
+            )
+            writer.add(
+                collector.tier_url(tier_key, dimension),
+                {"Content-Type": "application/json"},
+                json.dumps(payload).encode("utf-8"),
+            )
+    writer.close()
+
+
+def load_fixtures(directory):
+    """Return ``{fixture_key: (headers, body)}`` for a fixture directory.
+
+    Responses recorded without validators get a strong ETag derived from
+    their body, so conditional requests can still be answered with 304.
+    """
+    index = json.loads((directory / INDEX_NAME).read_text(encoding="utf-8"))
+    responses = {}
+    for key, entry in index["responses"].items():
+        body = gzip.decompress((directory / entry["body"]).read_bytes())
+        headers = dict(entry["headers"])
+        if not any(name.lower() in ("etag", "last-modified") for name in headers):
+            headers["ETag"] = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        responses[key] = (headers, body)
+    return responses
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """HTTP server that answers DAK.GG requests from a fixture directory."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        fixtures,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=503,
+        rate_limit=None,
+        burst=1,
+        honor_validators=True,
+        seed=None,
+        verbose=False,
+    ):
+        self.responses = load_fixtures(fixtures)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.honor_validators = honor_validators
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.counts = Counter()
+        super().__init__(address, FixtureHandler)
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self):
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def fails(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def throttled(self):
+        """Take a token from the rate limit bucket, or return True when it is
+        empty."""
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate_limit
+            )
+            self.updated = now
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+            return False
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = "DakggFixtures/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def reply(self, status, headers=(), body=b""):
+        self.server.counts[status] += 1
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.delay())
+        if server.throttled():
+            retry = math.ceil(1 / server.rate_limit)
+            self.reply(429, [("Retry-After", str(retry))])
+            return
+        if server.fails():
+            self.reply(server.error_status)
+            return
+        fixture = server.responses.get(fixture_key(self.path))
+        if fixture is None:
+            self.reply(404)
+            return
+
+        headers, body = fixture
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if server.honor_validators and (
+            (etag and self.headers.get("If-None-Match") == etag)
+            or (
+                last_modified
+                and "If-None-Match" not in self.headers
+                and self.headers.get("If-Modified-Since") == last_modified
+            )
+        ):
+            validators = [("ETag", etag), ("Last-Modified", last_modified)]
+            self.reply(304, [(name, value) for name, value in validators if value])
+            return
+        headers = list(headers.items())
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, mtime=0)
+            headers.append(("Content-Encoding", "gzip"))
+        self.reply(200, headers, body)
+
+
+def main():
+    args = parse_args()
+    if args.command == "serve":
+        server = FixtureServer(
+            (args.host, args.port),
+            args.fixtures,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            rate_limit=args.rate_limit,
+            burst=args.burst,
+            honor_validators=not args.ignore_validators,
+            seed=args.seed,
+            verbose=args.verbose,
+        )
+        print(
+            f"serving {len(server.responses)} responses from {args.fixtures};"
+            f" run the collector with --api-base {server.api_base}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            counts = sorted(server.counts.items())
+            print(", ".join(f"HTTP {status}: {count}" for status, count in counts))
+        return 0
+
+    dimensions = collector.dimension_matrix(
+        args.matching_mode, args.team_mode, args.period_days
+    )
+    if args.command == "record":
+        try:
+            record(args.fixtures, args.api_base, dimensions, args.delay, args.timeout)
+        except HTTPError as exc:
+            print(f"recording failed: {exc}")
+            return 1
+    else:
+        synthesize(args.fixtures, dimensions, args.characters, args.weapons, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
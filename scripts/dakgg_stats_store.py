@@ -0,0 +1,347 @@
+"""Read-side API over the database written by ``collect_dakgg_stats.py``.
+
+``DakggStatsStore`` answers typed lookups (a character in a tier, the weapons
+of a character, top-N by a metric, cross-tier comparisons) from read-only
+SQLite connections, one per thread, and keeps recent results in an LRU cache.
+The cache is dropped when the collection metadata changes, whether the
+database was updated in place or replaced by a new refresh.
+
+    from dakgg_stats_store import DakggStatsStore
+
+    with DakggStatsStore() as store:
+        store.top_characters("diamond_plus", "win_rate", limit=5, min_games=500)
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import closing
+
+import collect_dakgg_stats as collector
+
+
+def _table_columns(table):
+    with closing(sqlite3.connect(":memory:")) as conn:
+        conn.executescript(collector.SCHEMA)
+        return tuple(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+CollectionMeta = namedtuple("CollectionMeta", _table_columns("collection_meta"))
+TierSnapshot = namedtuple("TierSnapshot", _table_columns("tier_snapshots"))
+CharacterStats = namedtuple("CharacterStats", _table_columns("character_stats"))
+WeaponStats = namedtuple("WeaponStats", _table_columns("weapon_stats"))
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+KEY_COLUMNS = {"dimension_key", "tier_key", "character_id", "weapon_id", "dak_tier"}
+CHARACTER_METRICS = tuple(
+    field for field in CharacterStats._fields if field not in KEY_COLUMNS
+)
+WEAPON_METRICS = tuple(
+    field for field in WeaponStats._fields if field not in KEY_COLUMNS
+)
+CHARACTER_COLUMNS = ", ".join(CharacterStats._fields)
+WEAPON_COLUMNS = ", ".join(WeaponStats._fields)
+
+# Fixed SQL text lets each connection reuse its prepared statements.
+CHARACTER_SQL = f"""
+SELECT {CHARACTER_COLUMNS} FROM character_stats
+WHERE dimension_key = ? AND tier_key = ? AND character_id = ?
+"""
+WEAPONS_SQL = f"""
+SELECT {WEAPON_COLUMNS} FROM weapon_stats
+WHERE dimension_key = ? AND tier_key = ? AND character_id = ?
+ORDER BY game_count DESC, weapon_id
+"""
+TIERS_SQL = f"""
+SELECT {", ".join(TierSnapshot._fields)} FROM tier_snapshots
+WHERE dimension_key = ?
+ORDER BY rowid
+"""
+META_SQL = f"""
+SELECT {", ".join(CollectionMeta._fields)} FROM collection_meta
+ORDER BY rowid
+"""
+
+
+class DakggStatsStore:
+    """Cached, thread-safe read access to ``dakgg_stats.sqlite3``.
+
+    Lookups default to the store's ``dimension_key`` (the RANK/SQUAD/7 day
+    collection unless given). Results are immutable tuples and namedtuples, so
+    cached values can be shared freely. Each thread gets its own read-only
+    connection; all of them are reopened when the file is replaced.
+    """
+
+    def __init__(self, path=None, dimension_key=None, cache_size=1024):
+        self.path = (path or collector.DEFAULT_DB_PATH).resolve()
+        self.dimension_key = dimension_key or collector.DEFAULT_DIMENSION.key
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.file_key = None
+        self.generation = 0
+        self.meta_key = None
+        self.epoch = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+            self.generation += 1
+        for conn in connections:
+            conn.close()
+
+    def cache_info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.cache_size, len(self.cache))
+
+    def clear_cache(self):
+        with self.lock:
+            self.cache.clear()
+            self.epoch += 1
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            f"{self.path.as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != collector.SCHEMA_VERSION:
+            conn.close()
+            raise ValueError(
+                f"{self.path} has schema version {version}, expected"
+                f" {collector.SCHEMA_VERSION}; run collect_dakgg_stats.py"
+                " --full-rebuild"
+            )
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def _connection(self):
+        """Return this thread's connection after dropping stale state.
+
+        A new file (a refresh replaces the database) reopens every
+        connection, and a changed ``PRAGMA data_version`` (an update in
+        place) re-reads the collection metadata; the cache is only cleared
+        when that metadata differs.
+        """
+        stat = os.stat(self.path)
+        file_key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if file_key != self.file_key:
+                self.file_key = file_key
+                self.generation += 1
+            generation = self.generation
+
+        local = self.local
+        if getattr(local, "generation", None) != generation:
+            if getattr(local, "conn", None) is not None:
+                with self.lock:
+                    if local.conn in self.connections:
+                        self.connections.remove(local.conn)
+                local.conn.close()
+            local.conn = self._connect()
+            local.generation = generation
+            local.data_version = None
+
+        data_version = local.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != local.data_version:
+            local.data_version = data_version
+            meta_key = tuple(local.conn.execute(META_SQL))
+            with self.lock:
+                if meta_key != self.meta_key:
+                    self.meta_key = meta_key
+                    self.cache.clear()
+                    self.epoch += 1
+        return local.conn
+
+    def _cached(self, key, compute):
+        conn = self._connection()
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+            epoch = self.epoch
+        value = compute(conn)
+        with self.lock:
+            # A result computed while the cache was being invalidated may
+            # come from the old data and is returned without being kept.
+            if epoch == self.epoch and self.cache_size > 0:
+                self.cache[key] = value
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return value
+
+    def dimensions(self):
+        """Every collected dimension as ``CollectionMeta`` rows."""
+        return self._cached(
+            ("dimensions",),
+            lambda conn: tuple(map(CollectionMeta._make, conn.execute(META_SQL))),
+        )
+
+    def tiers(self, dimension_key=None):
+        """The ``TierSnapshot`` rows of a dimension, in collection order."""
+        dimension_key = dimension_key or self.dimension_key
+        return self._cached(
+            ("tiers", dimension_key),
+            lambda conn: tuple(
+                map(TierSnapshot._make, conn.execute(TIERS_SQL, (dimension_key,)))
+            ),
+        )
+
+    def character(self, tier_key, character_id, dimension_key=None):
+        """``CharacterStats`` of one character in one tier, or None."""
+        key = (dimension_key or self.dimension_key, tier_key, int(character_id))
+
+        def compute(conn):
+            row = conn.execute(CHARACTER_SQL, key).fetchone()
+            return CharacterStats._make(row) if row else None
+
+        return self._cached(("character", *key), compute)
+
+    def weapons(self, tier_key, character_id, dimension_key=None):
+        """``WeaponStats`` of a character in a tier, most played first."""
+        key = (dimension_key or self.dimension_key, tier_key, int(character_id))
+        return self._cached(
+            ("weapons", *key),
+            lambda conn: tuple(map(WeaponStats._make, conn.execute(WEAPONS_SQL, key))),
+        )
+
+    def top_characters(
+        self,
+        tier_key,
+        metric="win_rate",
+        limit=10,
+        min_games=0,
+        ascending=False,
+        dimension_key=None,
+    ):
+        """The ``limit`` characters of a tier with the highest ``metric``
+        (lowest with ``ascending``) among those with ``min_games`` games."""
+        return self._top(
+            "character_stats",
+            CharacterStats,
+            CHARACTER_METRICS,
+            ("character_id",),
+            tier_key,
+            metric,
+            limit,
+            min_games,
+            ascending,
+            dimension_key,
+        )
+
+    def top_weapons(
+        self,
+        tier_key,
+        metric="win_rate",
+        limit=10,
+        min_games=0,
+        ascending=False,
+        dimension_key=None,
+    ):
+        """Like ``top_characters`` for character and weapon pairs."""
+        return self._top(
+            "weapon_stats",
+            WeaponStats,
+            WEAPON_METRICS,
+            ("character_id", "weapon_id"),
+            tier_key,
+            metric,
+            limit,
+            min_games,
+            ascending,
+            dimension_key,
+        )
+
+    def _top(
+        self,
+        table,
+        record,
+        metrics,
+        keys,
+        tier_key,
+        metric,
+        limit,
+        min_games,
+        ascending,
+        dimension_key,
+    ):
+        if metric not in metrics:
+            raise ValueError(f"unknown metric {metric!r}; expected one of {metrics}")
+        dimension_key = dimension_key or self.dimension_key
+        order = "ASC" if ascending else "DESC"
+        sql = f"""
+            SELECT {", ".join(record._fields)} FROM {table}
+            WHERE dimension_key = ? AND tier_key = ? AND game_count >= ?
+                AND {metric} IS NOT NULL
+            ORDER BY {metric} {order}, {", ".join(keys)}
+            LIMIT ?
+        """
+        parameters = (dimension_key, tier_key, min_games, limit)
+        return self._cached(
+            ("top", table, metric, order, *parameters),
+            lambda conn: tuple(map(record._make, conn.execute(sql, parameters))),
+        )
+
+    def compare_tiers(
+        self,
+        character_id,
+        weapon_id=None,
+        metrics=collector.COVERED_METRICS,
+        dimension_key=None,
+    ):
+        """``{tier_key: {metric: value}}`` of a character, or of one of its
+        weapons, across every tier of a dimension, in collection order.
+
+        The default metrics are stored in the character and weapon indexes,
+        so the rows are read from the index alone.
+        """
+        allowed = WEAPON_METRICS if weapon_id is not None else CHARACTER_METRICS
+        unknown = [metric for metric in metrics if metric not in allowed]
+        if unknown:
+            raise ValueError(f"unknown metrics {unknown}; expected some of {allowed}")
+        dimension_key = dimension_key or self.dimension_key
+        metrics = tuple(metrics)
+        if weapon_id is None:
+            table, where = "character_stats", "character_id = ?"
+            parameters = (int(character_id), dimension_key)
+        else:
+            table, where = "weapon_stats", "character_id = ? AND weapon_id = ?"
+            parameters = (int(character_id), int(weapon_id), dimension_key)
+        sql = f"""
+            SELECT tier_key, {", ".join(metrics)} FROM {table}
+            WHERE {where} AND dimension_key = ?
+        """
+
+        def compute(conn):
+            rows = {
+                row[0]: dict(zip(metrics, row[1:]))
+                for row in conn.execute(sql, parameters)
+            }
+            return {
+                tier.tier_key: rows[tier.tier_key]
+                for tier in self.tiers(dimension_key)
+                if tier.tier_key in rows
+            }
+
+        # The nested dictionaries are copied so callers cannot change the
+        # cached value.
+        result = self._cached(("compare", table, metrics, *parameters), compute)
+        return {tier_key: dict(values) for tier_key, values in result.items()}
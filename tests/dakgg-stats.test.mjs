@@ -1,11 +1,19 @@
 import assert from "node:assert/strict";
+import { execFileSync } from "node:child_process";
+import { mkdtemp, readFile, rm } from "node:fs/promises";
+import { createServer } from "node:http";
+import { tmpdir } from "node:os";
 import path from "node:path";
 import test from "node:test";
 import { fileURLToPath } from "node:url";
+import { gunzipSync } from "node:zlib";
 
 import {
+  applyArtifactDelta,
   compareMostCharacters,
   getDakggStats,
+  getDakggTierStats,
+  parseColumnarArtifact,
   resetDakggStatsCacheForTests,
   tierForMmr,
 } from "../netlify/functions/lib/dakgg-stats.mjs";
@@ -53,3 +61,363 @@ test("loads the artifact fallback and compares a most-played character", async (
   assert.ok(comparison.characters[0].baselineGames > 1000);
   assert.ok(comparison.characters[0].averageDamageDelta > 0);
 });
+
+test("reads precomputed estimates, derives tier standing and cross-tier baselines", async () => {
+  resetDakggStatsCacheForTests();
+  const data = structuredClone(await getDakggStats());
+  const stats = {
+    mmr: 3500,
+    totalGames: 10,
+    characterStats: [{ characterCode: 72, totalGames: 10, wins: 1, top3: 4 }],
+  };
+  const [legacy] = compareMostCharacters(stats, [], data).characters;
+  assert.equal(legacy.baselinePercentiles, null);
+  assert.equal(legacy.allTiersBaseline, null);
+  assert.equal(legacy.baselineWinRateInterval, null);
+
+  Object.assign(data.tiers.gold.characters["72"], {
+    winRateShrunk: 0.12,
+    winRateLow: 0.1,
+    winRateHigh: 0.14,
+  });
+  data.tiers.gold.metrics = { winRate: { mean: 0.1, stddev: 0.02, p50: 0.1 } };
+  data.allTiers = { characters: { 72: { games: 5000, winRate: 0.11 } } };
+  const [character] = compareMostCharacters(stats, [], data).characters;
+
+  const winRates = Object.values(data.tiers.gold.characters).map((entry) => entry.winRate);
+  const winRate = data.tiers.gold.characters["72"].winRate;
+  const below = winRates.filter((value) => value < winRate).length;
+  const ties = winRates.filter((value) => value === winRate).length;
+  assert.deepEqual(character.baselinePercentiles, {
+    winRate: Number(((below + ties / 2) / winRates.length).toFixed(3)),
+    top3Rate: null,
+    averagePlacement: null,
+    averageDamage: null,
+  });
+  assert.equal(
+    character.baselineZScores.winRate,
+    Number(((winRate - 0.1) / 0.02).toFixed(2)),
+  );
+  assert.equal(character.baselineWinRateShrunk, 0.12);
+  assert.deepEqual(character.baselineWinRateInterval, [0.1, 0.14]);
+  assert.equal(character.baselineTop3RateInterval, null);
+  assert.deepEqual(character.allTiersBaseline, { games: 5000, winRate: 0.11 });
+});
+
+const bundledPath = path.resolve(here, "../data/dakgg_stats.json.gz");
+
+function runCollector(lines, input, extraArgs = []) {
+  const script = [
+    "import gzip, json, sys",
+    "sys.path.insert(0, sys.argv[1])",
+    "import collect_dakgg_stats as collector",
+    "artifact = json.load(gzip.open(sys.argv[2]))",
+    ...lines,
+  ].join("\n");
+  return execFileSync(
+    process.env.PYTHON_BIN || "python3",
+    ["-c", script, path.resolve(here, "../scripts"), bundledPath, ...extraArgs],
+    { input },
+  );
+}
+
+async function readBundled() {
+  return JSON.parse(gunzipSync(await readFile(bundledPath)).toString("utf8"));
+}
+
+test("decodes the columnar artifact to the JSON artifact", async () => {
+  const columnar = runCollector([
+    "sys.stdout.buffer.write(collector.encode_columnar_artifact(artifact))",
+  ]);
+
+  assert.deepEqual(parseColumnarArtifact(columnar), await readBundled());
+});
+
+test("decodes the typed lookup-table sections to the JSON tables", async (t) => {
+  const directory = await mkdtemp(path.join(tmpdir(), "dakgg-tables-"));
+  t.after(() => rm(directory, { recursive: true, force: true }));
+  const jsonPath = path.join(directory, "dakgg_stats.json");
+  const columnar = runCollector(
+    [
+      "import contextlib, io, pathlib",
+      "import bench_dakgg_collector as bench",
+      "directory = pathlib.Path(sys.argv[3])",
+      "payloads = [",
+      "    (key, label, bench.synthetic_payload(key, 6, 2, seed=1))",
+      "    for key, label in collector.TIERS[4:7]",
+      "]",
+      "with contextlib.redirect_stdout(io.StringIO()):",
+      "    collector.build_database(directory / 'db.sqlite3', payloads, 7)",
+      "artifact = collector.release_artifact(",
+      "    directory / 'db.sqlite3', bench.synthetic_characters(6)",
+      ")",
+      "(directory / 'dakgg_stats.json').write_bytes(",
+      "    collector.encode_artifact(artifact)",
+      ")",
+      "sys.stdout.buffer.write(collector.encode_columnar_artifact(artifact))",
+    ],
+    undefined,
+    [directory],
+  );
+  const expected = JSON.parse(await readFile(jsonPath, "utf8"));
+
+  const decoded = parseColumnarArtifact(columnar);
+  const [tierKey, tier] = Object.entries(expected.tiers)[0];
+
+  assert.ok(Object.keys(tier.metrics).length > 0);
+  assert.deepEqual(decoded.tiers[tierKey].metrics, tier.metrics);
+  assert.deepEqual(decoded.allTiers.characters, expected.allTiers.characters);
+  assert.deepEqual(decoded, expected);
+});
+
+test("applies a collector delta to the previous artifact", async () => {
+  const base = await readBundled();
+  base.tiers.gold.metrics = {
+    winRate: { mean: 0.1, stddev: 0.02 },
+    top3Rate: { mean: 0.4, stddev: 0.05 },
+  };
+  base.allTiers = {
+    tiers: ["gold"],
+    games: base.tiers.gold.games,
+    characters: { 1: { games: 10 }, 72: { games: 20 } },
+  };
+  const target = structuredClone(base);
+  target.collectedAt = "2030-01-01T00:00:00+00:00";
+  target.tiers.gold.characters["72"].games += 10;
+  target.tiers.gold.metrics.winRate.mean = 0.11;
+  target.allTiers.characters["72"].games += 10;
+  delete target.tiers.iron;
+  const delta = JSON.parse(
+    runCollector(
+      [
+        "versions = json.load(sys.stdin)",
+        "print(json.dumps(collector.artifact_delta(*versions)))",
+      ],
+      JSON.stringify([base, target]),
+    ).toString("utf8"),
+  );
+
+  assert.deepEqual(Object.keys(delta.tiers.gold.metrics), ["winRate"]);
+  assert.deepEqual(Object.keys(delta.allTiers.characters), ["72"]);
+  assert.deepEqual(applyArtifactDelta(base, delta), target);
+  assert.throws(() => applyArtifactDelta(target, delta));
+});
+
+test("applies a release delta only to the version it was built from", async (t) => {
+  const releaseDir = await mkdtemp(path.join(tmpdir(), "dakgg-delta-"));
+  t.after(() => rm(releaseDir, { recursive: true, force: true }));
+  runCollector([
+    "from pathlib import Path",
+    "directory = Path(sys.argv[3])",
+    "base = dict(artifact, collectedAt='2030-01-01T00:00:00+00:00')",
+    "target = json.loads(json.dumps(base))",
+    "target['collectedAt'] = '2030-01-02T00:00:00+00:00'",
+    "target['tiers']['gold']['characters']['72']['games'] += 10",
+    "stale = json.loads(json.dumps(base))",
+    "stale['tiers']['gold']['characters']['72']['games'] += 1",
+    "def release(name, served, published, delta=None):",
+    "    out = directory / name",
+    "    out.mkdir()",
+    "    path = out / 'dakgg_stats.json.gz'",
+    "    collector.write_compressed(path, collector.encode_artifact(served))",
+    "    version = collector.artifact_hash(published)",
+    "    manifest = {",
+    "        'schemaVersion': 1,",
+    "        'version': version,",
+    "        'collectedAt': published['collectedAt'],",
+    "        'full': collector.file_entry(path, version),",
+    "    }",
+    "    if delta is not None:",
+    "        encoded = collector.encode_artifact(delta)",
+    "        delta_path = out / 'dakgg_stats.delta.json.gz'",
+    "        collector.write_compressed(delta_path, encoded)",
+    "        manifest['delta'] = {",
+    "            **collector.file_entry(",
+    "                delta_path, collector.hashlib.sha256(encoded).hexdigest()",
+    "            ),",
+    "            'base': delta['baseHash'],",
+    "            'target': delta['targetHash'],",
+    "        }",
+    "    (out / 'dakgg_stats.manifest.json').write_text(json.dumps(manifest))",
+    "release('base', base, base)",
+    "release('stale', stale, base)",
+    "release('next', target, target, collector.artifact_delta(base, target))",
+  ], undefined, [releaseDir]);
+  let served = "base";
+  let requested = [];
+  const server = createServer(async (request, response) => {
+    const name = path.basename(new URL(request.url, "http://localhost").pathname);
+    requested.push(name);
+    try {
+      response.end(await readFile(path.join(releaseDir, served, name)));
+    } catch {
+      response.statusCode = 404;
+      response.end();
+    }
+  });
+  await new Promise((resolve) => server.listen(0, "127.0.0.1", resolve));
+  const statsUrl = process.env.DAKGG_STATS_URL;
+  t.after(() => {
+    process.env.DAKGG_STATS_URL = statsUrl;
+    resetDakggStatsCacheForTests();
+    server.close();
+  });
+  const { port } = server.address();
+  process.env.DAKGG_STATS_URL = `http://127.0.0.1:${port}/dakgg_stats.json.gz`;
+  t.mock.timers.enable({ apis: ["Date"], now: Date.now() });
+  const refresh = async (from) => {
+    served = from;
+    await getDakggStats();
+    served = "next";
+    requested = [];
+    t.mock.timers.tick(7 * 60 * 60 * 1000);
+    return getDakggStats();
+  };
+
+  resetDakggStatsCacheForTests();
+  const target = await refresh("base");
+  assert.equal(target.collectedAt, "2030-01-02T00:00:00+00:00");
+  assert.deepEqual(requested.sort(), [
+    "dakgg_stats.delta.json.gz",
+    "dakgg_stats.manifest.json",
+  ]);
+
+  resetDakggStatsCacheForTests();
+  assert.deepEqual(await refresh("stale"), target);
+  assert.deepEqual(requested.sort(), [
+    "dakgg_stats.json.gz",
+    "dakgg_stats.manifest.json",
+  ]);
+});
+
+test("loads only the requested tier from artifact shards", async (t) => {
+  const shardDir = await mkdtemp(path.join(tmpdir(), "dakgg-shards-"));
+  t.after(() => rm(shardDir, { recursive: true, force: true }));
+  runCollector([
+    "from pathlib import Path",
+    "version = collector.artifact_hash(artifact)",
+    "collector.write_artifact_shards(Path(sys.argv[3]), artifact, version)",
+  ], undefined, [shardDir]);
+  const requested = [];
+  const server = createServer(async (request, response) => {
+    const name = path.basename(new URL(request.url, "http://localhost").pathname);
+    requested.push(name);
+    try {
+      response.end(await readFile(path.join(shardDir, name)));
+    } catch {
+      response.statusCode = 404;
+      response.end();
+    }
+  });
+  await new Promise((resolve) => server.listen(0, "127.0.0.1", resolve));
+  const statsUrl = process.env.DAKGG_STATS_URL;
+  t.after(() => {
+    process.env.DAKGG_STATS_URL = statsUrl;
+    resetDakggStatsCacheForTests();
+    server.close();
+  });
+  const { port } = server.address();
+  process.env.DAKGG_STATS_URL = `http://127.0.0.1:${port}/dakgg_stats.bin.gz`;
+  resetDakggStatsCacheForTests();
+
+  t.mock.timers.enable({ apis: ["Date"], now: Date.now() });
+
+  const bundled = await readBundled();
+  const gold = await getDakggTierStats("gold");
+  const { tiers, ...rest } = bundled;
+
+  assert.deepEqual(gold, { ...rest, tiers: { gold: tiers.gold } });
+  await getDakggTierStats("gold");
+  assert.deepEqual(requested.sort(), [
+    "dakgg_stats.characters.json.gz",
+    "dakgg_stats.shards.json",
+    "dakgg_stats.tier.gold.json.gz",
+  ]);
+
+  // A new version that changes another tier keeps the cached shards.
+  runCollector([
+    "from pathlib import Path",
+    "artifact['tiers']['iron']['games'] += 1",
+    "version = collector.artifact_hash(artifact)",
+    "collector.write_artifact_shards(Path(sys.argv[3]), artifact, version)",
+  ], undefined, [shardDir]);
+  requested.length = 0;
+  t.mock.timers.tick(7 * 60 * 60 * 1000);
+
+  assert.deepEqual(await getDakggTierStats("gold"), gold);
+  assert.deepEqual(requested, ["dakgg_stats.shards.json"]);
+});
+
+test("reads release files compressed with a preset dictionary", async (t) => {
+  const releaseDir = await mkdtemp(path.join(tmpdir(), "dakgg-codec-"));
+  t.after(() => rm(releaseDir, { recursive: true, force: true }));
+  runCollector([
+    "from pathlib import Path",
+    "directory = Path(sys.argv[3])",
+    "artifact['collectedAt'] = '2030-01-01T00:00:00+00:00'",
+    "codec = collector.parse_codec('zlib:9')",
+    "encoded = collector.encode_artifact(artifact)",
+    "version = collector.artifact_hash(artifact)",
+    "dictionary = collector.build_dictionary([encoded])",
+    "dictionary_path = directory / 'dakgg_stats.zdict'",
+    "dictionary_path.write_bytes(dictionary)",
+    "entry = collector.file_entry(",
+    "    dictionary_path, collector.hashlib.sha256(dictionary).hexdigest()",
+    ")",
+    "columnar_path = directory / 'dakgg_stats.bin.gz'",
+    "columnar = collector.encode_columnar_artifact(artifact)",
+    "collector.write_compressed(columnar_path, columnar, codec, dictionary)",
+    "collector.write_artifact_shards(",
+    "    directory, artifact, version, codec, dictionary, entry",
+    ")",
+    "manifest = {",
+    "    'schemaVersion': 1,",
+    "    'version': version,",
+    "    'collectedAt': artifact['collectedAt'],",
+    "    'dictionary': entry,",
+    "    'columnar': {",
+    "        **collector.file_entry(",
+    "            columnar_path, collector.hashlib.sha256(columnar).hexdigest()",
+    "        ),",
+    "        'codec': collector.codec_entry(codec, entry),",
+    "    },",
+    "}",
+    "(directory / 'dakgg_stats.manifest.json').write_text(json.dumps(manifest))",
+  ], undefined, [releaseDir]);
+  const requested = [];
+  const server = createServer(async (request, response) => {
+    const name = path.basename(new URL(request.url, "http://localhost").pathname);
+    requested.push(name);
+    try {
+      response.end(await readFile(path.join(releaseDir, name)));
+    } catch {
+      response.statusCode = 404;
+      response.end();
+    }
+  });
+  await new Promise((resolve) => server.listen(0, "127.0.0.1", resolve));
+  const statsUrl = process.env.DAKGG_STATS_URL;
+  t.after(() => {
+    process.env.DAKGG_STATS_URL = statsUrl;
+    resetDakggStatsCacheForTests();
+    server.close();
+  });
+  const { port } = server.address();
+  process.env.DAKGG_STATS_URL = `http://127.0.0.1:${port}/dakgg_stats.bin.gz`;
+  resetDakggStatsCacheForTests();
+
+  const released = {
+    ...(await readBundled()),
+    collectedAt: "2030-01-01T00:00:00+00:00",
+  };
+  const { tiers, ...rest } = released;
+  assert.deepEqual(await getDakggTierStats("gold"), {
+    ...rest,
+    tiers: { gold: tiers.gold },
+  });
+  assert.deepEqual(await getDakggStats(), released);
+  assert.equal(
+    requested.filter((name) => name === "dakgg_stats.zdict").length,
+    1,
+  );
+});
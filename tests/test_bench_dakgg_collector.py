@@ -0,0 +1,68 @@
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import bench_dakgg_collector as bench  # noqa: E402
+import collect_dakgg_stats as collector  # noqa: E402
+
+
+class SyntheticPayloadTest(unittest.TestCase):
+    def test_payloads_are_deterministic_and_valid(self):
+        tiers = bench.synthetic_tiers(12, dimensions=2)
+
+        self.assertEqual(len(tiers), 24)
+        self.assertEqual(len({tier_key for tier_key, _ in tiers}), 24)
+        for tier_key, _ in tiers[::5]:
+            payload = bench.synthetic_payload(tier_key, 5, 3, seed=7)
+            self.assertEqual(payload, bench.synthetic_payload(tier_key, 5, 3, seed=7))
+            collector.decode_tier(payload, tier_key)
+
+
+class ReleasePhaseTest(unittest.TestCase):
+    def test_release_phases_time_what_they_name(self):
+        payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 4, 2, seed=1))
+            for tier_key, tier_label in bench.synthetic_tiers(3)
+        ]
+        records = bench.decode_payloads(payloads)
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            with contextlib.redirect_stdout(io.StringIO()):
+                bench.prepare_release(payloads, records, directory)
+                for _ in range(2):
+                    self.assertTrue(
+                        bench.run_build_release_artifact(payloads, records, directory)
+                    )
+                    self.assertFalse(
+                        bench.run_release_unchanged(payloads, records, directory)
+                    )
+
+
+class BaselineTest(unittest.TestCase):
+    def results(self, rows_per_second):
+        return {
+            "config": {"tiers": 1, "repeat": 3},
+            "phases": {
+                phase: {"seconds": 1.0, "rowsPerSecond": value}
+                for phase, value in rows_per_second.items()
+            },
+        }
+
+    def test_reports_phases_slower_than_the_threshold(self):
+        baseline = self.results({"validate": 100.0, "insert": 100.0})
+        current = self.results({"validate": 95.0, "insert": 70.0})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            regressions = bench.compare_to_baseline(current, baseline, 0.2)
+
+        self.assertEqual(regressions, ["insert"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import gzip
+import json
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import bench_dakgg_compression as bench  # noqa: E402
+import collect_dakgg_stats as collector  # noqa: E402
+
+
+class CodecBenchTest(unittest.TestCase):
+    def test_measures_every_form_and_codec(self):
+        with gzip.open(ROOT / "data" / "dakgg_stats.json.gz") as source:
+            artifact = json.load(source)
+        forms = bench.artifact_forms(artifact)
+        dictionary = collector.build_dictionary(forms["json"])
+
+        results = bench.bench_codecs(
+            forms, ["gzip:1", "zlib:9+dictionary"], dictionary, repeat=1
+        )
+
+        self.assertEqual(list(results), list(bench.FORMS))
+        self.assertEqual(len(forms["shards"]), len(artifact["tiers"]) + 1)
+        for form, codecs in results.items():
+            for spec, result in codecs.items():
+                with self.subTest(form=form, spec=spec):
+                    self.assertEqual(result["rawBytes"], sum(map(len, forms[form])))
+                    self.assertGreater(result["bytes"], 0)
+                    self.assertGreater(result["decompressSeconds"], 0)
+
+    def test_defaults_only_to_available_codecs(self):
+        for spec in bench.default_codecs():
+            collector.parse_codec(spec.partition("+")[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,1528 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+from urllib.error import HTTPError
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import bench_dakgg_collector as bench  # noqa: E402
+import collect_dakgg_stats as collector  # noqa: E402
+
+BUNDLED_ARTIFACT = ROOT / "data" / "dakgg_stats.json.gz"
+
+
+def bundled_artifact():
+    with gzip.open(BUNDLED_ARTIFACT) as source:
+        return json.load(source)
+
+
+class ColumnarArtifactTest(unittest.TestCase):
+    def test_round_trips_the_bundled_artifact(self):
+        artifact = bundled_artifact()
+        encoded = collector.encode_columnar_artifact(artifact)
+
+        self.assertEqual(encoded[:4], collector.COLUMNAR_MAGIC)
+        self.assertEqual(collector.decode_columnar_artifact(encoded), artifact)
+
+    def test_keeps_fields_outside_the_columnar_layout(self):
+        artifact = bundled_artifact()
+        tier = next(iter(artifact["tiers"].values()))
+        entry = next(iter(tier["characters"].values()))
+        artifact["extraTopLevel"] = {"a": 1}
+        tier["extraTierField"] = [1, 2]
+        entry["extraCharacterField"] = 0.5
+
+        decoded = collector.decode_columnar_artifact(
+            collector.encode_columnar_artifact(artifact)
+        )
+
+        self.assertEqual(decoded, artifact)
+
+    def test_stores_the_lookup_tables_as_typed_sections(self):
+        payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 6, 2, seed=1))
+            for tier_key, tier_label in collector.TIERS[4:7]
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "dakgg_stats.sqlite3"
+            with contextlib.redirect_stdout(io.StringIO()):
+                collector.build_database(db_path, payloads, 7)
+            artifact = collector.release_artifact(
+                db_path, bench.synthetic_characters(6)
+            )
+        tier = next(iter(artifact["tiers"].values()))
+        self.assertTrue(tier["metrics"])
+        self.assertTrue(artifact["allTiers"]["characters"])
+
+        encoded = collector.encode_columnar_artifact(artifact)
+        decoded = collector.decode_columnar_artifact(encoded)
+
+        self.assertEqual(decoded, artifact)
+        self.assertEqual(
+            collector.artifact_hash(decoded), collector.artifact_hash(artifact)
+        )
+        self.assertNotIn(b'"metrics"', encoded)
+        self.assertNotIn(b'"winRate"', encoded)
+        self.assertLess(len(encoded), len(collector.encode_artifact(artifact)))
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            collector.decode_columnar_artifact(b"\x00" * 64)
+
+
+def changed_artifact(artifact):
+    target = json.loads(json.dumps(artifact))
+    target["collectedAt"] = "2030-01-01T00:00:00+00:00"
+    tier_key, tier = next(iter(target["tiers"].items()))
+    tier["updatedAt"] += 1
+    character_id = next(iter(tier["characters"]))
+    tier["characters"][character_id]["games"] += 10
+    del tier["characters"][list(tier["characters"])[-1]]
+    del target["tiers"][list(target["tiers"])[-1]]
+    return target
+
+
+class DeltaArtifactTest(unittest.TestCase):
+    def test_delta_reproduces_the_target(self):
+        base = bundled_artifact()
+        target = changed_artifact(base)
+
+        delta = collector.artifact_delta(base, target)
+
+        self.assertEqual(delta["baseHash"], collector.artifact_hash(base))
+        self.assertEqual(delta["targetHash"], collector.artifact_hash(target))
+        self.assertEqual(len(delta["tiers"]), 1)
+        self.assertEqual(len(delta["removeTiers"]), 1)
+        self.assertEqual(collector.apply_artifact_delta(base, delta), target)
+
+    def test_replaces_only_the_changed_table_entries(self):
+        payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 8, 2, seed=1))
+            for tier_key, tier_label in collector.TIERS[4:7]
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "dakgg_stats.sqlite3"
+            artifacts = []
+            for _ in range(2):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    collector.build_database(db_path, payloads, 7)
+                artifacts.append(
+                    collector.release_artifact(db_path, bench.synthetic_characters(8))
+                )
+                gold = payloads[2][2]
+                gold["meta"]["updatedAt"] += 1000
+                weapon = gold["characterStatSnapshot"]["characterStats"][0][
+                    "weaponStats"
+                ][0]
+                weapon["count"] += 50
+                weapon["win"] += 10
+        base, target = artifacts
+
+        delta = collector.artifact_delta(base, target)
+
+        self.assertEqual(list(delta["tiers"]), ["gold"])
+        tier_delta = delta["tiers"]["gold"]
+        self.assertEqual(set(tier_delta["set"]), {"updatedAt"})
+        base_characters = base["tiers"]["gold"]["characters"]
+        self.assertIn("1", tier_delta["characters"])
+        self.assertEqual(
+            set(tier_delta["characters"]),
+            {
+                key
+                for key, entry in target["tiers"]["gold"]["characters"].items()
+                if base_characters[key] != entry
+            },
+        )
+        self.assertIn("winRate", tier_delta["metrics"])
+        self.assertNotIn("allTiers", delta["set"])
+        self.assertEqual(
+            delta["allTiers"]["characters"],
+            {"1": target["allTiers"]["characters"]["1"]},
+        )
+        self.assertEqual(collector.apply_artifact_delta(base, delta), target)
+
+    def test_rejects_a_different_base(self):
+        base = bundled_artifact()
+        delta = collector.artifact_delta(base, changed_artifact(base))
+
+        with self.assertRaises(ValueError):
+            collector.apply_artifact_delta(changed_artifact(base), delta)
+
+
+class ArtifactShardsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.shard_dir = Path(directory.name)
+        self.artifact = bundled_artifact()
+        self.version = collector.artifact_hash(self.artifact)
+        collector.write_artifact_shards(self.shard_dir, self.artifact, self.version)
+        self.index = json.loads(
+            (self.shard_dir / collector.SHARD_INDEX_NAME).read_text(encoding="utf-8")
+        )
+
+    def test_shards_merge_to_the_monolithic_artifact(self):
+        self.assertEqual(self.index["version"], self.version)
+        self.assertEqual(set(self.index["tiers"]), set(self.artifact["tiers"]))
+        for entry in (self.index["characters"], *self.index["tiers"].values()):
+            path = self.shard_dir / entry["file"]
+            self.assertEqual(path.stat().st_size, entry["bytes"])
+        self.assertEqual(
+            collector.read_artifact_shards(self.shard_dir), self.artifact
+        )
+
+    def test_tier_shard_holds_only_its_tier(self):
+        tier_key = next(iter(self.artifact["tiers"]))
+        shard = collector.read_shard(self.shard_dir, self.index["tiers"][tier_key])
+
+        self.assertEqual(shard["tierKey"], tier_key)
+        self.assertEqual(shard["tier"], self.artifact["tiers"][tier_key])
+        self.assertNotIn("characters", shard)
+
+    def test_removes_shards_of_dropped_tiers(self):
+        dropped = list(self.artifact["tiers"])[-1]
+        del self.artifact["tiers"][dropped]
+
+        collector.write_artifact_shards(
+            self.shard_dir, self.artifact, collector.artifact_hash(self.artifact)
+        )
+
+        self.assertFalse((self.shard_dir / collector.tier_shard_name(dropped)).exists())
+        self.assertEqual(
+            collector.read_artifact_shards(self.shard_dir), self.artifact
+        )
+
+    def test_rejects_a_shard_that_does_not_match_its_entry(self):
+        tier_key, entry = next(iter(self.index["tiers"].items()))
+        shard = collector.read_shard(self.shard_dir, entry)
+        shard["tier"]["games"] += 1
+        collector.write_compressed(
+            self.shard_dir / entry["file"], collector.encode_artifact(shard)
+        )
+
+        with self.assertRaisesRegex(ValueError, "content hash"):
+            collector.read_artifact_shards(self.shard_dir)
+
+    def test_rewrites_only_the_shards_that_changed(self):
+        tier_key = next(iter(self.artifact["tiers"]))
+        self.artifact["tiers"][tier_key]["games"] += 1
+        for path in self.shard_dir.iterdir():
+            os.utime(path, ns=(0, 0))
+
+        _, written = collector.write_artifact_shards(
+            self.shard_dir, self.artifact, collector.artifact_hash(self.artifact)
+        )
+
+        self.assertEqual(written, [collector.tier_shard_name(tier_key)])
+        self.assertEqual(
+            [
+                path.name
+                for path in sorted(self.shard_dir.iterdir())
+                if path.stat().st_mtime_ns
+            ],
+            sorted([collector.SHARD_INDEX_NAME, *written]),
+        )
+        self.assertEqual(
+            collector.read_artifact_shards(self.shard_dir), self.artifact
+        )
+
+        _, written = collector.write_artifact_shards(
+            self.shard_dir,
+            self.artifact,
+            collector.artifact_hash(self.artifact),
+            collector.parse_codec("zlib:6"),
+        )
+        self.assertEqual(len(written), len(self.artifact["tiers"]) + 1)
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = collector.Metrics()
+        with self.metrics.span("insert", tier="gold"):
+            pass
+        self.metrics.count("rows", 3, table="weapon_stats")
+        self.metrics.count("rows", 2, table="weapon_stats")
+        self.metrics.observe("http_request_seconds", 0.25, resource="tier gold")
+        self.metrics.observe("http_request_seconds", 0.5, resource="tier gold")
+
+    def test_appends_one_json_line_per_record(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "metrics.jsonl"
+            self.metrics.write(path)
+            self.metrics.write(path, "error")
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+
+        self.assertEqual(len(records), 8)
+        span, counter, samples, run = records[:4]
+        self.assertEqual((span["name"], span["labels"]), ("insert", {"tier": "gold"}))
+        self.assertEqual(counter["value"], 5)
+        self.assertEqual((samples["count"], samples["sum"]), (2, 0.75))
+        self.assertEqual(run["status"], "ok")
+        self.assertEqual(records[-1]["status"], "error")
+
+    def test_writes_prometheus_text(self):
+        text = self.metrics.prometheus("ok")
+
+        self.assertIn('dakgg_collector_span_seconds{span="insert",tier="gold"}', text)
+        self.assertIn('dakgg_collector_rows_total{table="weapon_stats"} 5', text)
+        self.assertIn(
+            'dakgg_collector_http_request_seconds_count{resource="tier gold"} 2', text
+        )
+        self.assertIn("dakgg_collector_run_success 1", text)
+        self.assertEqual(text.count("# TYPE dakgg_collector_rows_total"), 1)
+
+
+class AggregationEngineTest(unittest.TestCase):
+    engines = ["array"] + (["numpy"] if collector.numpy is not None else [])
+
+    def payload(self, **weapon_fields):
+        payload = bench.synthetic_payload("gold", 12, 5, seed=3)
+        characters = payload["characterStatSnapshot"]["characterStats"]
+        characters[2]["weaponStats"][0]["count"] = 0
+        characters[4]["weaponStats"][1].update(weapon_fields)
+        return payload
+
+    def assertMatchesReference(self, payload):
+        record = collector.decode_tier(payload, "gold")
+        expected = collector.python_tier_rows(("rank_squad_7d", "gold"), record)
+        legacy = [
+            ("rank_squad_7d", "gold", character["key"], *collector.normalized_row(
+                collector.aggregate_character(character)
+            ))
+            for character in payload["characterStatSnapshot"]["characterStats"]
+        ]
+        self.assertEqual(expected[0], legacy)
+        for engine in self.engines:
+            with self.subTest(engine=engine):
+                rows = collector.tier_rows(("rank_squad_7d", "gold"), record, engine)
+                self.assertEqual(rows, expected)
+                self.assertEqual(
+                    [list(map(type, row)) for row in rows[1]],
+                    [list(map(type, row)) for row in expected[1]],
+                )
+
+    def test_matches_the_reference_rows(self):
+        self.assertMatchesReference(self.payload())
+
+    def test_matches_values_that_need_coercion_or_defaults(self):
+        payload = self.payload(win="12", count=7.0)
+        del payload["characterStatSnapshot"]["characterStats"][5]["weaponStats"][0][
+            "teamKill"
+        ]
+        self.assertMatchesReference(payload)
+
+    def test_matches_totals_beyond_exact_floats(self):
+        self.assertMatchesReference(self.payload(damageToPlayer=2**53 + 1))
+        self.assertMatchesReference(self.payload(damageToPlayer=3**60))
+
+    def test_names_the_tier_character_and_weapon_in_errors(self):
+        with self.assertRaisesRegex(
+            ValueError, "^gold: character 5 weapon 101 win must be an integer$"
+        ):
+            collector.decode_tier(self.payload(win=True), "gold")
+        with self.assertRaisesRegex(ValueError, "^gold: character 5 weapon.key"):
+            collector.decode_tier(self.payload(key=None), "gold")
+
+        payload = self.payload()
+        for weapon in payload["characterStatSnapshot"]["characterStats"][0][
+            "weaponStats"
+        ]:
+            weapon["count"] = 0
+        with self.assertRaisesRegex(ValueError, "^gold: character 1 has no games$"):
+            collector.decode_tier(payload, "gold")
+
+    def test_records_use_slots(self):
+        record = collector.decode_tier(self.payload(), "gold")
+
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(len(record.character_ids), 12)
+        self.assertEqual(record.starts[-1], len(record.values))
+        self.assertEqual(len(record.values), 12 * 5 - 1)
+
+
+class ReleaseFastPathTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.db_path = self.directory / "stats.sqlite3"
+        payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 6, 2, seed=1))
+            for tier_key, tier_label in collector.TIERS[:3]
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(self.db_path, payloads, 7)
+        self.characters = bench.synthetic_characters(6)
+
+    def build(self, characters, **options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return collector.build_release_artifact(
+                self.db_path,
+                self.directory / "dakgg_stats.json.gz",
+                characters,
+                columnar_path=self.directory / "dakgg_stats.bin.gz",
+                manifest_path=self.directory / "dakgg_stats.manifest.json",
+                **options,
+            )
+
+    def test_skips_unchanged_inputs(self):
+        self.assertTrue(self.build(self.characters))
+        artifact_mtime = (self.directory / "dakgg_stats.json.gz").stat().st_mtime_ns
+
+        self.assertFalse(self.build(self.characters))
+        self.assertEqual(
+            (self.directory / "dakgg_stats.json.gz").stat().st_mtime_ns,
+            artifact_mtime,
+        )
+
+    def test_rebuilds_changed_inputs_or_missing_files(self):
+        self.assertTrue(self.build(self.characters))
+        self.characters["1"]["name"] = "Renamed"
+        self.assertTrue(self.build(self.characters))
+
+        (self.directory / "dakgg_stats.bin.gz").unlink()
+        self.assertTrue(self.build(self.characters))
+
+    def test_records_the_codec_and_keeps_the_dictionary(self):
+        self.assertTrue(self.build(self.characters))
+        dictionary_path = self.directory / "dakgg_stats.zdict"
+        shard_dir = self.directory / "shards"
+        options = {
+            "codec": collector.parse_codec("zlib:6"),
+            "dictionary_path": dictionary_path,
+            "shard_dir": shard_dir,
+            "delta_path": self.directory / "dakgg_stats.delta.json.gz",
+        }
+
+        self.assertTrue(self.build(self.characters, **options))
+        dictionary = dictionary_path.read_bytes()
+        manifest_path = self.directory / "dakgg_stats.manifest.json"
+        manifest = json.loads(manifest_path.read_text())
+        artifact = collector.read_artifact(self.directory / "dakgg_stats.json.gz")
+        codec = {"name": "zlib", "level": 6, "dictionary": manifest["dictionary"]}
+
+        self.assertEqual(manifest["full"]["codec"], {"name": "gzip", "level": 9})
+        self.assertEqual(manifest["columnar"]["codec"], codec)
+        self.assertEqual(manifest["delta"]["codec"], codec)
+        self.assertEqual(
+            (self.directory / "dakgg_stats.json.gz").read_bytes()[:2], b"\x1f\x8b"
+        )
+        columnar = (self.directory / "dakgg_stats.bin.gz").read_bytes()
+        self.assertEqual(
+            collector.decode_columnar_artifact(
+                collector.decompress(columnar, "zlib", dictionary)
+            ),
+            artifact,
+        )
+        shards = collector.read_artifact_shards(shard_dir, dictionary)
+        self.assertEqual(
+            shards,
+            collector.with_weapons(artifact, collector.release_weapons(self.db_path)),
+        )
+        self.assertFalse(self.build(self.characters, **options))
+
+        self.characters["1"]["name"] = "Renamed"
+        self.assertTrue(self.build(self.characters, **options))
+        self.assertEqual(dictionary_path.read_bytes(), dictionary)
+
+
+class CompressionCodecTest(unittest.TestCase):
+    data = collector.encode_artifact(bundled_artifact())
+
+    def test_round_trips_every_available_codec(self):
+        for name in collector.available_codecs():
+            low, high = collector.CODEC_LEVELS[name]
+            for level in (low, high):
+                with self.subTest(name=name, level=level):
+                    codec = collector.parse_codec(f"{name}:{level}")
+                    compressed = collector.compress(self.data, codec)
+                    self.assertEqual(collector.decompress(compressed, name), self.data)
+                    if name != "brotli":
+                        self.assertEqual(collector.decompress(compressed), self.data)
+
+    def test_parses_codec_specs(self):
+        self.assertEqual(collector.parse_codec("GZIP"), collector.DEFAULT_CODEC)
+        self.assertEqual(collector.parse_codec("zlib:1"), ("zlib", 1))
+        for spec in ("lzma", "gzip:10", "gzip:fast"):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                collector.parse_codec(spec)
+
+    def test_preset_dictionary_is_needed_to_decode(self):
+        previous = changed_artifact(bundled_artifact())
+        dictionary = collector.build_dictionary([collector.encode_artifact(previous)])
+        codec = collector.Codec("zlib", 9)
+
+        compressed = collector.compress(self.data, codec, dictionary)
+
+        self.assertEqual(len(dictionary), collector.DICTIONARY_SIZE)
+        self.assertLess(len(compressed), len(collector.compress(self.data, codec)))
+        self.assertEqual(collector.decompress(compressed, None, dictionary), self.data)
+        with self.assertRaises(ValueError):
+            collector.decompress(compressed)
+        with self.assertRaises(ValueError):
+            collector.compress(self.data, collector.DEFAULT_CODEC, dictionary)
+        with self.assertRaises(ValueError):
+            collector.decompress(b"not compressed")
+
+
+class RateEstimateTest(unittest.TestCase):
+    counts = [20, 5000, 8000, 300, 12000]
+    wins = [8, 600, 1000, 20, 1300]
+
+    def test_shrinks_small_samples_toward_the_tier_rate(self):
+        mean, strength = collector.rate_prior(self.counts, self.wins)
+        shrunk, low, high = collector.rate_estimates(self.counts, self.wins, "array")
+
+        self.assertEqual(mean, sum(self.wins) / sum(self.counts))
+        self.assertGreater(strength, 0)
+        for count, wins, estimate in zip(self.counts, self.wins, shrunk):
+            rate = wins / count
+            self.assertLessEqual(min(rate, mean), estimate)
+            self.assertLessEqual(estimate, max(rate, mean))
+        # 20 games at 40% move further than 12,000 games at 10.8%.
+        self.assertGreater(0.4 - shrunk[0], abs(shrunk[4] - 1300 / 12000))
+        self.assertLess(high[0] - low[0], 0.5)
+        self.assertGreater(high[0] - low[0], high[4] - low[4])
+
+    def test_matches_the_wilson_interval(self):
+        _, low, high = collector.rate_estimates([10, 10], [5, 5], "array")
+
+        self.assertAlmostEqual(low[0], 0.2365931, places=7)
+        self.assertAlmostEqual(high[0], 0.7634069, places=7)
+
+    def test_pools_rows_without_extra_variance(self):
+        shrunk, _, _ = collector.rate_estimates([100, 200], [10, 20], "array")
+
+        self.assertEqual(shrunk, [0.1, 0.1])
+
+    @unittest.skipIf(collector.numpy is None, "NumPy is not installed")
+    def test_engines_give_the_same_floats(self):
+        self.assertEqual(
+            collector.rate_estimates(self.counts, self.wins, "numpy"),
+            collector.rate_estimates(self.counts, self.wins, "array"),
+        )
+
+    def test_stores_and_exports_the_estimates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = Path(directory) / "stats.sqlite3"
+            payloads = [
+                (tier_key, tier_label, bench.synthetic_payload(tier_key, 6, 2, seed=1))
+                for tier_key, tier_label in collector.TIERS[:2]
+            ]
+            with contextlib.redirect_stdout(io.StringIO()):
+                collector.build_database(db_path, payloads, 7)
+            with contextlib.closing(sqlite3.connect(db_path)) as conn:
+                rows = conn.execute(
+                    "SELECT tier_key, character_id, game_count, wins,"
+                    " win_rate_shrunk, win_rate_low, win_rate_high"
+                    " FROM character_stats ORDER BY rowid"
+                ).fetchall()
+                weapons = conn.execute(
+                    "SELECT COUNT(*) FROM weapon_stats"
+                    " WHERE top3_rate_low > top3_rate OR top3_rate_high < top3_rate"
+                ).fetchone()[0]
+            artifact = collector.release_artifact(db_path, {})
+            tier_weapons = collector.release_weapons(db_path)["tiers"]
+
+        gold = [row for row in rows if row[0] == collector.TIERS[0][0]]
+        shrunk, low, high = collector.rate_estimates(
+            [row[2] for row in gold], [row[3] for row in gold]
+        )
+        self.assertEqual([row[4:] for row in gold], list(zip(shrunk, low, high)))
+        self.assertEqual(weapons, 0)
+        entry = artifact["tiers"][gold[0][0]]["characters"][str(gold[0][1])]
+        self.assertEqual(entry["winRateShrunk"], round(shrunk[0], 7))
+        weapon = next(iter(tier_weapons[gold[0][0]][str(gold[0][1])].values()))
+        self.assertLessEqual(weapon["winRateLow"], weapon["winRate"])
+
+
+class BaselineTablesTest(unittest.TestCase):
+    tier_keys = ("diamond_plus", "platinum_plus", "platinum", "gold")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.db_path = self.directory / "stats.sqlite3"
+        labels = dict(collector.TIERS)
+        self.payloads = {
+            tier_key: bench.synthetic_payload(tier_key, 8, 3, seed=1)
+            for tier_key in self.tier_keys
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(
+                self.db_path,
+                [
+                    (tier_key, labels[tier_key], payload)
+                    for tier_key, payload in self.payloads.items()
+                ],
+                7,
+            )
+        self.artifact = collector.release_artifact(
+            self.db_path, bench.synthetic_characters(8)
+        )
+
+    def test_exports_weapon_baselines(self):
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn:
+            rows = conn.execute(
+                "SELECT character_id, weapon_id, game_count, win_rate, dak_tier"
+                " FROM weapon_stats WHERE tier_key = 'gold'"
+            ).fetchall()
+        weapons = collector.release_weapons(self.db_path)["tiers"]["gold"]
+
+        self.assertEqual(sum(len(entries) for entries in weapons.values()), len(rows))
+        for character_id, weapon_id, games, win_rate, dak_tier in rows:
+            entry = weapons[str(character_id)][str(weapon_id)]
+            self.assertEqual(entry["games"], games)
+            self.assertEqual(entry["winRate"], round(win_rate, 4))
+            self.assertEqual(entry.get("dakTier"), dak_tier)
+        self.assertNotIn("weapons", self.artifact["tiers"]["gold"])
+
+    def test_summarizes_each_metric_within_its_tier(self):
+        tier = self.artifact["tiers"]["gold"]
+        characters = tier["characters"]
+        metric = tier["metrics"]["winRate"]
+        games = sum(entry["games"] for entry in characters.values())
+        mean = sum(e["games"] * e["winRate"] for e in characters.values()) / games
+        values = sorted(entry["winRate"] for entry in characters.values())
+
+        self.assertNotIn("games", tier["metrics"])
+        self.assertEqual(list(metric), list(collector.METRIC_TABLES))
+        self.assertAlmostEqual(metric["mean"], mean, places=6)
+        self.assertAlmostEqual(metric["p50"], (values[3] + values[4]) / 2, places=6)
+        self.assertEqual(
+            [metric[f"p{q}"] for q in collector.METRIC_QUANTILES],
+            sorted(metric[f"p{q}"] for q in collector.METRIC_QUANTILES),
+        )
+        self.assertLessEqual(values[0], metric["p10"])
+        self.assertLessEqual(metric["p90"], values[-1])
+
+    def test_rolls_up_tiers_that_do_not_overlap(self):
+        rollup = self.artifact["allTiers"]
+        weapons = collector.release_weapons(self.db_path)["allTiers"]
+
+        self.assertEqual(rollup["tiers"], ["diamond_plus", "platinum", "gold"])
+        self.assertEqual(
+            rollup["games"],
+            sum(self.artifact["tiers"][key]["games"] for key in rollup["tiers"]),
+        )
+        wins = games = 0
+        for tier_key in rollup["tiers"]:
+            snapshot = self.payloads[tier_key]["characterStatSnapshot"]
+            character_weapons = snapshot["characterStats"][0]["weaponStats"]
+            wins += sum(weapon["win"] for weapon in character_weapons)
+            games += sum(weapon["count"] for weapon in character_weapons)
+        self.assertEqual(rollup["characters"]["1"]["games"], games)
+        self.assertEqual(rollup["characters"]["1"]["winRate"], round(wins / games, 7))
+        self.assertNotIn("weapons", rollup)
+        self.assertEqual(
+            sum(weapon["games"] for weapon in weapons["1"].values()), games
+        )
+
+    def test_tables_survive_every_artifact_form(self):
+        columnar = collector.encode_columnar_artifact(self.artifact)
+        self.assertEqual(collector.decode_columnar_artifact(columnar), self.artifact)
+
+        shard_dir = self.directory / "shards"
+        version = collector.artifact_hash(self.artifact)
+        weapons = collector.release_weapons(self.db_path)
+        sharded = collector.with_weapons(self.artifact, weapons)
+        collector.write_artifact_shards(shard_dir, sharded, version)
+        index = json.loads((shard_dir / collector.SHARD_INDEX_NAME).read_text())
+        characters = collector.read_shard(shard_dir, index["characters"])
+        gold = collector.read_shard(shard_dir, index["tiers"]["gold"])
+
+        self.assertNotIn("allTiers", index["artifact"])
+        self.assertEqual(characters["allTiers"], self.artifact["allTiers"])
+        self.assertEqual(gold["tier"]["weapons"], weapons["tiers"]["gold"])
+        self.assertEqual(
+            collector.read_shard(shard_dir, index["weapons"])["weapons"],
+            weapons["allTiers"],
+        )
+        self.assertEqual(collector.read_artifact_shards(shard_dir), sharded)
+
+    def test_keeps_the_main_artifact_within_its_size_budget(self):
+        # 90 characters x 3 weapons x 10 tiers; the tables are the per-tier
+        # metric summaries and the allTiers character rollup.
+        payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 90, 3, seed=1))
+            for tier_key, tier_label in bench.synthetic_tiers(10)
+        ]
+        db_path = self.directory / "budget.sqlite3"
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(db_path, payloads, 7)
+        artifact = collector.release_artifact(db_path, bench.synthetic_characters(90))
+        bare = {key: value for key, value in artifact.items() if key != "allTiers"}
+        bare["tiers"] = {
+            tier_key: {key: value for key, value in tier.items() if key != "metrics"}
+            for tier_key, tier in artifact["tiers"].items()
+        }
+
+        for encode in (collector.encode_artifact, collector.encode_columnar_artifact):
+            size = len(gzip.compress(encode(artifact)))
+            self.assertLess(size, 1.15 * len(gzip.compress(encode(bare))))
+            self.assertLess(size, 100_000)
+
+
+class DimensionMatrixTest(unittest.TestCase):
+    dimensions = [
+        collector.DEFAULT_DIMENSION,
+        collector.Dimension("NORMAL", "SQUAD", 3),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = Path(directory.name) / "stats.sqlite3"
+
+    def stage(self, dimensions, seed=1):
+        staging = collector.StagingDatabase(self.db_path)
+        with staging, contextlib.redirect_stdout(io.StringIO()):
+            for dimension in dimensions:
+                for tier_key, tier_label in collector.TIERS[:2]:
+                    payload = bench.synthetic_payload(
+                        tier_key, 4, 2, seed=f"{seed}:{dimension.key}"
+                    )
+                    payload["meta"]["dt"] = dimension.period_days
+                    record = collector.decode_tier(payload, tier_key, dimension)
+                    staging.add_tier(dimension, tier_label, record)
+                staging.commit_dimension(dimension)
+            summaries = staging.dimension_summaries()
+            staging.publish()
+        return summaries
+
+    def test_keys_every_row_by_dimension(self):
+        summaries = self.stage(self.dimensions)
+
+        self.assertTrue(collector.database_is_current(self.db_path, summaries))
+        for dimension in self.dimensions:
+            artifact = collector.release_artifact(self.db_path, {}, dimension.key)
+            self.assertEqual(
+                (
+                    artifact["matchingMode"],
+                    artifact["teamMode"],
+                    artifact["periodDays"],
+                ),
+                tuple(dimension),
+            )
+            self.assertEqual(
+                list(artifact["tiers"]), [key for key, _ in collector.TIERS[:2]]
+            )
+        self.assertNotEqual(
+            collector.release_artifact(self.db_path, {}, self.dimensions[0].key),
+            collector.release_artifact(self.db_path, {}, self.dimensions[1].key),
+        )
+
+    def test_removes_dimensions_that_are_no_longer_collected(self):
+        self.stage(self.dimensions)
+        summaries = self.stage(self.dimensions[:1])
+
+        self.assertTrue(collector.database_is_current(self.db_path, summaries))
+        self.assertEqual(
+            set(collector.stored_tier_versions(self.db_path)),
+            {(self.dimensions[0].key, tier_key) for tier_key, _ in collector.TIERS[:2]},
+        )
+
+    def test_rejects_responses_for_another_mode(self):
+        payload = bench.synthetic_payload("gold", 4, 2, seed=1)
+        payload["meta"]["matchingMode"] = "NORMAL"
+
+        with self.assertRaisesRegex(ValueError, "matchingMode mismatch"):
+            collector.decode_tier(payload, "gold", collector.DEFAULT_DIMENSION)
+
+    def test_suffixes_extra_dimension_paths(self):
+        path = collector.dimension_path(
+            Path("data/dakgg_stats.json.gz"), "normal_squad_3d"
+        )
+
+        self.assertEqual(path, Path("data/dakgg_stats.normal_squad_3d.json.gz"))
+
+
+class SnapshotWriteTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = Path(directory.name) / "stats.sqlite3"
+        self.payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 5, 3, seed=4))
+            for tier_key, tier_label in collector.TIERS[:2]
+        ]
+
+    def test_batched_rows_read_back_unchanged(self):
+        tier_key, tier_label, payload = self.payloads[0]
+        tier_row, character_rows, weapon_rows = collector.snapshot_rows(
+            "rank_squad_7d", tier_label, collector.decode_tier(payload, tier_key)
+        )
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.executescript(collector.SCHEMA)
+
+        counts = collector.write_snapshot_rows(
+            conn, tier_row, character_rows, weapon_rows
+        )
+
+        self.assertEqual(counts, (len(character_rows), len(weapon_rows)))
+        self.assertEqual(
+            conn.execute("SELECT * FROM tier_snapshots").fetchall(), [tier_row]
+        )
+        for table, rows in (
+            ("character_stats", character_rows),
+            ("weapon_stats", weapon_rows),
+        ):
+            self.assertEqual(
+                conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall(),
+                [tuple(row) for row in rows],
+            )
+
+    def test_creates_the_indexes_after_the_bulk_load(self):
+        indexes = (
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )
+        staging = collector.StagingDatabase(self.db_path)
+        with staging, contextlib.redirect_stdout(io.StringIO()):
+            for tier_key, tier_label, payload in self.payloads:
+                staging.add_tier(
+                    collector.DEFAULT_DIMENSION,
+                    tier_label,
+                    collector.decode_tier(payload, tier_key),
+                )
+            staging.commit_dimension(collector.DEFAULT_DIMENSION)
+            self.assertEqual(staging.conn.execute(indexes).fetchall(), [])
+            staging.publish()
+
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn:
+            self.assertEqual(
+                sorted(sql for sql, in conn.execute(indexes)),
+                sorted(collector.INDEXES),
+            )
+            plan = conn.execute(
+                """
+                EXPLAIN QUERY PLAN
+                SELECT tier_key, win_rate FROM character_stats
+                WHERE character_id = 1 AND dimension_key = 'rank_squad_7d'
+                """
+            ).fetchall()
+        self.assertIn("COVERING INDEX idx_character_stats_character", str(plan))
+
+    def test_applies_the_build_pragmas(self):
+        conn = sqlite3.connect(self.db_path)
+        self.addCleanup(conn.close)
+
+        collector.apply_build_pragmas(conn, None)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone(), ("off",))
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone(), (0,))
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone(), (-65536,))
+
+        collector.apply_build_pragmas(
+            conn, {"journal_mode": "delete", "synchronous": "normal", "cache_size": 500}
+        )
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone(), ("delete",))
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone(), (1,))
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone(), (500,))
+
+
+class BuildBackendTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 5, 3, seed=2))
+            for tier_key, tier_label in collector.TIERS[:3]
+        ]
+
+    def build(self, name, **options):
+        db_path = self.directory / f"{name}.sqlite3"
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(db_path, self.payloads, 7, **options)
+        return db_path
+
+    def test_backends_and_checks_build_the_same_database(self):
+        expected = collector.release_artifact(self.build("reference"), {})
+        for backend in collector.BUILD_BACKENDS:
+            for verify in collector.VERIFY_MODES:
+                with self.subTest(backend=backend, verify=verify):
+                    db_path = self.build(
+                        f"{backend}-{verify}", backend=backend, verify=verify
+                    )
+                    artifact = collector.release_artifact(db_path, {})
+                    self.assertEqual(artifact["tiers"], expected["tiers"])
+                    self.assertFalse(db_path.with_name(f".{db_path.name}.tmp").exists())
+
+    def test_memory_backend_updates_incrementally(self):
+        db_path = self.build("stats", backend="memory")
+        tier_key, tier_label, payload = self.payloads[0]
+        self.payloads[0] = (
+            tier_key,
+            tier_label,
+            bench.synthetic_payload(tier_key, 5, 3, seed=3),
+        )
+        self.payloads[0][2]["meta"]["updatedAt"] += 1
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            collector.build_database(
+                db_path, self.payloads, 7, backend="memory", verify="counts"
+            )
+
+        self.assertIn("updated 1 of 3 tiers incrementally", output.getvalue())
+        self.assertEqual(
+            collector.release_artifact(db_path, {})["tiers"],
+            collector.release_artifact(self.build("reference"), {})["tiers"],
+        )
+
+    def tier_rows(self, db_path):
+        with contextlib.closing(sqlite3.connect(db_path)) as conn:
+            return {
+                (table, tier_key): conn.execute(
+                    f"SELECT rowid, * FROM {table} WHERE tier_key = ? ORDER BY rowid",
+                    (tier_key,),
+                ).fetchall()
+                for table in ("tier_snapshots", "character_stats", "weapon_stats")
+                for tier_key, _, _ in self.payloads
+            }
+
+    def test_rewrites_only_the_changed_tier(self):
+        db_path = self.build("stats")
+        before = self.tier_rows(db_path)
+        changed_key, tier_label, _ = self.payloads[1]
+        self.payloads[1] = (
+            changed_key,
+            tier_label,
+            bench.synthetic_payload(changed_key, 5, 3, seed=3),
+        )
+        self.payloads[1][2]["meta"]["updatedAt"] += 1
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            collector.build_database(db_path, self.payloads, 7)
+
+        self.assertIn(
+            f"updated 1 of 3 tiers incrementally: rank_squad_7d/{changed_key}",
+            output.getvalue(),
+        )
+        after = self.tier_rows(db_path)
+        rebuilt = self.tier_rows(self.build("reference"))
+        for (table, tier_key), rows in after.items():
+            with self.subTest(table=table, tier=tier_key):
+                if tier_key == changed_key:
+                    self.assertNotEqual(rows, before[table, tier_key])
+                    self.assertEqual(
+                        [row[1:] for row in rows],
+                        [row[1:] for row in rebuilt[table, tier_key]],
+                    )
+                else:
+                    self.assertEqual(rows, before[table, tier_key])
+        self.assertEqual(
+            collector.stored_tier_versions(db_path)[("rank_squad_7d", changed_key)],
+            self.payloads[1][2]["meta"]["updatedAt"],
+        )
+
+    def test_rebuilds_a_database_with_another_schema_version(self):
+        db_path = self.build("stats")
+        with contextlib.closing(sqlite3.connect(db_path)) as conn:
+            conn.execute("PRAGMA user_version = 1")
+
+        self.assertIsNone(collector.stored_tier_versions(db_path))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            collector.build_database(db_path, self.payloads, 7)
+        self.assertIn("rebuilt database with 3 tiers", output.getvalue())
+
+    def test_counts_check_detects_rows_that_differ_from_the_payload(self):
+        tier_key, tier_label, payload = self.payloads[0]
+        tier_row, character_rows, weapon_rows = collector.snapshot_rows(
+            "rank_squad_7d", tier_label, collector.decode_tier(payload, tier_key)
+        )
+        expected = {
+            ("rank_squad_7d", tier_key): {
+                "character_stats": collector.rows_checksum(character_rows),
+                "weapon_stats": collector.rows_checksum(weapon_rows),
+            }
+        }
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.executescript(collector.SCHEMA)
+        collector.write_snapshot_rows(conn, tier_row, character_rows, weapon_rows)
+        collector.verify_database(conn, "counts", expected)
+
+        conn.execute("UPDATE weapon_stats SET wins = wins + 1 WHERE rowid = 1")
+        with self.assertRaisesRegex(RuntimeError, "weapon_stats"):
+            collector.verify_database(conn, "counts", expected)
+        conn.execute("DELETE FROM weapon_stats WHERE rowid = 2")
+        with self.assertRaisesRegex(RuntimeError, "weapon_stats"):
+            collector.verify_database(conn, "counts", expected)
+
+
+def days_ago(days, hours=0):
+    collected_at = datetime.now(timezone.utc) - timedelta(days=days, hours=hours)
+    return collected_at.replace(microsecond=0).isoformat()
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.db_path = self.directory / "stats.sqlite3"
+        self.history_path = self.directory / "history.sqlite3"
+        payloads = [
+            (tier_key, tier_label, bench.synthetic_payload(tier_key, 3, 2, seed=1))
+            for tier_key, tier_label in collector.TIERS[:2]
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(self.db_path, payloads, 7)
+        self.characters = self.current("SELECT COUNT(*) FROM character_stats")[0][0]
+        self.weapons = self.current("SELECT COUNT(*) FROM weapon_stats")[0][0]
+        self.tier_key, self.character_id = self.current(
+            "SELECT tier_key, character_id FROM character_stats LIMIT 1"
+        )[0]
+
+    def current(self, sql, parameters=()):
+        with contextlib.closing(sqlite3.connect(self.db_path)) as conn, conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def history(self, sql, parameters=()):
+        with contextlib.closing(sqlite3.connect(self.history_path)) as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def record(self, collected_at, patch=None, compaction="daily", dimensions=None):
+        self.current(
+            "UPDATE collection_meta SET collected_at = ?, current_patch = ?",
+            (collected_at, patch),
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.record_history(
+                self.history_path,
+                self.db_path,
+                30,
+                compaction,
+                *([dimensions] if dimensions else []),
+            )
+
+    def add_wins(self, wins):
+        self.current(
+            """
+            UPDATE character_stats SET wins = wins + ?
+            WHERE tier_key = ? AND character_id = ?
+            """,
+            (wins, self.tier_key, self.character_id),
+        )
+
+    def versions(self):
+        return self.history(
+            """
+            SELECT first_snapshot_id, last_snapshot_id FROM character_history
+            WHERE tier_key = ? AND character_id = ?
+            ORDER BY first_snapshot_id
+            """,
+            (self.tier_key, self.character_id),
+        )
+
+    def test_identical_snapshots_extend_one_row_version(self):
+        latest = days_ago(1)
+        self.record(days_ago(2))
+        self.record(latest)
+        self.record(latest)
+
+        snapshots = self.history("SELECT snapshot_id FROM snapshots")
+        self.assertEqual(snapshots, [(1,), (2,)])
+        self.assertEqual(
+            self.history(
+                """
+                SELECT first_snapshot_id, last_snapshot_id, COUNT(*)
+                FROM character_history GROUP BY 1, 2
+                """
+            ),
+            [(1, 2, self.characters)],
+        )
+        self.assertEqual(
+            self.history("SELECT COUNT(*) FROM weapon_history"), [(self.weapons,)]
+        )
+        self.assertEqual(self.history("SELECT COUNT(*) FROM tier_history"), [(4,)])
+
+    def test_a_changed_row_opens_a_new_version(self):
+        self.record(days_ago(3))
+        self.add_wins(1)
+        self.record(days_ago(2))
+        self.record(days_ago(1))
+
+        self.assertEqual(self.versions(), [(1, 1), (2, 3)])
+        self.assertEqual(
+            self.history("SELECT COUNT(*) FROM character_history"),
+            [(self.characters + 1,)],
+        )
+
+    def test_compacts_old_snapshots_to_one_per_day(self):
+        self.record(days_ago(40, hours=2))
+        self.add_wins(1)
+        self.record(days_ago(40, hours=1))
+        self.add_wins(-1)
+        self.record(days_ago(40))
+        self.record(days_ago(39))
+        self.record(days_ago(1))
+
+        self.assertEqual(
+            self.history("SELECT snapshot_id, granularity FROM snapshots"),
+            [(3, "daily"), (4, "daily"), (5, "raw")],
+        )
+        # The versions that only the dropped snapshots 1 and 2 referred to
+        # are gone.
+        self.assertEqual(self.versions(), [(3, 5)])
+        self.assertEqual(
+            self.history("SELECT DISTINCT snapshot_id FROM tier_history"),
+            [(3,), (4,), (5,)],
+        )
+
+    def test_compacts_old_snapshots_to_one_per_patch(self):
+        for days, patch in ((50, 10), (45, 10), (40, 11), (35, 11), (1, 11)):
+            self.record(days_ago(days), patch, compaction="patch")
+
+        self.assertEqual(
+            self.history("SELECT snapshot_id, granularity FROM snapshots"),
+            [(2, "patch"), (4, "patch"), (5, "raw")],
+        )
+
+    def test_trend_views_return_the_series(self):
+        self.record(days_ago(2))
+        self.add_wins(1)
+        self.record(days_ago(1))
+        games, wins = self.current(
+            """
+            SELECT game_count, wins FROM character_stats
+            WHERE tier_key = ? AND character_id = ?
+            """,
+            (self.tier_key, self.character_id),
+        )[0]
+
+        self.assertEqual(
+            self.history(
+                """
+                SELECT snapshot_id, game_count, win_rate FROM character_trend
+                WHERE tier_key = ? AND character_id = ?
+                ORDER BY snapshot_id
+                """,
+                (self.tier_key, self.character_id),
+            ),
+            [(1, games, (wins - 1) / games), (2, games, wins / games)],
+        )
+        weapon_series = self.history(
+            """
+            SELECT snapshot_id, character_id, weapon_id, dak_tier FROM weapon_trend
+            ORDER BY character_id, weapon_id, tier_key, snapshot_id
+            """
+        )
+        expected = self.current(
+            """
+            SELECT character_id, weapon_id, dak_tier FROM weapon_stats
+            ORDER BY character_id, weapon_id, tier_key
+            """
+        )
+        self.assertEqual(
+            weapon_series,
+            [(snapshot_id, *row) for row in expected for snapshot_id in (1, 2)],
+        )
+
+    def test_records_every_dimension_separately(self):
+        dimensions = DimensionMatrixTest.dimensions
+        staging = collector.StagingDatabase(self.db_path)
+        with staging, contextlib.redirect_stdout(io.StringIO()):
+            for dimension in dimensions:
+                for tier_key, tier_label in collector.TIERS[:2]:
+                    payload = bench.synthetic_payload(tier_key, 3, 2, seed=1)
+                    payload["meta"]["dt"] = dimension.period_days
+                    record = collector.decode_tier(payload, tier_key, dimension)
+                    staging.add_tier(dimension, tier_label, record)
+            staging.publish()
+        normal = dimensions[1].key
+
+        self.record(days_ago(2), dimensions=dimensions)
+        self.current(
+            "UPDATE character_stats SET wins = wins + 1 WHERE dimension_key = ?",
+            (dimensions[0].key,),
+        )
+        self.record(days_ago(1), dimensions=dimensions)
+
+        self.assertEqual(
+            self.history("SELECT snapshot_id, dimension_key FROM snapshots"),
+            [(1, dimensions[0].key), (2, normal), (3, dimensions[0].key), (4, normal)],
+        )
+        self.assertEqual(
+            self.history(
+                """
+                SELECT dimension_key, first_snapshot_id, last_snapshot_id, COUNT(*)
+                FROM character_history GROUP BY 1, 2, 3 ORDER BY 2
+                """
+            ),
+            [
+                (dimensions[0].key, 1, 1, self.characters),
+                (normal, 2, 4, self.characters),
+                (dimensions[0].key, 3, 3, self.characters),
+            ],
+        )
+        self.assertEqual(
+            self.history(
+                """
+                SELECT DISTINCT snapshot_id FROM character_trend
+                WHERE dimension_key = ? ORDER BY snapshot_id
+                """,
+                (normal,),
+            ),
+            [(2,), (4,)],
+        )
+
+    def test_migrates_a_single_dimension_history(self):
+        version_1 = (
+            collector.HISTORY_SCHEMA.replace("user_version = 2", "user_version = 1")
+            .replace("    dimension_key TEXT NOT NULL,\n", "")
+            .replace("PRIMARY KEY (dimension_key, ", "PRIMARY KEY (")
+            .replace("    s.dimension_key,\n", "")
+            .replace("s.dimension_key = h.dimension_key\n    AND ", "")
+        )
+        columns = ", ".join(collector.HISTORY_CHARACTER_COLUMNS)
+        with contextlib.closing(sqlite3.connect(self.history_path)) as conn, conn:
+            conn.executescript(version_1)
+            conn.execute("ATTACH DATABASE ? AS current", (str(self.db_path),))
+            conn.execute(
+                """
+                INSERT INTO snapshots (
+                    collected_at, period_days, matching_mode, team_mode,
+                    source_updated_at_min, source_updated_at_max, tier_count
+                ) VALUES (?, 7, 'RANK', 'SQUAD', 0, 0, 2)
+                """,
+                (days_ago(2),),
+            )
+            conn.execute(
+                f"""
+                INSERT INTO character_history (
+                    character_id, tier_key, first_snapshot_id, last_snapshot_id,
+                    {columns}
+                )
+                SELECT character_id, tier_key, 1, 1, {columns}
+                FROM current.character_stats
+                """
+            )
+
+        self.record(days_ago(1))
+
+        self.assertEqual(self.history("PRAGMA user_version"), [(2,)])
+        self.assertEqual(
+            self.history("SELECT snapshot_id, dimension_key FROM snapshots"),
+            [(1, "rank_squad_7d"), (2, "rank_squad_7d")],
+        )
+        self.assertEqual(self.versions(), [(1, 2)])
+        self.assertEqual(
+            self.history("SELECT COUNT(*) FROM character_trend"),
+            [(2 * self.characters,)],
+        )
+
+
+
+class PollScheduleTest(unittest.TestCase):
+    # ``updatedAt`` is in epoch milliseconds and the clock in epoch seconds.
+    START = 1_700_000_000
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "schedule.json"
+        self.schedule = collector.PollSchedule(self.path, 900, 7200)
+
+    def observe(self, key, updated_at, now, schedule=None):
+        """Observe ``updatedAt`` and the clock given as seconds after START."""
+        (schedule or self.schedule).observe(
+            key, (self.START + updated_at) * 1000, self.START + now
+        )
+
+    def next_probe(self, key, schedule=None):
+        return (schedule or self.schedule).next_probe(key) - self.START
+
+    def test_probes_unknown_tiers_at_the_probe_interval(self):
+        self.assertEqual(self.schedule.due(["a", "b"], self.START), ["a", "b"])
+
+        self.observe("a", 1_000, 5_000)
+
+        self.assertIsNone(self.schedule.cadence("a"))
+        self.assertEqual(self.next_probe("a"), 5_900)
+        self.assertEqual(self.schedule.due(["a", "b"], self.START + 5_000), ["b"])
+
+    def test_waits_for_the_expected_update_then_backs_off(self):
+        for updated_at in (0, 3_600, 7_200, 10_800):
+            self.observe("a", updated_at, updated_at + 60)
+        self.assertEqual(self.schedule.cadence("a"), 3_600)
+        self.assertEqual(self.next_probe("a"), 14_400)
+
+        probes = []
+        now = 14_400
+        for _ in range(5):
+            self.observe("a", 10_800, now)
+            now = self.next_probe("a")
+            probes.append(now)
+        self.assertEqual(probes, [15_300, 17_100, 20_700, 27_900, 35_100])
+
+        self.observe("a", 36_000, 36_030)
+        self.assertEqual(self.next_probe("a"), 36_030 + 3_600 - 30)
+
+    def test_caps_the_wait_and_survives_a_restart(self):
+        self.observe("a", 0, 10)
+        self.observe("a", 86_400, 86_410)
+        self.schedule.failed("b", self.START + 100)
+        self.schedule.save()
+
+        restarted = collector.PollSchedule(self.path, 900, 7200)
+
+        self.assertEqual(self.next_probe("a", restarted), 86_410 + 7_200)
+        self.assertEqual(self.next_probe("b", restarted), 1_000)
+        self.assertEqual(restarted.cadence("a"), 86_400)
+
+
+URL = "https://example.test/stats"
+
+
+class FakeClock:
+    """Stands in for ``time``: ``sleep`` advances the clock and is recorded."""
+
+    def __init__(self, now=1_000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def read(self):
+        return self.body
+
+
+def http_error(code, headers=None):
+    return HTTPError(URL, code, "error", headers or {}, None)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = collector.TokenBucket(
+            2, 3, clock=self.clock.monotonic, sleep=self.clock.sleep
+        )
+
+    def test_spends_the_burst_then_waits_for_the_rate(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        self.bucket.acquire()
+        self.bucket.acquire()
+
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_refills_up_to_the_capacity(self):
+        for _ in range(3):
+            self.bucket.acquire()
+        self.clock.now += 60
+
+        for _ in range(3):
+            self.bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        self.bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_refuses_a_wait_past_the_deadline(self):
+        for _ in range(3):
+            self.bucket.acquire()
+
+        with self.assertRaises(TimeoutError):
+            self.bucket.acquire(deadline=self.clock.now + 0.25)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_no_rate_never_waits(self):
+        bucket = collector.TokenBucket(None, 1, self.clock.monotonic, self.clock.sleep)
+        for _ in range(10):
+            bucket.acquire(deadline=self.clock.now)
+        self.assertEqual(self.clock.sleeps, [])
+
+
+class FetchRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timeouts = []
+        self.requests = []
+        self.answers = []
+        self.jitter = []
+        patches = (
+            mock.patch.object(collector, "time", self.clock),
+            mock.patch.object(collector, "urlopen", self.urlopen),
+            mock.patch.object(collector.random, "uniform", self.uniform),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def urlopen(self, request, timeout):
+        self.timeouts.append(timeout)
+        self.requests.append(request)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def uniform(self, low, high):
+        # The longest wait that full jitter can pick.
+        self.jitter.append((low, high))
+        return high
+
+    def fetch(self, deadline=90.0, attempts=3, breaker=None, cache=None):
+        return collector.fetch_attempts(
+            URL,
+            "test",
+            collector.TokenBucket(None, 1),
+            deadline,
+            attempts,
+            None,
+            cache,
+            collector.NULL_METRICS,
+            breaker,
+        )
+
+    def test_retries_with_jittered_exponential_backoff(self):
+        self.answers = [http_error(500), http_error(502), FakeResponse(b'{"a": 1}')]
+
+        self.assertEqual(self.fetch(), ({"a": 1}, True))
+        self.assertEqual(self.jitter, [(0, 2.0), (0, 4.0)])
+        self.assertEqual(self.clock.sleeps, [2.0, 4.0])
+
+    def test_waits_at_least_as_long_as_retry_after(self):
+        self.answers = [
+            http_error(429, {"Retry-After": "30"}),
+            http_error(503, {"Retry-After": "soon"}),
+            FakeResponse(b"{}"),
+        ]
+
+        self.assertEqual(self.fetch(), ({}, True))
+        self.assertEqual(self.clock.sleeps, [30.0, 4.0])
+
+    def test_gives_up_when_the_backoff_passes_the_deadline(self):
+        self.answers = [http_error(429, {"Retry-After": "60"})]
+
+        with self.assertRaisesRegex(RuntimeError, "failed to fetch test"):
+            self.fetch(deadline=45.0)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_socket_timeout_shrinks_to_the_remaining_deadline(self):
+        self.answers = [http_error(500), http_error(500), FakeResponse(b"{}")]
+
+        self.fetch(deadline=33.0)
+
+        socket_timeout = collector.SOCKET_TIMEOUT
+        self.assertEqual(self.timeouts, [socket_timeout, socket_timeout, 27.0])
+
+    def test_stops_after_the_last_attempt(self):
+        self.answers = [http_error(500), http_error(500)]
+
+        with self.assertRaisesRegex(RuntimeError, "HTTP Error 500"):
+            self.fetch(attempts=2)
+        self.assertEqual(self.clock.sleeps, [2.0])
+
+    def test_open_breaker_stops_retrying(self):
+        self.answers = [http_error(500), http_error(500)]
+        breaker = collector.CircuitBreaker(2)
+
+        with self.assertRaises(collector.CircuitOpenError):
+            self.fetch(breaker=breaker)
+        self.assertTrue(breaker.open)
+        self.assertEqual(self.clock.sleeps, [2.0])
+
+    def test_sends_validators_and_replays_the_cached_body_on_304(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = collector.ResponseCache(Path(directory))
+            self.answers = [FakeResponse(b'{"a": 1}', {"ETag": '"v1"'})]
+            self.assertEqual(self.fetch(cache=cache), ({"a": 1}, True))
+            cache.commit()
+
+            self.answers = [http_error(304)]
+            self.assertEqual(self.fetch(cache=cache), (None, False))
+
+            self.assertIsNone(self.requests[0].get_header("If-none-match"))
+            self.assertEqual(self.requests[1].get_header("If-none-match"), '"v1"')
+            self.assertEqual(collector.load_cached(cache, URL), {"a": 1})
+
+    def test_304_without_a_cached_entry_is_an_error(self):
+        self.answers = [http_error(304)]
+
+        with self.assertRaisesRegex(RuntimeError, "HTTP Error 304"):
+            self.fetch(attempts=1)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = collector.ResponseCache(Path(directory.name))
+        self.body = gzip.compress(b'{"a": 1}')
+
+    def test_stores_the_validators_only_on_commit(self):
+        headers = {"ETag": '"v1"', "Last-Modified": "Tue, 01 Jul 2025 00:00:00 GMT"}
+        self.cache.stage(URL, headers, self.body)
+        self.assertIsNone(self.cache.lookup(URL))
+
+        self.cache.commit()
+
+        entry = self.cache.lookup(URL)
+        self.assertEqual(
+            self.cache.validators(entry),
+            {
+                "If-None-Match": '"v1"',
+                "If-Modified-Since": "Tue, 01 Jul 2025 00:00:00 GMT",
+            },
+        )
+        self.assertEqual(self.cache.read_body(URL), b'{"a": 1}')
+        self.assertIsNone(self.cache.lookup(URL + "?other"))
+
+    def test_skips_responses_without_validators(self):
+        self.cache.stage(URL, {}, self.body)
+        self.cache.commit()
+
+        self.assertIsNone(self.cache.lookup(URL))
+
+    def test_invalidates_an_unreadable_body(self):
+        self.cache.stage(URL, {"ETag": '"v1"'}, self.body)
+        self.cache.commit()
+        meta_path, body_path = self.cache._paths(URL)
+        body_path.write_bytes(b"not gzip")
+
+        with self.assertRaisesRegex(ValueError, "unreadable"):
+            self.cache.read_body(URL)
+        self.assertIsNone(self.cache.lookup(URL))
+        self.assertFalse(meta_path.exists() or body_path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,354 @@
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import collect_dakgg_stats as collector  # noqa: E402
+import dakgg_fixtures as fixtures  # noqa: E402
+
+
+class FixtureServerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fixture_dir = Path(directory.name) / "fixtures"
+        with contextlib.redirect_stdout(io.StringIO()):
+            fixtures.synthesize(
+                self.fixture_dir, collector.dimension_matrix(), characters=4, weapons=2
+            )
+
+    def serve(self, **options):
+        server = fixtures.FixtureServer(("127.0.0.1", 0), self.fixture_dir, **options)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.api_base = server.api_base
+        return server
+
+    def fetch_tier(self, cache=None, attempts=1):
+        return collector.fetch_tier(
+            "gold",
+            collector.DEFAULT_DIMENSION,
+            collector.TokenBucket(None, 1),
+            10,
+            attempts,
+            cache,
+            api_base=self.api_base,
+        )
+
+    def test_replays_fixtures_and_answers_conditional_requests(self):
+        server = self.serve()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = collector.ResponseCache(Path(directory))
+            payload, changed = self.fetch_tier(cache)
+            cache.commit()
+            collector.decode_tier(payload, "gold")
+
+            self.assertTrue(changed)
+            self.assertEqual(self.fetch_tier(cache), (None, False))
+        self.assertEqual(server.counts, {200: 1, 304: 1})
+
+    def test_ignores_validators_when_asked(self):
+        server = self.serve(honor_validators=False)
+        with tempfile.TemporaryDirectory() as directory:
+            cache = collector.ResponseCache(Path(directory))
+            self.fetch_tier(cache)
+            cache.commit()
+
+            self.assertTrue(self.fetch_tier(cache)[1])
+        self.assertEqual(server.counts, {200: 2})
+
+    def test_injects_errors_and_throttles(self):
+        server = self.serve(error_rate=1.0)
+        with self.assertRaisesRegex(RuntimeError, "HTTP Error 503"):
+            self.fetch_tier(attempts=1)
+
+        server.error_rate = 0.0
+        server.rate_limit = 0.5
+        self.fetch_tier()
+        with self.assertRaises(HTTPError) as raised:
+            urlopen(
+                collector.tier_url("gold", collector.DEFAULT_DIMENSION, self.api_base)
+            )
+        self.assertEqual(raised.exception.code, 429)
+        self.assertEqual(raised.exception.headers["Retry-After"], "2")
+        self.assertEqual(collector.retry_after(raised.exception), 2.0)
+
+    def test_fetches_from_the_given_host(self):
+        servers = [self.serve(), self.serve()]
+        for server in servers:
+            self.api_base = server.api_base
+            self.fetch_tier()
+
+        self.assertEqual([server.counts for server in servers], [{200: 1}] * 2)
+
+    def test_records_what_it_serves(self):
+        server = self.serve()
+        recorded = self.fixture_dir.parent / "recorded"
+        with contextlib.redirect_stdout(io.StringIO()):
+            fixtures.record(
+                recorded, server.api_base, collector.dimension_matrix(), delay=0
+            )
+
+        self.assertEqual(
+            fixtures.load_fixtures(recorded), fixtures.load_fixtures(self.fixture_dir)
+        )
+
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fixtures.synthesize(
+                self.directory / "fixtures",
+                collector.dimension_matrix(),
+                characters=4,
+                weapons=2,
+            )
+        self.server = fixtures.FixtureServer(
+            ("127.0.0.1", 0), self.directory / "fixtures"
+        )
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def args(self, *options):
+        argv = ["collect_dakgg_stats.py", "--api-base", self.server.api_base]
+        for option, name in (
+            ("--db", "stats.sqlite3"),
+            ("--artifact", "stats.json.gz"),
+            ("--columnar-artifact", "stats.bin.gz"),
+            ("--delta-artifact", "stats.delta.json.gz"),
+            ("--manifest", "stats.manifest.json"),
+            ("--cache-dir", "http_cache"),
+            ("--spool-dir", "spool"),
+            ("--schedule-state", "schedule.json"),
+        ):
+            argv += [option, str(self.directory / name)]
+        argv += ["--delay", "0", "--attempts", "1", "--concurrency", "1", *options]
+        with mock.patch.object(sys, "argv", argv):
+            return collector.parse_args()
+
+    def collect(self, *options):
+        args = self.args(*options)
+        self.server.counts.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.collect(args, collector.NULL_METRICS)
+        return collector.read_artifact(self.directory / "stats.json.gz")
+
+    def test_resumes_from_the_spooled_tiers(self):
+        gold = collector.tier_url("gold", collector.DEFAULT_DIMENSION)
+        response = self.server.responses.pop(fixtures.fixture_key(gold))
+        with self.assertRaisesRegex(RuntimeError, "no earlier payload"):
+            self.collect("--breaker-threshold", "0")
+        spooled = {path.name for path in (self.directory / "spool").iterdir()}
+        self.assertEqual(
+            spooled,
+            {"characters.json.gz"}
+            | {
+                f"rank_squad_7d.{tier_key}.json.gz"
+                for tier_key, _ in collector.TIERS
+                if tier_key != "gold"
+            },
+        )
+        self.assertFalse((self.directory / "stats.sqlite3").exists())
+
+        self.server.responses[fixtures.fixture_key(gold)] = response
+        artifact = self.collect("--resume")
+
+        self.assertEqual(self.server.counts, {200: 1})
+        self.assertEqual(len(artifact["tiers"]), len(collector.TIERS))
+        self.assertEqual(artifact["source"], collector.api_url(self.server.api_base))
+
+    def test_streamed_staging_matches_the_batch_build(self):
+        self.collect("--concurrency", "4", "--no-cache")
+        payloads = []
+        for tier_key, tier_label in collector.TIERS:
+            url = collector.tier_url(tier_key, collector.DEFAULT_DIMENSION)
+            _, body = self.server.responses[fixtures.fixture_key(url)]
+            payloads.append((tier_key, tier_label, json.loads(body)))
+        batch_path = self.directory / "batch.sqlite3"
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(batch_path, payloads, 7)
+
+        def rows(db_path):
+            with contextlib.closing(sqlite3.connect(db_path)) as conn:
+                return {
+                    table: conn.execute(
+                        f"SELECT * FROM {table} ORDER BY {order}"
+                    ).fetchall()
+                    for table, order in (
+                        ("collection_meta", "dimension_key"),
+                        ("tier_snapshots", "tier_key"),
+                        ("character_stats", "tier_key, character_id"),
+                        ("weapon_stats", "tier_key, character_id, weapon_id"),
+                    )
+                }
+
+        streamed, batch = rows(self.directory / "stats.sqlite3"), rows(batch_path)
+        for tables in (streamed, batch):
+            # Everything but the source URL and the collection time.
+            tables["collection_meta"] = [
+                row[:1] + row[3:] for row in tables["collection_meta"]
+            ]
+        self.assertEqual(streamed, batch)
+        self.assertTrue(batch["weapon_stats"])
+
+    def test_keeps_every_output_when_all_answers_are_304(self):
+        published = self.collect()
+        outputs = [
+            self.directory / name
+            for name in ("stats.sqlite3", "stats.json.gz", "stats.manifest.json")
+        ]
+        before = [path.stat().st_mtime_ns for path in outputs]
+
+        args = self.args()
+        self.server.counts.clear()
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            written = collector.collect(args, collector.NULL_METRICS)
+
+        self.assertFalse(written)
+        self.assertEqual(self.server.counts, {304: len(collector.TIERS) + 1})
+        self.assertIn("responses are unchanged", stdout.getvalue())
+        self.assertEqual([path.stat().st_mtime_ns for path in outputs], before)
+
+        # Once one tier changes, the tiers that answered 304 are replayed from
+        # the cache.
+        gold = fixtures.fixture_key(
+            collector.tier_url("gold", collector.DEFAULT_DIMENSION)
+        )
+        headers, body = self.server.responses[gold]
+        payload = json.loads(body)
+        payload["meta"]["updatedAt"] += 1000
+        self.server.responses[gold] = (
+            dict(headers, ETag='"next"'),
+            json.dumps(payload).encode("utf-8"),
+        )
+
+        artifact = self.collect()
+
+        self.assertEqual(self.server.counts, {200: 1, 304: len(collector.TIERS)})
+        self.assertEqual(
+            artifact["tiers"]["gold"]["updatedAt"],
+            published["tiers"]["gold"]["updatedAt"] + 1000,
+        )
+        self.assertEqual(
+            {key: tier for key, tier in artifact["tiers"].items() if key != "gold"},
+            {key: tier for key, tier in published["tiers"].items() if key != "gold"},
+        )
+
+    def test_rewrites_only_the_shard_of_the_changed_tier(self):
+        shard_dir = self.directory / "shards"
+        self.collect("--shard-dir", str(shard_dir))
+        for path in shard_dir.iterdir():
+            os.utime(path, ns=(0, 0))
+        meteorite = fixtures.fixture_key(
+            collector.tier_url("meteorite_plus", collector.DEFAULT_DIMENSION)
+        )
+        headers, body = self.server.responses[meteorite]
+        payload = json.loads(body)
+        payload["meta"]["updatedAt"] += 1000
+        self.server.responses[meteorite] = (
+            dict(headers, ETag='"next"'),
+            json.dumps(payload).encode("utf-8"),
+        )
+
+        # As the daemon refreshes: only the due tier is probed.
+        reuse = {(None, None)} | {
+            (collector.DEFAULT_DIMENSION, tier_key)
+            for tier_key, _ in collector.TIERS
+            if tier_key != "meteorite_plus"
+        }
+        args = self.args("--shard-dir", str(shard_dir))
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            collector.collect(args, collector.NULL_METRICS, reuse)
+
+        written = [path.name for path in shard_dir.iterdir() if path.stat().st_mtime_ns]
+        self.assertEqual(
+            sorted(written),
+            [collector.SHARD_INDEX_NAME, collector.tier_shard_name("meteorite_plus")],
+        )
+        self.assertIn("10 tiers, 1 written", stdout.getvalue())
+        self.assertEqual(
+            collector.read_artifact(self.directory / "stats.json.gz")["tiers"][
+                "meteorite_plus"
+            ]["updatedAt"],
+            payload["meta"]["updatedAt"],
+        )
+
+    def test_publishes_the_spool_when_the_breaker_opens(self):
+        published = self.collect()
+        self.server.error_rate = 1.0
+
+        artifact = self.collect("--no-cache", "--breaker-threshold", "2")
+
+        self.assertEqual(self.server.counts, {503: 2})
+        self.assertEqual(artifact["tiers"], published["tiers"])
+
+    def test_daemon_probes_and_refreshes_changed_tiers(self):
+        gold = fixtures.fixture_key(
+            collector.tier_url("gold", collector.DEFAULT_DIMENSION)
+        )
+        headers, body = self.server.responses[gold]
+        # ``updatedAt`` is in epoch milliseconds and the clock in seconds.
+        updated_at = json.loads(body)["meta"]["updatedAt"]
+        now = [updated_at / 1000 + 600.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+            if len(self.server.counts) == 1 and 200 in self.server.counts:
+                # Publish the next gold snapshot after the first refresh.
+                payload = json.loads(body)
+                payload["meta"]["updatedAt"] = updated_at + 3_600_000
+                self.server.responses[gold] = (
+                    dict(headers, ETag='"next"'),
+                    json.dumps(payload).encode("utf-8"),
+                )
+
+        args = self.args("--probe-interval", "900")
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.daemon(args, cycles=2, clock=lambda: now[0], sleep=sleep)
+
+        self.assertEqual(self.server.counts, {200: len(collector.TIERS) + 2, 304: 10})
+        state = json.loads((self.directory / "schedule.json").read_text())
+        tiers = state["tiers"]
+        self.assertEqual(
+            tiers["rank_squad_7d/gold"]["updates"],
+            [updated_at, updated_at + 3_600_000],
+        )
+        self.assertEqual(
+            tiers["rank_squad_7d/gold"]["nextProbe"], updated_at / 1000 + 7200
+        )
+        self.assertEqual(tiers["rank_squad_7d/iron"]["nextProbe"], now[0] + 900)
+        db_path = self.directory / "stats.sqlite3"
+        with contextlib.closing(sqlite3.connect(db_path)) as conn:
+            self.assertEqual(
+                conn.execute(
+                    "SELECT source_updated_at FROM tier_snapshots"
+                    " WHERE tier_key = 'gold'"
+                ).fetchone(),
+                (updated_at + 3_600_000,),
+            )
+
+        schedule = collector.PollSchedule(self.directory / "schedule.json", 900, 21600)
+        self.assertEqual(schedule.cadence("rank_squad_7d/gold"), 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import contextlib
+import io
+import sqlite3
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import bench_dakgg_collector as bench  # noqa: E402
+import collect_dakgg_stats as collector  # noqa: E402
+from dakgg_stats_store import DakggStatsStore  # noqa: E402
+
+TIERS = collector.TIERS[:3]
+
+
+class DakggStatsStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = Path(directory.name) / "stats.sqlite3"
+        self.build(seed=1)
+        self.store = DakggStatsStore(self.db_path)
+        self.addCleanup(self.store.close)
+
+    def build(self, seed, updated_at=1_700_000_000_000):
+        payloads = []
+        for tier_key, tier_label in TIERS:
+            payload = bench.synthetic_payload(tier_key, 6, 3, seed=seed)
+            payload["meta"]["updatedAt"] = updated_at
+            payloads.append((tier_key, tier_label, payload))
+        with contextlib.redirect_stdout(io.StringIO()):
+            collector.build_database(self.db_path, payloads, 7)
+
+    def artifact_tier(self, tier_key):
+        return collector.release_artifact(self.db_path, {})["tiers"][tier_key]
+
+    def test_looks_up_characters_and_weapons(self):
+        tier_key = TIERS[1][0]
+        stats = self.store.character(tier_key, 2)
+        expected = self.artifact_tier(tier_key)["characters"]["2"]
+
+        self.assertEqual(
+            (stats.tier_key, stats.character_id, stats.game_count),
+            (tier_key, 2, expected["games"]),
+        )
+        self.assertAlmostEqual(stats.win_rate, expected["winRate"], places=7)
+        self.assertIsNone(self.store.character(tier_key, 999))
+
+        weapons = self.store.weapons(tier_key, 2)
+        self.assertEqual(len(weapons), 3)
+        self.assertEqual(sum(weapon.game_count for weapon in weapons), stats.game_count)
+        self.assertEqual(
+            [weapon.game_count for weapon in weapons],
+            sorted((weapon.game_count for weapon in weapons), reverse=True),
+        )
+        self.assertEqual(
+            [tier.tier_key for tier in self.store.tiers()], [key for key, _ in TIERS]
+        )
+
+    def test_ranks_by_a_metric(self):
+        tier_key = TIERS[0][0]
+        characters = self.artifact_tier(tier_key)["characters"]
+        expected = sorted(
+            characters, key=lambda key: (-characters[key]["winRate"], int(key))
+        )[:3]
+
+        top = self.store.top_characters(tier_key, "win_rate", limit=3)
+        self.assertEqual([str(stats.character_id) for stats in top], expected)
+
+        lowest = self.store.top_weapons(
+            tier_key, "average_placement", limit=2, ascending=True
+        )
+        self.assertLessEqual(lowest[0].average_placement, lowest[1].average_placement)
+        with self.assertRaises(ValueError):
+            self.store.top_characters(tier_key, "win_rate; DROP TABLE x")
+
+    def test_compares_tiers_from_the_covering_index(self):
+        comparison = self.store.compare_tiers(3)
+
+        self.assertEqual(list(comparison), [key for key, _ in TIERS])
+        for tier_key, values in comparison.items():
+            self.assertEqual(
+                values["game_count"],
+                self.artifact_tier(tier_key)["characters"]["3"]["games"],
+            )
+        weapon = self.store.compare_tiers(3, weapon_id=101)
+        self.assertEqual(set(weapon), set(comparison))
+
+        with sqlite3.connect(self.db_path) as conn:
+            for sql in (
+                "SELECT tier_key, game_count, win_rate FROM character_stats"
+                " WHERE character_id = 3 AND dimension_key = 'rank_squad_7d'",
+                "SELECT tier_key, win_rate FROM weapon_stats WHERE character_id = 3"
+                " AND weapon_id = 101 AND dimension_key = 'rank_squad_7d'",
+            ):
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                self.assertIn("COVERING INDEX", " ".join(row[-1] for row in plan))
+
+    def test_caches_until_the_collection_changes(self):
+        first = self.store.character(TIERS[0][0], 1)
+        self.assertIs(self.store.character(TIERS[0][0], 1), first)
+        self.assertEqual(self.store.cache_info().hits, 1)
+
+        self.build(seed=2, updated_at=1_700_000_100_000)
+
+        changed = self.store.character(TIERS[0][0], 1)
+        self.assertNotEqual(changed, first)
+        self.assertEqual(
+            changed.game_count,
+            self.artifact_tier(TIERS[0][0])["characters"]["1"]["games"],
+        )
+
+    def test_shares_the_store_across_threads(self):
+        def lookups(index):
+            tier_key = TIERS[index % len(TIERS)][0]
+            return [
+                self.store.character(tier_key, character_id).game_count
+                for character_id in range(1, 7)
+            ]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lookups, range(64)))
+
+        for index, result in enumerate(results):
+            self.assertEqual(result, results[index % len(TIERS)])
+
+    def test_connections_are_read_only(self):
+        self.store.dimensions()
+        conn = self.store._connection()
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM character_stats")
+
+
+if __name__ == "__main__":
+    unittest.main()